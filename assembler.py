@@ -1,3 +1,10 @@
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+
+import peripherals
+
 SYMTAB = {}  # Symbol Table
 
 OPTAB = {
@@ -8,7 +15,7 @@ OPTAB = {
 
     # Format II Instructions
     "RRC": 0x1000,  "SWPB": 0x1080, "RRA": 0x1100,  "SXT": 0x1180,
-    "PUSH": 0x1200, "CALL": 0x1280, "RET": 0x1300,
+    "PUSH": 0x1200, "CALL": 0x1280, "RETI": 0x1300,
 
     # Format III Instructions
     "JNE": 0x2000,  "JEQ": 0x2400,  "JNC": 0x2800,  "JC": 0x2C00,
@@ -19,7 +26,27 @@ OPTAB = {
 }
 
 REGISTERS = {f"R{i}": i for i in range(16)}
+REGISTERS["PC"] = 0  # Program Counter = R0
 REGISTERS["SP"] = 1  # Stack Pointer = R1
+REGISTERS["SR"] = 2  # Status Register = R2
+
+# Emulated instructions --> (instruction, source, destination); {op} is the
+# operand of the emulated instruction. The disassembler reads this table the
+# other way round to name the instructions it decodes.
+EMULATED = {
+    "ADC": ("ADDC", "#0", "{op}"),   "DADC": ("DADD", "#0", "{op}"),
+    "DEC": ("SUB", "#1", "{op}"),    "DECD": ("SUB", "#2", "{op}"),
+    "INC": ("ADD", "#1", "{op}"),    "INCD": ("ADD", "#2", "{op}"),
+    "SBC": ("SUBC", "#0", "{op}"),   "INV": ("XOR", "#-1", "{op}"),
+    "RLA": ("ADD", "{op}", "{op}"),  "RLC": ("ADDC", "{op}", "{op}"),
+    "CLR": ("MOV", "#0", "{op}"),    "TST": ("CMP", "#0", "{op}"),
+    "POP": ("MOV", "@SP+", "{op}"),  "BR": ("MOV", "{op}", "PC"),
+    "RET": ("MOV", "@SP+", "PC"),    "NOP": ("MOV", "#0", "R3"),
+    "CLRC": ("BIC", "#1", "SR"),     "SETC": ("BIS", "#1", "SR"),
+    "CLRZ": ("BIC", "#2", "SR"),     "SETZ": ("BIS", "#2", "SR"),
+    "CLRN": ("BIC", "#4", "SR"),     "SETN": ("BIS", "#4", "SR"),
+    "DINT": ("BIC", "#8", "SR"),     "EINT": ("BIS", "#8", "SR"),
+}
 
 ADDRESSING_MODES = {
     "REGISTER": 0,      # Rn  --> As=00, ad=0
@@ -30,16 +57,120 @@ ADDRESSING_MODES = {
     "INDIRECT_INC": 3,  # @Rn+   --> As=11
     "IMMEDIATE": 3      # #N     --> As=11
 }
+EXTENSION_MODES = ["INDEXED", "SYMBOLIC", "ABSOLUTE", "IMMEDIATE"]  # operand in the next word
+
+# #N of these values comes from the constant generators, without an extension word: value --> (register, As)
+CONSTANTS = {0: (3, 0), 1: (3, 1), 2: (3, 2), 0xFFFF: (3, 3), 4: (2, 2), 8: (2, 3)}
+
+# Cycle counts (MSP430x1xx family user's guide, chapter 3.4.4)
+FORMAT_I_CYCLES = {     # source mode --> (destination Rm, destination memory)
+    "REGISTER": (1, 4),
+    "INDIRECT": (2, 5),
+    "INDIRECT_INC": (2, 5),
+    "IMMEDIATE": (2, 5),
+    "CONSTANT": (1, 4),  # constant generator, like a register
+    "INDEXED": (3, 6),
+    "SYMBOLIC": (3, 6),
+    "ABSOLUTE": (3, 6)
+}
+FORMAT_II_CYCLES = {    # operand mode --> (RRA/RRC/SWPB/SXT, PUSH, CALL)
+    "REGISTER": (1, 3, 4),
+    "INDIRECT": (3, 4, 4),
+    "INDIRECT_INC": (3, 5, 5),
+    "IMMEDIATE": (None, 4, 5),
+    "CONSTANT": (None, 3, 4),
+    "INDEXED": (4, 5, 5),
+    "SYMBOLIC": (4, 5, 5),
+    "ABSOLUTE": (4, 5, 5)
+}
+JUMP_CYCLES = 2
+
+PERIPHERALS = None  # register names of the target device, see load_peripherals()
 
 LOCCTR = 0
 starting_address = 0
 program_length = 0
 intermediate_file = []
 object_code = []
+object_info = []  # (source line, cycles) of each entry in object_code
+source_map = None  # SourceMap of the last pass2
 errors = []
+error_lines = []  # source line of each entry in errors (None if unknown)
 
-def log_error(message):
+def log_error(message, line_no=None):
     errors.append(message)
+    error_lines.append(line_no)
+
+def reset():
+    global LOCCTR, starting_address, program_length, source_map
+    SYMTAB.clear()
+    intermediate_file.clear()
+    object_code.clear()
+    object_info.clear()
+    errors.clear()
+    error_lines.clear()
+    LOCCTR = 0
+    starting_address = 0
+    program_length = 0
+    source_map = None
+
+def load_peripherals(filename):
+    """Use the register names of a device definition file (C header or linker .cmd) in &NAME operands."""
+    global PERIPHERALS
+    PERIPHERALS = peripherals.load(filename)
+
+def symbol_value(name, line_no):
+    """Value of a label or peripheral register name, otherwise of a hex number."""
+    if name in SYMTAB:
+        return SYMTAB[name]
+    if PERIPHERALS is not None:
+        address = PERIPHERALS.address_of(name)
+        if address is not None:
+            return address
+    try:
+        return int(name, 16) & 0xFFFF
+    except ValueError:
+        log_error(f"Undefined symbol: '{name}'", line_no)
+        return 0
+
+def constant_value(val):
+    """Value of a #N operand that is a number the constant generators make, else None.
+    Only numbers that start with a digit or a sign qualify, so labels never do and
+    pass1 knows the size without the symbol table."""
+    if not val or val[0] not in "0123456789+-":
+        return None
+    try:
+        value = int(val, 16) & 0xFFFF
+    except ValueError:
+        return None
+    return value if value in CONSTANTS else None
+
+def source_as(mode, val):
+    """As field of a source operand"""
+    if mode == "CONSTANT":
+        return CONSTANTS[constant_value(val)][1]
+    return ADDRESSING_MODES[mode]
+
+def encode_operand(mode, val, ext_loc, line_no):
+    """(register field, extension word or None) of an operand; ext_loc is
+    the address its extension word goes to (symbolic operands are PC relative)."""
+    if mode == "CONSTANT":
+        return CONSTANTS[constant_value(val)][0], None  # R3 or R2, As selects the value
+    if mode == "IMMEDIATE":
+        return REGISTERS["PC"], symbol_value(val, line_no)  # #N is @PC+
+    if mode == "ABSOLUTE":
+        return REGISTERS["SR"], symbol_value(val, line_no)  # &ADDR is ADDR(SR), SR reads as 0 here
+    if mode == "SYMBOLIC":
+        return REGISTERS["PC"], (symbol_value(val, line_no) - ext_loc) & 0xFFFF
+    if mode == "INDEXED":
+        index, reg = val.split("(", 1)
+        val = reg.rstrip(")").strip()
+    if val not in REGISTERS:
+        log_error(f"Invalid register: '{val}'", line_no)
+        return 0, None if mode != "INDEXED" else 0
+    if mode == "INDEXED":
+        return REGISTERS[val], symbol_value(index.strip(), line_no)
+    return REGISTERS[val], None
 
 def parse_operand(operand):
     if operand and "," in operand:
@@ -52,6 +183,8 @@ def get_addressing_mode(operand):
         return None, None
         
     if operand.startswith("#"):
+        if constant_value(operand[1:]) is not None:
+            return "CONSTANT", operand[1:]
         return "IMMEDIATE", operand[1:]
     elif operand.startswith("&"):
         return "ABSOLUTE", operand[1:]
@@ -66,27 +199,59 @@ def get_addressing_mode(operand):
     else:
         return "SYMBOLIC", operand
 
-def pass1(assembly_code):
+@lru_cache(maxsize=65536)
+def parse_line(line):
+    """Split a source line into (label, opcode, operand, size); cached, so lines
+    that did not change are not split again. pass1 and pass2 still run in full."""
+    line = line.split(";")[0].strip()
+    parts = line.split()
+    if not parts:
+        return None
+
+    label = parts[0].strip(":") if parts[0].endswith(":") else None
+    opcode = parts[1] if label and len(parts) > 1 else parts[0]
+    operand = " ".join(parts[2:]) if label and len(parts) > 2 else (
+             " ".join(parts[1:]) if not label and len(parts) > 1 else None)
+
+    if opcode in EMULATED:
+        opcode, src, dst = EMULATED[opcode]
+        operand = f"{src}, {dst}".format(op=operand or "")
+
+    size = 0
+    if opcode in OPTAB:
+        if opcode in ["MOV", "ADD", "ADDC", "SUB", "SUBC", "CMP", "AND", "XOR", "BIC", "BIS", "BIT", "DADD"]:
+            src, dst = parse_operand(operand)
+            src_mode, _ = get_addressing_mode(src) if src else (None, None)
+            dst_mode, _ = get_addressing_mode(dst) if dst else (None, None)
+            
+            extra = 0
+            if src_mode in EXTENSION_MODES:
+                extra += 2
+            if dst_mode in EXTENSION_MODES:
+                extra += 2
+            size = 2 + extra  # 1 word for instruction + extra words for operands
+
+        elif opcode in ["RRC", "SWPB", "RRA", "SXT", "PUSH", "CALL"]:
+            size = 4 if get_addressing_mode(operand)[0] in EXTENSION_MODES else 2
+        else:
+            size = 2  # RETI, Format III instructions
+    return label, opcode, operand, size
+
+def pass1(assembly_code, progress=None):
     global LOCCTR, starting_address, program_length
     lines = assembly_code.splitlines()
     
-    for line in lines:
-        line = line.split(";")[0].strip()
-        if not line:
-            continue
-
-        parts = line.split()
-        if not parts:
+    for line_no, line in enumerate(lines, 1):
+        if progress:
+            progress(line_no, len(lines))  # lines processed so far
+        parsed = parse_line(line)
+        if not parsed:
             continue
-
-        label = parts[0].strip(":") if parts[0].endswith(":") else None
-        opcode = parts[1] if label and len(parts) > 1 else parts[0]
-        operand = " ".join(parts[2:]) if label and len(parts) > 2 else (
-                 " ".join(parts[1:]) if not label and len(parts) > 1 else None)
+        label, opcode, operand, size = parsed
 
         if label:
             if label in SYMTAB:
-                log_error(f"Duplicate symbol: '{label}'")
+                log_error(f"Duplicate symbol: '{label}'", line_no)
                 continue
             SYMTAB[label] = LOCCTR
 
@@ -98,29 +263,80 @@ def pass1(assembly_code):
             program_length = LOCCTR - starting_address
             break
 
-        if opcode in OPTAB:
-            if opcode in ["MOV", "ADD", "SUB", "CMP", "AND", "XOR", "BIC", "BIS", "BIT", "DADD"]:
-                src, dst = parse_operand(operand)
-                src_mode, _ = get_addressing_mode(src) if src else (None, None)
-                dst_mode, _ = get_addressing_mode(dst) if dst else (None, None)
-                
-                extra = 0
-                if src_mode in ["IMMEDIATE", "ABSOLUTE"]:
-                    extra += 2
-                if dst_mode in ["IMMEDIATE", "ABSOLUTE"]:
-                    extra += 2
-                LOCCTR += 2 + extra  # 1 word for instruction + extra words for operands
+        intermediate_file.append((label, opcode, operand, LOCCTR, line_no))  # address of the instruction
 
-            else:
-                LOCCTR += 2  # Format II/III instructions
+        if opcode in OPTAB:
+            LOCCTR += size
         elif opcode:
-            log_error(f"Unknown instruction: '{opcode}'")
-
-        intermediate_file.append((label, opcode, operand, LOCCTR))
-
-def pass2():
-    global object_code
-    for label, opcode, operand, loc in intermediate_file:
+            log_error(f"Unknown instruction: '{opcode}'", line_no)
+
+def instruction_cycles(opcode, src_mode, dst_mode=None, dst_val=None):
+    if opcode in ["JMP", "JNE", "JEQ", "JNC", "JC", "JN", "JGE", "JL"]:
+        return JUMP_CYCLES
+    if opcode in ["RRC", "SWPB", "RRA", "SXT", "PUSH", "CALL"]:
+        if src_mode not in FORMAT_II_CYCLES:
+            return None
+        rotate, push, call = FORMAT_II_CYCLES[src_mode]
+        return push if opcode == "PUSH" else call if opcode == "CALL" else rotate
+    if src_mode not in FORMAT_I_CYCLES:
+        return None
+    cycles = FORMAT_I_CYCLES[src_mode][0 if dst_mode == "REGISTER" else 1]
+    if dst_mode == "REGISTER" and REGISTERS.get(dst_val) == 0 and src_mode in ["REGISTER", "CONSTANT", "INDIRECT_INC", "IMMEDIATE"]:
+        cycles += 1  # writing the PC costs one more cycle
+    return cycles
+
+class SourceMap:
+    """Source line <-> address index of the object code, both lookups via bisect.
+
+    Words are kept sorted by address (address -> source line) and lines
+    sorted by number with their address range and their index range in
+    object_code (source line -> words)."""
+    def __init__(self, object_code, object_info):
+        by_address = sorted((loc, line_no) for (loc, code), (line_no, cycles) in zip(object_code, object_info))
+        self.addresses = array("L", [loc for loc, line_no in by_address])
+        self.address_lines = array("L", [line_no for loc, line_no in by_address])
+
+        ranges = {}  # line --> [first address, end address, first index, end index]
+        for index, ((loc, code), (line_no, cycles)) in enumerate(zip(object_code, object_info)):
+            if line_no not in ranges:
+                ranges[line_no] = [loc, loc + 2, index, index + 1]
+            else:
+                entry = ranges[line_no]
+                entry[0] = min(entry[0], loc)
+                entry[1] = max(entry[1], loc + 2)
+                entry[3] = index + 1
+        self.lines = array("L", sorted(ranges))
+        self.line_ranges = [tuple(ranges[line_no]) for line_no in self.lines]
+
+    def line_for_address(self, address):
+        i = bisect_right(self.addresses, address) - 1
+        if i >= 0 and address < self.addresses[i] + 2:
+            return self.address_lines[i]
+        return None
+
+    def address_range(self, line_no):
+        """(first address, end address) of the words generated by a line"""
+        i = bisect_left(self.lines, line_no)
+        if i < len(self.lines) and self.lines[i] == line_no:
+            return self.line_ranges[i][:2]
+        return None
+
+    def word_indices(self, line_no):
+        """range of object_code indices generated by a line"""
+        i = bisect_left(self.lines, line_no)
+        if i < len(self.lines) and self.lines[i] == line_no:
+            return range(*self.line_ranges[i][2:])
+        return range(0)
+
+def emit_word(loc, word, line_no, cycles=None):
+    object_code.append((loc, word))
+    object_info.append((line_no, cycles))
+
+def pass2(progress=None):
+    global object_code, source_map
+    for index, (label, opcode, operand, loc, line_no) in enumerate(intermediate_file, 1):
+        if progress:
+            progress(index, len(intermediate_file))
         if opcode in ["START", "END"]:
             continue
 
@@ -128,33 +344,21 @@ def pass2():
         if not instruction:
             continue
 
-        if opcode in ["MOV", "ADD", "SUB", "CMP", "AND", "XOR", "BIC", "BIS", "BIT", "DADD"]:
+        if opcode in ["MOV", "ADD", "ADDC", "SUB", "SUBC", "CMP", "AND", "XOR", "BIC", "BIS", "BIT", "DADD"]:
             src, dst = parse_operand(operand)
             src_mode, src_val = get_addressing_mode(src)
             dst_mode, dst_val = get_addressing_mode(dst)
 
-            # Handle source operand
-            if src_val in REGISTERS:
-                src_reg = REGISTERS[src_val]
-            elif src_val in SYMTAB:
-                src_reg = SYMTAB[src_val]
-            else:
-                log_error(f"Undefined symbol in source operand: '{src_val}'")
-                src_reg = 0
-            if src_mode == "INDIRECT_INC":
-                src_reg |= 0x10  # Set auto-increment bit
-
-            # Handle destination operand
-            if dst_val in REGISTERS:
-                dst_reg = REGISTERS[dst_val]
-            elif dst_val in SYMTAB:
-                dst_reg = SYMTAB[dst_val]
+            # Operands; their extension words follow the instruction word in this order
+            ext_loc = loc + 2
+            src_reg, src_word = encode_operand(src_mode, src_val, ext_loc, line_no)
+            if src_word is not None:
+                ext_loc += 2
+            if dst_mode not in ["REGISTER", "INDEXED", "SYMBOLIC", "ABSOLUTE"]:
+                log_error(f"Invalid destination operand: '{dst}'", line_no)
+                dst_reg, dst_word = 0, None
             else:
-                log_error(f"Undefined symbol in destination operand: '{dst_val}'")
-                dst_reg = 0
-            if dst_mode == "INDIRECT_INC":
-                dst_reg |= 0x10  # Set auto-increment bit
-
+                dst_reg, dst_word = encode_operand(dst_mode, dst_val, ext_loc, line_no)
 
             # Build instruction word according to MSP430 format:
             # opcode (4 bits), S-Reg (4 bits), Ad (1 bit), B/W (1 bit), As (2 bits), D-Reg (4 bits)
@@ -162,7 +366,7 @@ def pass2():
             s_reg = src_reg                            # Source register becomes S-Reg
             ad = 0 if dst_mode == "REGISTER" else 1      # Destination addressing: 0 for REGISTER, 1 otherwise
             b_w = 0                                    # Default B/W = 0 (word operation)
-            as_field = ADDRESSING_MODES[src_mode]       # Source addressing mode (As), already in 2-bit range per new mapping
+            as_field = source_as(src_mode, src_val)     # Source addressing mode (As), the constant for constant generators
             d_reg = dst_reg                            # Destination register becomes D-Reg
 
             instruction_word = (
@@ -173,22 +377,35 @@ def pass2():
                 ((as_field & 0x3) << 4) |
                 (d_reg & 0xF)
             )
-            object_code.append((loc, instruction_word))
+            emit_word(loc, instruction_word, line_no, instruction_cycles(opcode, src_mode, dst_mode, dst_val))
 
-            # Handle additional words for immediate/absolute
-            if src_mode in ["IMMEDIATE", "ABSOLUTE"]:
-                object_code.append((loc + 2, int(src_val, 16)))
-            if dst_mode in ["IMMEDIATE", "ABSOLUTE"]:
-                object_code.append((loc + 2, int(dst_val, 16)))
+            # Additional words for indexed/symbolic/absolute/immediate operands
+            if src_word is not None:
+                emit_word(loc + 2, src_word, line_no)
+            if dst_word is not None:
+                emit_word(ext_loc, dst_word, line_no)
 
         elif opcode in ["RRC", "SWPB", "RRA", "SXT", "PUSH", "CALL"]:
-            object_code.append((loc, instruction))
+            # Single operand: As (2 bits) and register (4 bits) below the opcode
+            mode, val = get_addressing_mode(operand)
+            if mode is None:
+                log_error(f"Missing operand: '{opcode}'", line_no)
+                continue
+            reg, word = encode_operand(mode, val, loc + 2, line_no)
+            emit_word(loc, instruction | (source_as(mode, val) << 4) | reg, line_no, instruction_cycles(opcode, mode))
+            if word is not None:
+                emit_word(loc + 2, word, line_no)
+
+        elif opcode == "RETI":
+            emit_word(loc, instruction, line_no, 5)
 
         elif opcode in ["JMP", "JNE", "JEQ", "JNC", "JC", "JN", "JGE", "JL"]:
             target_addr = SYMTAB.get(operand, 0)
             offset = (target_addr - (loc + 2)) // 2
             instruction_word = instruction | (offset & 0x3FF)
-            object_code.append((loc, instruction_word))
+            emit_word(loc, instruction_word, line_no, JUMP_CYCLES)
+
+    source_map = SourceMap(object_code, object_info)
 
 def save_object_code(filename="output.hex"):
     with open(filename, "w") as f:
@@ -197,6 +414,8 @@ def save_object_code(filename="output.hex"):
     print(f"Machine code saved to {filename}")
 
 def main():
+    if len(sys.argv) > 1:
+        load_peripherals(sys.argv[1])  # optional device definition file
     print("Enter assembly code (type 'END' to finish):")
     assembly_code = ""
     while True:
@@ -0,0 +1,387 @@
+"""\
+Lockstep batch simulation: one firmware image run on many inputs at once,
+with the CPU state of N instances held in numpy arrays.
+
+Each step executes the instruction at the lowest PC of the running
+instances, for all instances at that PC. Diverging branches so run as
+masked groups, which join again where their paths meet. Memory is split in
+256 byte pages: instances share the pages of the image and get a private
+copy of a page on their first write to it.
+
+Code is decoded once from the image; stores to it are not supported and
+raise a SimulatorError, at the store or, for code not decoded yet, when
+the changed code is reached.
+Instances start from the reset state or from a simulator.Snapshot, e.g.
+one taken after the init code.
+"""
+
+from simulator import (
+    PC, SP, SR, CG, C, Z, N, V, CPUOFF, FLAGS, REG, CONST, ABS, INDEXED, AUTOINC,
+    BREAKPOINT, HALT, IDLE, LIMIT, JUMPS, PAGE_BITS, PAGE_SIZE, PAGE_COUNT, Simulator, SimulatorError,
+    exec_format1, exec_format2, exec_jump,
+    op_mov, op_add, op_addc, op_sub, op_subc, op_cmp, op_dadd, op_bit, op_bic, op_bis, op_xor, op_and,
+    op_rrc, op_rra, op_swpb, op_sxt,
+)
+
+try:
+    import numpy
+except ImportError:     # batch simulation is optional
+    numpy = None
+
+# why an instance stopped, indexes of REASONS; RUNNING has not stopped
+ERROR = 'error'                         # illegal instruction
+REASONS = (None, BREAKPOINT, HALT, IDLE, LIMIT, ERROR)
+RUNNING, STOP_BREAKPOINT, STOP_HALT, STOP_IDLE, STOP_LIMIT, STOP_ERROR = range(len(REASONS))
+
+
+# the operations of the simulator on arrays of instances
+def _add(s, d, carry, mask, sr):
+    r = s + d + carry
+    sign = (mask + 1) >> 1
+    flags = (r > mask) * C
+    r = r & mask
+    flags = flags | (r == 0) * Z | ((r & sign) != 0) * N | (((s ^ r) & (d ^ r) & sign) != 0) * V
+    return r, (sr & ~FLAGS) | flags
+
+
+def _logic(r, mask, sr, overflow=0):
+    flags = numpy.where(r != 0, C, Z) | overflow | ((r & ((mask + 1) >> 1)) != 0) * N
+    return r, (sr & ~FLAGS) | flags
+
+
+def _dadd(s, d, mask, sr):
+    carry = sr & C
+    r = 0
+    for shift in range(0, 16 if mask == 0xffff else 8, 4):
+        digit = ((s >> shift) & 0xf) + ((d >> shift) & 0xf) + carry
+        carry = digit > 9
+        r = r | (numpy.where(carry, digit - 10, digit) & 0xf) << shift
+    flags = carry * C | (r == 0) * Z | ((r & ((mask + 1) >> 1)) != 0) * N
+    return r, (sr & ~(C | Z | N)) | flags
+
+
+def _shift(r, v, mask, sr):
+    flags = (v & 1) | (r == 0) * Z | ((r & ((mask + 1) >> 1)) != 0) * N
+    return r, (sr & ~FLAGS) | flags
+
+
+FORMAT_I = {
+    op_mov: lambda s, d, mask, sr: (s, sr),
+    op_add: lambda s, d, mask, sr: _add(s, d, 0, mask, sr),
+    op_addc: lambda s, d, mask, sr: _add(s, d, sr & C, mask, sr),
+    op_sub: lambda s, d, mask, sr: _add(~s & mask, d, 1, mask, sr),
+    op_subc: lambda s, d, mask, sr: _add(~s & mask, d, sr & C, mask, sr),
+    op_cmp: lambda s, d, mask, sr: (None, _add(~s & mask, d, 1, mask, sr)[1]),
+    op_dadd: _dadd,
+    op_bit: lambda s, d, mask, sr: (None, _logic(s & d, mask, sr)[1]),
+    op_bic: lambda s, d, mask, sr: (d & ~s & mask, sr),
+    op_bis: lambda s, d, mask, sr: (d | s, sr),
+    op_xor: lambda s, d, mask, sr: _logic(s ^ d, mask, sr, ((s & d & ((mask + 1) >> 1)) != 0) * V),
+    op_and: lambda s, d, mask, sr: _logic(s & d, mask, sr),
+}
+
+FORMAT_II = {
+    op_rrc: lambda v, mask, sr: _shift((v >> 1) | (sr & C) * ((mask + 1) >> 1), v, mask, sr),
+    op_rra: lambda v, mask, sr: _shift((v >> 1) | (v & ((mask + 1) >> 1)), v, mask, sr),
+    op_swpb: lambda v, mask, sr: (((v << 8) | (v >> 8)) & 0xffff, sr),
+    op_sxt: lambda v, mask, sr: _logic(numpy.where(v & 0x80, (v & 0xff) | 0xff00, v & 0xff), 0xffff, sr),
+}
+
+JUMP_CONDITIONS = {
+    JUMPS[0][1]: lambda sr: sr & Z == 0,
+    JUMPS[1][1]: lambda sr: sr & Z != 0,
+    JUMPS[2][1]: lambda sr: sr & C == 0,
+    JUMPS[3][1]: lambda sr: sr & C != 0,
+    JUMPS[4][1]: lambda sr: sr & N != 0,
+    JUMPS[5][1]: lambda sr: (sr & N != 0) == (sr & V != 0),
+    JUMPS[6][1]: lambda sr: (sr & N != 0) != (sr & V != 0),
+}
+
+
+def writes_sr(insn):
+    """true for instructions that may set CPUOFF"""
+    if insn.execute is exec_format1:
+        return insn.dst[:2] == (REG, SR)
+    if insn.execute is exec_format2:
+        return insn.dst == 'RETI' or (insn.src[:2] == (REG, SR) and insn.op is not None)
+    return False
+
+
+class BatchSimulator(object):
+    """\
+    count instances of an MSP430 running the same image. regs[r] holds
+    register r of all instances, cycles and steps their counters and
+    reasons why they stopped (indexes of REASONS). Inputs are set in regs
+    or with write_word() before run() or call().
+    """
+    def __init__(self, image, count):
+        if numpy is None:
+            raise RuntimeError('batch simulation needs numpy')
+        self.decoder = Simulator(image)         # decodes the code and holds the initial state
+        self.count = count
+        self.all = numpy.arange(count)
+        self.code = numpy.frombuffer(self.decoder.code, dtype=numpy.uint8)
+        self.breakpoints = set()
+        self.reset()
+
+    def reset(self, pc=None):
+        """all instances back to the image and the reset state of Simulator.reset()"""
+        self.decoder.reset(pc)
+        self._from_decoder()
+
+    def restore(self, snapshot):
+        """all instances to the state of a simulator.Snapshot, e.g. one taken after the init code"""
+        self.decoder.restore(snapshot)
+        self._from_decoder()
+
+    def _from_decoder(self):
+        """all instances to the state of the decoder"""
+        self.regs = numpy.tile(numpy.array(self.decoder.regs, dtype=numpy.int64)[:, None], (1, self.count))
+        self.cycles = numpy.full(self.count, self.decoder.cycles, dtype=numpy.int64)
+        self.steps = numpy.full(self.count, self.decoder.steps, dtype=numpy.int64)
+        self.reasons = numpy.zeros(self.count, dtype=numpy.int8)
+        self.poll_pc = numpy.full(self.count, -1, dtype=numpy.int64)    # Simulator.last_poll, per instance
+        self.poll_cycles = numpy.zeros(self.count, dtype=numpy.int64)
+        self.pages = numpy.zeros((2 * PAGE_COUNT, PAGE_SIZE), dtype=numpy.uint8)
+        self.pages[:PAGE_COUNT] = numpy.frombuffer(self.decoder.memory, dtype=numpy.uint8).reshape(PAGE_COUNT, PAGE_SIZE)
+        self.words = self.pages.view('<u2')
+        self.page_used = PAGE_COUNT             # pool slots below PAGE_COUNT are the shared image pages
+        self.page_map = numpy.tile(numpy.arange(PAGE_COUNT, dtype=numpy.intp), (self.count, 1))
+        self.written = numpy.zeros(PAGE_COUNT, dtype=bool)  # pages some instance has a copy of
+
+    # memory
+    def _allocate(self, count):
+        """pool slots for count new pages"""
+        if self.page_used + count > len(self.pages):
+            pages = numpy.zeros((max(2 * len(self.pages), self.page_used + count), PAGE_SIZE), dtype=numpy.uint8)
+            pages[:self.page_used] = self.pages[:self.page_used]
+            self.pages = pages
+            self.words = pages.view('<u2')
+        self.page_used += count
+        return numpy.arange(self.page_used - count, self.page_used)
+
+    def load(self, idx, address, mask):
+        """the byte or word at address (a number or one per instance) of the instances idx"""
+        slots = self.page_map[idx, address >> PAGE_BITS]
+        if mask == 0xff:
+            return self.pages[slots, address & (PAGE_SIZE - 1)].astype(numpy.int64)
+        return self.words[slots, (address & (PAGE_SIZE - 1)) >> 1].astype(numpy.int64)
+
+    def store(self, idx, address, value, mask):
+        """store to the instances idx, copying the pages they share"""
+        if mask == 0xffff:
+            address = address & 0xfffe
+            in_code = self.code[address] | self.code[address + 1]
+        else:
+            in_code = self.code[address]
+        if numpy.any(in_code):
+            first = numpy.argmax(numpy.broadcast_to(in_code, idx.shape))
+            raise SimulatorError('store to code at 0x%04x, batch simulation does not support it' % (
+                    numpy.broadcast_to(address, idx.shape)[first],))
+        page = address >> PAGE_BITS
+        slots = self.page_map[idx, page]
+        shared = slots < PAGE_COUNT
+        if shared.any():
+            new = self._allocate(int(shared.sum()))
+            self.pages[new] = self.pages[slots[shared]]
+            self.page_map[idx[shared], page[shared] if numpy.ndim(page) else page] = new
+            self.written[page[shared] if numpy.ndim(page) else page] = True
+            slots[shared] = new
+        if mask == 0xff:
+            self.pages[slots, address & (PAGE_SIZE - 1)] = value & 0xff
+        else:
+            self.words[slots, (address & (PAGE_SIZE - 1)) >> 1] = value & 0xffff
+
+    def read_word(self, address):
+        """the word at address of every instance"""
+        return self.load(self.all, address & 0xfffe, 0xffff)
+
+    def write_word(self, address, values):
+        """write a word, or one per instance, at address of every instance"""
+        self.store(self.all, address, numpy.asarray(values, dtype=numpy.int64), 0xffff)
+
+    def memory_of(self, instance):
+        """the 64 KB memory of one instance"""
+        return self.pages[self.page_map[instance]].tobytes()
+
+    def check_code(self, idx, pc, insn):
+        """\
+        SimulatorError if one of the instances idx changed the words of insn
+        at pc, which were decoded from the image
+        """
+        for address in range(pc, pc + ((insn.next_pc - pc) & 0xffff), 2):
+            changed = self.load(idx, address & 0xffff, 0xffff) != self.decoder.read_word(address)
+            if changed.any():
+                raise SimulatorError('store to code at 0x%04x, batch simulation does not support it' % (
+                        address & 0xffff,))
+
+    def private_pages(self):
+        """number of pages copied on write"""
+        return self.page_used - PAGE_COUNT
+
+    # operands
+    def set_register(self, idx, reg, value, mask):
+        """like Simulator.set_register() for the instances idx"""
+        if reg == PC:
+            self.regs[PC, idx] = value & 0xfffe
+        elif reg == SP:
+            self.regs[SP, idx] = value & mask & 0xfffe
+        elif reg != CG:
+            self.regs[reg, idx] = value & mask
+
+    def operand_address(self, idx, operand, mask):
+        kind, reg, x = operand
+        if kind == ABS:
+            return x
+        if kind == INDEXED:
+            return (self.regs[reg, idx] + x) & 0xffff
+        address = self.regs[reg, idx]
+        if kind == AUTOINC:
+            self.regs[reg, idx] = (address + (1 if mask == 0xff and reg != SP else 2)) & 0xffff
+        return address
+
+    def read_operand(self, idx, operand, mask):
+        kind, reg, x = operand
+        if kind == REG:
+            return self.regs[reg, idx] & mask
+        if kind == CONST:
+            return x & mask
+        return self.load(idx, self.operand_address(idx, operand, mask), mask)
+
+    # execution, like exec_format1(), exec_format2() and exec_jump()
+    def format1(self, insn, idx):
+        execute, op, mask, src, dst, next_pc, cycles = insn
+        regs = self.regs
+        s = self.read_operand(idx, src, mask)
+        kind, reg, x = dst
+        if kind == REG:
+            r, regs[SR, idx] = FORMAT_I[op](s, regs[reg, idx] & mask, mask, regs[SR, idx])
+            if r is not None:
+                self.set_register(idx, reg, r, mask)
+        else:
+            address = (regs[reg, idx] + x) & 0xffff if kind == INDEXED else x
+            d = 0 if op is op_mov else self.load(idx, address, mask)
+            r, regs[SR, idx] = FORMAT_I[op](s, d, mask, regs[SR, idx])
+            if r is not None:
+                self.store(idx, address, r, mask)
+
+    def format2(self, insn, idx):
+        execute, op, mask, src, name, next_pc, cycles = insn
+        regs = self.regs
+        if name == 'RETI':
+            sp = regs[SP, idx]
+            regs[SR, idx] = self.load(idx, sp & 0xfffe, 0xffff)
+            regs[PC, idx] = self.load(idx, (sp + 2) & 0xfffe, 0xffff) & 0xfffe
+            regs[SP, idx] = (sp + 4) & 0xffff
+            return
+        kind, reg, x = src
+        if kind == REG or kind == CONST:
+            address = None
+            v = regs[reg, idx] & mask if kind == REG else x & mask
+        else:
+            address = self.operand_address(idx, src, mask)
+            v = self.load(idx, address, mask)
+        if op is not None:
+            r, regs[SR, idx] = FORMAT_II[op](v, mask, regs[SR, idx])
+            if kind == REG:
+                self.set_register(idx, reg, r, mask)
+            elif address is not None:
+                self.store(idx, address, r, mask)
+        elif name == 'PUSH':
+            regs[SP, idx] = (regs[SP, idx] - 2) & 0xffff
+            self.store(idx, regs[SP, idx], v, mask)
+        else:                                   # CALL
+            regs[SP, idx] = (regs[SP, idx] - 2) & 0xffff
+            self.store(idx, regs[SP, idx], next_pc, 0xffff)
+            regs[PC, idx] = v & 0xfffe
+
+    def jump(self, insn, idx):
+        if insn.op is None:
+            self.regs[PC, idx] = insn.dst
+        else:
+            self.regs[PC, idx] = numpy.where(JUMP_CONDITIONS[insn.op](self.regs[SR, idx]), insn.dst, insn.next_pc)
+
+    def run(self, max_steps=None):
+        """\
+        run every instance that has not stopped until it stops like
+        Simulator.run() would: at a breakpoint (not checked for its first
+        instruction), halted, idle, after max_steps instructions, or at an
+        illegal instruction. returns reasons.
+        """
+        regs = self.regs
+        fetch = self.decoder.fetch
+        executors = {exec_format1: self.format1, exec_format2: self.format2, exec_jump: self.jump}
+        steps = numpy.zeros(self.count, dtype=numpy.int64)
+        running = numpy.flatnonzero(self.reasons == RUNNING)
+        halting = bool(numpy.any(regs[SR, running] & CPUOFF))   # CPUOFF may be set somewhere
+        while len(running):
+            pcs = regs[PC, running]
+            pc = int(pcs.min())
+            idx = running if pcs[-1] == pc and (pcs == pc).all() else running[pcs == pc]
+            # in the order of Simulator.run()
+            group = len(idx)
+            if max_steps is not None:
+                idx = self.stop_where(idx, steps[idx] >= max_steps, STOP_LIMIT)
+            if pc in self.breakpoints:
+                idx = self.stop_where(idx, steps[idx] > 0, STOP_BREAKPOINT)
+            if halting:
+                idx = self.stop_where(idx, (regs[SR, idx] & CPUOFF) != 0, STOP_HALT)
+            if len(idx) != group:
+                running = numpy.flatnonzero(self.reasons == RUNNING)
+                continue
+            try:
+                insn = fetch(pc)
+            except SimulatorError:
+                self.stop_where(idx, True, STOP_ERROR)
+                running = numpy.flatnonzero(self.reasons == RUNNING)
+                continue
+            if self.written[pc >> PAGE_BITS] or self.written[((insn.next_pc - 1) & 0xffff) >> PAGE_BITS]:
+                self.check_code(idx, pc, insn)
+            regs[PC, idx] = insn.next_pc
+            executors[insn.execute](insn, idx)
+            steps[idx] += 1
+            self.cycles[idx] += insn.cycles
+            if insn.execute is exec_jump:
+                loop = insn.dst <= pc and self.decoder.polling_loop(pc)
+                if loop and self.breakpoints.isdisjoint(loop[3]):
+                    idle = regs[PC, idx] == insn.dst
+                    if loop[1] > 1:                     # idle after a whole pass, as in Simulator.poll()
+                        taken = idx[idle]
+                        idle &= (self.poll_pc[idx] == pc) & (self.poll_cycles[idx] == self.cycles[idx] - loop[2])
+                        self.poll_pc[taken] = pc
+                        self.poll_cycles[taken] = self.cycles[taken]
+                    if len(self.stop_where(idx, idle, STOP_IDLE)) != group:
+                        running = numpy.flatnonzero(self.reasons == RUNNING)
+            elif not halting and writes_sr(insn):
+                halting = bool(numpy.any(regs[SR, idx] & CPUOFF))
+        self.steps += steps
+        return self.reasons
+
+    def stop_where(self, idx, condition, reason):
+        """stop the instances idx where condition is true, return the others"""
+        condition = numpy.broadcast_to(condition, idx.shape)
+        self.reasons[idx[condition]] = reason
+        return idx[~condition]
+
+    def resume(self):
+        """let all instances run again, e.g. after a breakpoint or the step limit"""
+        self.reasons[:] = RUNNING
+
+    def call(self, address, args=(), stack=0x0400, max_steps=None, return_address=0):
+        """\
+        call the routine at address in every instance with the arguments in
+        R12..R15 (each a number or one per instance), until it returns to
+        return_address. Instances that returned stop at that breakpoint.
+        """
+        regs = self.regs
+        for reg, arg in zip(range(12, 16), args):
+            regs[reg] = numpy.asarray(arg, dtype=numpy.int64) & 0xffff
+        regs[SP] = (stack - 2) & 0xfffe
+        self.store(self.all, regs[SP], return_address, 0xffff)
+        regs[PC] = address & 0xfffe
+        self.resume()
+        self.breakpoints.add(return_address)
+        try:
+            return self.run(max_steps)
+        finally:
+            self.breakpoints.discard(return_address)
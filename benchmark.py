@@ -0,0 +1,428 @@
+"""\
+Benchmarks for the disassembler and the simulator.
+
+    python benchmark.py [decode] [bulk] [disassemble] [records] [flow] [simulate] [trace] [profile] [interrupts] [uptime] [snapshot] [batch] [--size BYTES] [--repeat N]
+"""
+
+import argparse
+import io
+import random
+import time
+import tracemalloc
+
+import assembler
+import batch
+import disassembler
+import memory
+import profiler
+import simulator
+import tracing
+
+
+def random_image(size=1 << 20, seed=0):
+    """a reproducible image of random words, one segment starting at 0"""
+    return memory.Memory([memory.Segment(0, random.Random(seed).getrandbits(8 * size).to_bytes(size, 'little'))])
+
+
+def best_of(repeat, function, *args):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def bench_decode(size, repeat):
+    """table build time and MB/s decoded on a full MSP430X image"""
+    disassembler._decode_tables.clear()
+    elapsed, _ = best_of(1, disassembler.decode_table, True)
+    print('decode table build:  %8.3f s' % elapsed)
+    mem = random_image(size)
+    dis = disassembler.MSP430Disassembler(mem, msp430x=True)
+    elapsed, instructions = best_of(repeat, dis.decode, mem.segments[0])
+    print('decode:              %8.3f s  %6.2f MB/s  (%d instructions)' % (
+            elapsed, size / elapsed / 1e6, len(instructions)))
+
+
+def bench_bulk(size, repeat):
+    """numpy classification of a full MSP430X image, compared to decode()"""
+    if disassembler.numpy is None:
+        print('bulk:                skipped, numpy is not installed')
+        return
+    segment = random_image(size).segments[0]
+    disassembler.BulkDecoder(segment, msp430x=True)    # build the lookup arrays
+    elapsed, bulk = best_of(repeat, disassembler.BulkDecoder, segment, True)
+    print('bulk classify:       %8.3f s  %6.2f MB/s  (%d instructions)' % (
+            elapsed, size / elapsed / 1e6, len(bulk.starts)))
+
+
+class NullOutput(io.TextIOBase):
+    """counts the characters written, keeps nothing"""
+    def __init__(self):
+        self.written = 0
+
+    def write(self, text):
+        self.written += len(text)
+        return len(text)
+
+
+def bench_disassemble(size, repeat):
+    """text disassembly of a full MSP430X image into a sink, with peak memory"""
+    mem = random_image(size)
+    disassembler.decode_table(True)
+    elapsed, _ = best_of(repeat, lambda: disassembler.MSP430Disassembler(mem, msp430x=True).disassemble(NullOutput()))
+    tracemalloc.start()
+    disassembler.MSP430Disassembler(mem, msp430x=True).disassemble(NullOutput())
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print('disassemble:         %8.3f s  %6.2f MB/s  (peak %.1f MB traced)' % (
+            elapsed, size / elapsed / 1e6, peak / 1e6))
+
+
+def bench_records(size, repeat):
+    """peak memory of holding all decoded instructions of a full MSP430X image"""
+    mem = random_image(size)
+    dis = disassembler.MSP430Disassembler(mem, msp430x=True)
+    tracemalloc.start()
+    instructions = dis.decode(mem.segments[0])
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print('instruction records: %8.1f MB peak  %6.0f bytes/instruction  (%d instructions)' % (
+            peak / 1e6, peak / len(instructions), len(instructions)))
+
+
+def bench_flow(size, repeat):
+    """recursive descent over a full MSP430X image, from its vectors and an entry every 256 bytes"""
+    mem = random_image(size)
+    disassembler.decode_table(True)
+    entries = range(0, size, 256)
+    elapsed, flow = best_of(repeat, disassembler.ControlFlow, mem, True, entries)
+    print('control flow:        %8.3f s  %6.0f k insn/s  (%d blocks, %d instructions, %d bytes code)' % (
+            elapsed, len(flow.instructions) / elapsed / 1e3, len(flow.blocks), len(flow.instructions), flow.code_size()))
+
+
+# DSP style inner loop: accumulate scaled sums of two 32 word tables
+SIMULATE_SOURCE = """\
+START F000
+        MOV #0400, SP
+OUTER:  MOV #0200, R4
+        MOV #0240, R5
+        MOV #20, R6
+        CLR R7
+        CLR R9
+TAP:    MOV @R4+, R8
+        ADD @R5+, R8
+        RRA R8
+        ADD R8, R7
+        ADC R9
+        DEC R6
+        JNE TAP
+        MOV R7, &0300
+        JMP OUTER
+END
+"""
+SIMULATE_STEPS = 500000
+
+
+def bench_simulate(size, repeat):
+    """simulated instructions per second on a DSP style inner loop, per instruction and translated (size is not used)"""
+    object_code = simulator.assemble(SIMULATE_SOURCE)
+
+    def run(translate):
+        sim = simulator.Simulator(object_code, translate)
+        sim.run(SIMULATE_STEPS)
+        return sim
+    elapsed, sim = best_of(repeat, run, False)
+    print('simulate:            %8.3f s  %6.2f MIPS  (%d instructions, %d cycles, %.2f%% cache hits)' % (
+            elapsed, sim.steps / elapsed / 1e6, sim.steps, sim.cycles, 100 * sim.cache_stats()['hit_rate']))
+    translated_elapsed, translated = best_of(repeat, run, True)
+    same = (translated.regs, translated.memory, translated.cycles) == (sim.regs, sim.memory, sim.cycles)
+    print('simulate translated: %8.3f s  %6.2f MIPS  (%.1fx, %d blocks, %s results)' % (
+            translated_elapsed, translated.steps / translated_elapsed / 1e6, elapsed / translated_elapsed,
+            len(translated.blocks), 'same' if same else 'DIFFERENT'))
+
+
+def bench_trace(size, repeat):
+    """the DSP style inner loop with every instruction recorded into a trace ring buffer (size is not used)"""
+    object_code = simulator.assemble(SIMULATE_SOURCE)
+
+    def run(trace):
+        sim = simulator.Simulator(object_code)
+        sim.trace = trace
+        sim.run(SIMULATE_STEPS)
+        return sim
+    elapsed, _ = best_of(repeat, run, None)
+    trace = tracing.Trace(SIMULATE_STEPS // 4)          # wraps around
+    traced_elapsed, sim = best_of(repeat, run, trace)
+    start = time.perf_counter()
+    decoder = tracing.TraceDecoder(memory.from_object_code(object_code), assembler.SYMTAB)
+    lines = sum(1 for _ in decoder.lines(trace.records()))
+    decode_elapsed = time.perf_counter() - start
+    print('trace:               %8.3f s  %6.2f MIPS  (%.2fx untraced, %d records of %d bytes kept)' % (
+            traced_elapsed, sim.steps / traced_elapsed / 1e6, traced_elapsed / elapsed, len(trace),
+            tracing.RECORD.size))
+    print('trace decode:        %8.3f s  %6.0f k lines/s' % (decode_elapsed, lines / decode_elapsed / 1e3))
+
+
+PROFILE_INTERVAL = 1000
+
+
+def bench_profile(size, repeat):
+    """the DSP style inner loop profiled exactly, and sampled with translated blocks (size is not used)"""
+    object_code = simulator.assemble(SIMULATE_SOURCE)
+
+    def run(translate, interval=False):
+        sim = simulator.Simulator(object_code, translate)
+        profile = profiler.Profiler(sim, interval) if interval is not False else None
+        sim.run(SIMULATE_STEPS)
+        return sim, profile
+    elapsed, _ = best_of(repeat, run, False)
+    profiled_elapsed, (sim, profile) = best_of(repeat, run, False, None)
+    start = time.perf_counter()
+    lines = len(list(profile.flat_profile(assembler.SYMTAB))) + len(list(profile.listing(assembler.SYMTAB)))
+    report_elapsed = time.perf_counter() - start
+    print('profile:             %8.3f s  %6.2f MIPS  (%.2fx unprofiled, %d lines of reports in %.3f s)' % (
+            profiled_elapsed, sim.steps / profiled_elapsed / 1e6, profiled_elapsed / elapsed, lines, report_elapsed))
+    translated_elapsed, _ = best_of(repeat, run, True)
+    sampled_elapsed, (sim, profile) = best_of(repeat, run, True, PROFILE_INTERVAL)
+    print('profile sampled:     %8.3f s  %6.2f MIPS  (%.2fx translated, %d samples every %d cycles)' % (
+            sampled_elapsed, sim.steps / sampled_elapsed / 1e6, sampled_elapsed / translated_elapsed,
+            sum(profile.counts), PROFILE_INTERVAL))
+
+
+# busy main loop and a timer interrupt counting ticks in R10
+INTERRUPT_SOURCE = """\
+START F000
+        MOV #0400, SP
+        EINT
+LOOP:   INC R11
+        ADD R11, R12
+        ADC R13
+        JMP LOOP
+TICK:   INC R10
+        RETI
+END
+"""
+INTERRUPT_CYCLES = 2000000
+INTERRUPT_PERIOD = 1000
+
+
+def bench_interrupts(size, repeat):
+    """simulated instructions per second with a timer interrupt, per instruction and translated (size is not used)"""
+    object_code = simulator.assemble(INTERRUPT_SOURCE)
+    tick = assembler.SYMTAB['TICK']
+
+    def run(translate):
+        sim = simulator.Simulator(object_code, translate)
+        sim.write_word(0xfff2, tick)
+        simulator.Timer(sim, 0xfff2, INTERRUPT_PERIOD)
+        sim.run(until=INTERRUPT_CYCLES)
+        return sim
+    for translate in (False, True):
+        elapsed, sim = best_of(repeat, run, translate)
+        stats = sim.interrupt_stats()[0xfff2]
+        print('interrupts%s %8.3f s  %6.2f MIPS  (%d interrupts, latency %d/%.1f/%d cycles)' % (
+                ' translated:' if translate else ':           ', elapsed, sim.steps / elapsed / 1e6,
+                stats['taken'], stats['latency_min'], stats['latency_mean'], stats['latency_max']))
+
+
+# sleeps in LPM3, woken every second by TICK, then busy waits for FLAG 50 ms later
+UPTIME_SOURCE = """\
+START F000
+        MOV #0400, SP
+MAIN:   BIS #D8, SR
+        INC R11
+WAIT:   BIT #1, &0200
+        JEQ WAIT
+        BIC #1, &0200
+        JMP MAIN
+TICK:   BIC #F0, 0(SP)
+        RETI
+FLAG:   BIS #1, &0200
+        RETI
+END
+"""
+UPTIME_CLOCK = 1000000          # Hz
+UPTIME_HOURS = 1
+
+
+def bench_uptime(size, repeat):
+    """an hour of a device that sleeps and polls, with time skipped in LPM and polling loops (size is not used)"""
+    object_code = simulator.assemble(UPTIME_SOURCE)
+    tick, flag = assembler.SYMTAB['TICK'], assembler.SYMTAB['FLAG']
+
+    def run():
+        sim = simulator.Simulator(object_code)
+        sim.write_word(0xfff2, tick)
+        sim.write_word(0xffea, flag)
+        simulator.Timer(sim, 0xfff2, UPTIME_CLOCK)
+        simulator.Timer(sim, 0xffea, UPTIME_CLOCK, UPTIME_CLOCK * 21 // 20)
+        sim.run(until=UPTIME_HOURS * 3600 * UPTIME_CLOCK)
+        return sim
+    elapsed, sim = best_of(repeat, run)
+    power = sim.power_stats(UPTIME_CLOCK)
+    print('uptime:              %8.3f s  %6.0fx real time  (%d h, %d instructions, %.1f%% in LPM3, %.3g J)' % (
+            elapsed, UPTIME_HOURS * 3600 / elapsed, UPTIME_HOURS, sim.steps,
+            100 * power[simulator.LPM3]['cycles'] / sim.cycles, sum(mode['energy'] for mode in power.values())))
+
+
+# init code filling a table of squares 20 times, then a short scenario on its input in R12
+BOOT_SOURCE = """\
+START F000
+        MOV #0A00, SP
+        MOV #14, R7
+OUTER:  MOV #0200, R4
+        CLR R5
+        MOV #1, R6
+FILL:   MOV R5, 0(R4)
+        ADD R6, R5
+        ADD #2, R6
+        ADD #2, R4
+        CMP #0600, R4
+        JNE FILL
+        DEC R7
+        JNE OUTER
+BOOTED: RLA R12
+        MOV 0200(R12), R13
+        ADD 0202(R12), R13
+DONE:   JMP DONE
+END
+"""
+SCENARIOS = 1000
+REBOOT_SCENARIOS = 20
+
+
+def bench_snapshot(size, repeat):
+    """scenarios forked from a snapshot of the booted state, compared to booting for each (size is not used)"""
+    object_code = simulator.assemble(BOOT_SOURCE)
+    sim = simulator.Simulator(object_code, True)
+    sim.add_breakpoint(assembler.SYMTAB['BOOTED'])
+    sim.run()
+    booted = sim.snapshot()
+    data = booted.to_bytes()
+    sim.remove_breakpoint(assembler.SYMTAB['BOOTED'])
+
+    def run_forked(count):
+        results = []
+        for i in range(count):
+            sim.restore(booted)
+            sim.regs[12] = i & 0x1ff
+            sim.run()
+            results.append((sim.regs[13], sim.cycles))
+        return results
+
+    def run_rebooted(count):
+        results = []
+        for i in range(count):
+            sim.reset()
+            sim.regs[12] = i & 0x1ff
+            sim.run()
+            results.append((sim.regs[13], sim.cycles))
+        return results
+    forked_elapsed, forked = best_of(repeat, run_forked, SCENARIOS)
+    rebooted_elapsed, rebooted = best_of(repeat, run_rebooted, REBOOT_SCENARIOS)
+    per_forked = forked_elapsed / SCENARIOS
+    per_rebooted = rebooted_elapsed / REBOOT_SCENARIOS
+    snapshot_elapsed, _ = best_of(repeat, sim.snapshot)
+    load_elapsed, _ = best_of(repeat, simulator.Snapshot.from_bytes, data)
+    print('snapshot forks:      %8.3f s  %6.1f us/scenario  (%d scenarios, %d booted cycles)' % (
+            forked_elapsed, per_forked * 1e6, SCENARIOS, booted.cycles))
+    print('rebooting:           %8.3f s  %6.1f us/scenario  (%d scenarios, %.0fx the forks, %s results)' % (
+            rebooted_elapsed, per_rebooted * 1e6, REBOOT_SCENARIOS, per_rebooted / per_forked,
+            'same' if rebooted == forked[:REBOOT_SCENARIOS] else 'DIFFERENT'))
+    print('snapshot file:       %8.0f bytes  snapshot %.1f us, load %.1f us' % (
+            len(data), snapshot_elapsed * 1e6, load_elapsed * 1e6))
+
+
+# shift and add multiply, R14 = R12 * R13, with a data dependent branch
+MULTIPLY_SOURCE = """\
+START F000
+MUL:    CLR R14
+        MOV #10, R15
+LOOP:   BIT #1, R12
+        JEQ SKIP
+        ADD R13, R14
+SKIP:   RLA R13
+        CLRC
+        RRC R12
+        DEC R15
+        JNE LOOP
+        RET
+END
+"""
+BATCH_VECTORS = 10000
+SEPARATE_VECTORS = 200
+
+
+def bench_batch(size, repeat):
+    """per vector cost of a routine run in lockstep, compared to separate simulators (size is not used)"""
+    if batch.numpy is None:
+        print('batch:               skipped, numpy is not installed')
+        return
+    object_code = simulator.assemble(MULTIPLY_SOURCE)
+    rnd = random.Random(0)
+    a = [rnd.randrange(0x10000) for _ in range(BATCH_VECTORS)]
+    b = [rnd.randrange(0x10000) for _ in range(BATCH_VECTORS)]
+
+    def run_batch():
+        sim = batch.BatchSimulator(object_code, BATCH_VECTORS)
+        sim.call(0xf000, (a, b))
+        return sim
+
+    def run_separate():
+        results = []
+        for i in range(SEPARATE_VECTORS):
+            sim = simulator.Simulator(object_code)
+            sim.regs[12], sim.regs[13], sim.regs[simulator.SP], sim.regs[simulator.PC] = a[i], b[i], 0x03fe, 0xf000
+            sim.write_word(0x03fe, 0)
+            sim.add_breakpoint(0)
+            sim.run()
+            results.append((sim.regs[14], sim.cycles))
+        return results
+    batch_elapsed, sim = best_of(repeat, run_batch)
+    separate_elapsed, results = best_of(repeat, run_separate)
+    same = results == [(int(sim.regs[14, i]), int(sim.cycles[i])) for i in range(SEPARATE_VECTORS)]
+    per_batch = batch_elapsed / BATCH_VECTORS
+    per_separate = separate_elapsed / SEPARATE_VECTORS
+    print('batch:               %8.3f s  %6.1f us/vector  (%d vectors, %d private pages)' % (
+            batch_elapsed, per_batch * 1e6, BATCH_VECTORS, sim.private_pages()))
+    print('separate simulators: %8.3f s  %6.1f us/vector  (%d vectors, %.0fx the batch, %s results)' % (
+            separate_elapsed, per_separate * 1e6, SEPARATE_VECTORS, per_separate / per_batch,
+            'same' if same else 'DIFFERENT'))
+
+
+BENCHMARKS = {
+    'decode': bench_decode,
+    'bulk': bench_bulk,
+    'disassemble': bench_disassemble,
+    'records': bench_records,
+    'flow': bench_flow,
+    'simulate': bench_simulate,
+    'trace': bench_trace,
+    'profile': bench_profile,
+    'interrupts': bench_interrupts,
+    'uptime': bench_uptime,
+    'snapshot': bench_snapshot,
+    'batch': bench_batch,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('names', nargs='*', metavar='NAME',
+            help='benchmarks to run (%s), default all' % ', '.join(sorted(BENCHMARKS)))
+    parser.add_argument('--size', type=int, default=1 << 20, help='image size in bytes (default 1 MB)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per benchmark, best is reported')
+    args = parser.parse_args()
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark %r' % (name,))
+    for name in args.names or sorted(BENCHMARKS):
+        BENCHMARKS[name](args.size, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
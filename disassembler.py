@@ -0,0 +1,1307 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2001-2011 Chris Liechti <cliechti@gmx.net>
+# All Rights Reserved.
+#
+# From python-msp430-tools, modified for this assembler. Simplified BSD
+# License:
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""\
+Disassembler for TI MSP430(X)
+"""
+
+import bisect
+import collections
+import functools
+import os
+import sys
+import memory
+import peripherals
+from assembler import EMULATED
+
+try:
+    import numpy
+except ImportError:     # the bulk classification below is optional
+    numpy = None
+
+INSN_WIDTH = 7          # instruction width in chars (args follow)
+# instruction text formats, built once
+FMT_NAME = "%%-%ds" % INSN_WIDTH
+FMT_NAME_DST = "%%-%ds %%s" % INSN_WIDTH
+FMT_NAME_SRC_DST = "%%-%ds %%s, %%s" % INSN_WIDTH
+FMT_NAME_IMMEDIATE_LABEL = "%%-%ds #%%s" % INSN_WIDTH
+FMT_NAME_OFFSET = "%%-%ds %%+d" % INSN_WIDTH
+
+regnames = ['PC',  'SP',  'SR',  'R3',
+            'R4',  'R5',  'R6',  'R7',
+            'R8',  'R9',  'R10', 'R11',
+            'R12', 'R13', 'R14', 'R15']
+
+
+def addressMode(bytemode, asrc = None, ad = None, src = None, dest = None):
+    x = y = ''
+    c = 0
+    # source first
+    if asrc is not None:
+        if src == 2 and asrc > 1: # R3/CG2
+            x = "#%d" % (None,None,4,8)[asrc]
+        elif src == 3:  # CG3
+            if asrc == 3:
+                if bytemode:
+                    x = "#0xff"
+                else:
+                    x = "#0xffff"
+            else:
+                x = "#%d" % (0,1,2)[asrc]
+        else:
+            if asrc == 0:   # register mode
+                x = regnames[src]
+            elif asrc == 1:   # pc rel
+                if src == 0:
+                    x = '0x%(x)04x'
+                    c += 1  # read
+                elif src == 2: # abs
+                    x = '&0x%(x)04x'
+                    c += 1  # read
+                else:           # indexed
+                    x = '0x%%(x)04x(%s)' % regnames[src]
+                    c += 1  # read
+            elif asrc == 2:   # indirect
+                x = '@%s' % regnames[src]
+            elif asrc == 3:
+                if src == 0:    # immediate
+                    x = bytemode and '#0x%(x)02x' or '#0x%(x)04x'
+                else:           # indirect auto increment
+                    x = '@%s+' % regnames[src]
+            else:
+                raise ValueError("addressing mode error")
+    # dest
+    if ad is not None:
+        if ad == 0:
+            y = '%s' % regnames[dest]
+            if dest == 0 and asrc != 1:
+                c += 1  # modifying PC gives one cycle penalty
+        else:
+            if dest == 0:   # PC relative
+                #~ y = '%(y)s'
+                y = '0x%(y)04x'
+                c += 2  # read modify write
+            elif dest == 2: # abs
+                y = '&0x%(y)04x'
+                #~ y = '&0x%(y)04x'
+                c += 2  # read modify write
+            else:           # indexed
+                y = '%%(y)s(%s)' % regnames[dest]
+                #~ y = '0x%%(y)04x(%s)' % regnames[dest]
+                c += 2  # read modify write
+
+    return x,y,c
+
+
+singleOperandInstructions = {
+    0x00: ('rrc',  0),
+    0x01: ('swpb', 0),
+    0x02: ('rra',  0),
+    0x03: ('sxt',  0),
+    0x04: ('push', 1),    # write of stack -> 2
+    0x05: ('call', 1),    # write of stack -> 2, modify PC -> 1
+    0x06: ('reti', 3),    # pop SR -> 1, pop PC -> 1, modify PC -> 1
+}
+
+doubleOperandInstructions = {
+    0x4: 'mov',
+    0x5: 'add',
+    0x6: 'addc',
+    0x7: 'subc',
+    0x8: 'sub',
+    0x9: 'cmp',
+    0xa: 'dadd',
+    0xb: 'bit',
+    0xc: 'bic',
+    0xd: 'bis',
+    0xe: 'xor',
+    0xf: 'and',
+}
+
+jumpInstructions = {
+    0x0: 'jnz', # jne
+    0x1: 'jz',  # jeq
+    0x2: 'jnc',
+    0x3: 'jc',
+    0x4: 'jn',
+    0x5: 'jge',
+    0x6: 'jl',
+    0x7: 'jmp',
+}
+
+
+class NamedSymbols(object):
+    """Handle a collection of peripheral register names and associated bit names"""
+    def __init__(self, peripherals=None):
+        self.peripherals = peripherals
+
+    def load(self, filename):
+        """load a device definition file (C header or linker .cmd), see peripherals.load()"""
+        self.peripherals = peripherals.load(filename)
+
+    def symbol_from_adr(self, opt):
+        """try to find a symbol name if the argument points to an absolute address"""
+        if opt[0:1] == '&' and self.peripherals is not None:
+            name = self.peripherals.name_at(int(opt[1:], 0))
+            if name is not None:
+                return '&%s' % (name, )
+        return opt
+
+    def symbols_for_bits(self, arg, opt):
+        """for known targets, convert immediate values to a list of OR'ed bits"""
+        if opt[0:1] == '&' and self.peripherals is not None:
+            reg = opt[1:]
+            if arg[0:1] == '#' and self.peripherals.address_of(reg) is not None:
+                value = int(arg[1:], 0)
+                result = []
+                for mask, name in self.peripherals.bits(reg):     # sorted by mask
+                    if value & mask:
+                        value &= ~mask          # clear this bit
+                        result.append(name)
+                # if there are bits left, append them to the result, so that nothing gets lost
+                if value:
+                    # look for named values
+                    name = self.peripherals.value_name(reg, value)
+                    result.append(name if name is not None else '0x%x' % value)
+                return '#%s' % '|'.join(result)
+        return arg
+
+
+class Instruction(object):
+    """\
+    this class used to represent an MSP430 assembler instruction.
+    emulated instructions are already named by the decode table.
+    It also saves the address the instruction started, the words used to
+    decode the instruction and the number of cycles the CPU would have used.
+
+    Instances have __slots__, as images decode to hundreds of thousands of
+    them. Instructions decoded from a WordStream keep the stream and a word
+    count instead of a list of their words.
+    """
+    __slots__ = ('address', 'name', 'address_mode', 'src', 'dst', 'cycles', '_words', '_count')
+
+    def __init__(self, address, name, address_mode='', src=None, dst=None, used_words=None, cycles=0, named_symbols=None, stream=None, count=0):
+        self.address = address
+        self.name = name
+        self.address_mode = address_mode
+        self.src = src
+        self.dst = dst
+        if stream is not None:
+            self._words = stream
+            self._count = count
+        else:
+            self._words = used_words if used_words is not None else []
+            self._count = len(self._words)
+        self.cycles = cycles
+
+        # try to replace values by symbols
+        if named_symbols is not None:
+            if self.dst:
+                self.dst = named_symbols.symbol_from_adr(self.dst)
+            if self.src:
+                self.src = named_symbols.symbol_from_adr(self.src)
+                self.src = named_symbols.symbols_for_bits(self.src, self.dst)
+
+    @property
+    def used_words(self):
+        """the words this instruction was decoded from"""
+        words = self._words
+        if isinstance(words, list):
+            return words
+        index = (self.address - words.startaddress) // 2
+        return list(words.words[index:index + self._count])
+
+    def __str__(self):
+        if self.src is not None and self.dst is not None:
+            return FMT_NAME_SRC_DST % (self.name + self.address_mode, self.src, self.dst)
+        elif self.dst is not None:
+            return FMT_NAME_DST % (self.name + self.address_mode, self.dst)
+        else:
+            return FMT_NAME % (self.name,)
+
+    def str_width_label(self, label):
+        if not self.jumps(): raise ValueError('only possible with jump insns')
+        if self.dst is not None and self.dst[0:1] == '#' and self.src is None:
+            return FMT_NAME_IMMEDIATE_LABEL % (self.name, label)
+        raise ValueError('only possible with dst only insns')
+
+    def jumps(self):
+        """return true if this instructions jumps (modifies the PC)"""
+        return self.name in ('call', 'br') and self.dst is not None and self.dst[0:1] == '#'     # XXX relative address mode missing
+
+    def targetAddress(self, address):
+        """only valid for instructions that jump; return the target address of the jump"""
+        if self.name == 'call' or self.name == 'br':
+            if self.dst[0] == '#':
+                return int(self.dst[1:], 0)
+            else:
+                return address + int(self.dst, 0)
+        else:
+            raise ValueError('not a branching instruction')
+
+    def ends_a_block(self):
+        """helper for a nice output. return true if execution does not continue
+        after this instruction."""
+        return self.name in ('ret', 'reti', 'br', 'bra')
+
+
+class JumpInstruction(Instruction):
+    """represent jump instructions"""
+    __slots__ = ('offset',)
+
+    def __init__(self, address, name, offset, used_words=None, cycles=0, named_symbols=None, stream=None, count=0):
+        Instruction.__init__(self, address, name, 0, None, None, used_words, cycles, named_symbols, stream, count)
+        self.offset = offset
+
+    def jumps(self):
+        """return true because this instructions jumps (modifies the PC)"""
+        return True
+
+    def targetAddress(self, address):
+        """return the target address of the jump"""
+        return address + self.offset
+
+    def __str__(self):
+        return FMT_NAME_OFFSET % (self.name, self.offset)
+
+    def str_width_label(self, label):
+        return FMT_NAME_DST % (self.name, label)
+
+    def ends_a_block(self):
+        """helper for a nice output. return true if execution does not continue
+        after this instruction."""
+        return self.name == 'jmp'
+
+
+# emulated instructions, looked up by the fields of the instruction that
+# implements them: (name, source key, destination key) --> (emulated name,
+# which operand it keeps). source keys are constant generator values, '@SP+',
+# ANY or SAME (same register as the destination); destination keys are
+# register numbers or ANY.
+ANY = 'any'
+SAME = 'same'
+# MSP430X only, the assembler does not know the address instructions
+EMULATED_X = {
+    "CLRA": ("MOVA", "#0", "{op}"),  "TSTA": ("CMPA", "#0", "{op}"),
+    "INCDA": ("ADDA", "#2", "{op}"), "DECDA": ("SUBA", "#2", "{op}"),
+    "RETA": ("MOVA", "@SP+", "PC"),  "BRA": ("MOVA", "{op}", "PC"),
+}
+# the status register ones have no .x form, nop and br keep their name
+EMULATED_NO_X = ('BIC', 'BIS', 'MOVA', 'CMPA', 'ADDA', 'SUBA')
+EMULATED_SAME_NAME_X = ('NOP', 'BR')
+
+
+def _emulated_fields():
+    fields = {}
+    for emulated, (name, src, dst) in list(EMULATED.items()) + list(EMULATED_X.items()):
+        if src == '{op}':
+            src_key = SAME if dst == '{op}' else ANY
+            operand = 'dst' if dst == '{op}' else 'src'
+        else:
+            src_key = src if src == '@SP+' else int(src[1:])
+            operand = 'dst' if dst == '{op}' else None
+        dst_key = ANY if dst == '{op}' else regnames.index(dst)
+        fields[name.lower(), src_key, dst_key] = (emulated.lower(), operand)
+        if name not in EMULATED_NO_X:
+            x_name = emulated if emulated in EMULATED_SAME_NAME_X else emulated + 'X'
+            fields[name.lower() + 'x', src_key, dst_key] = (x_name.lower(), operand)
+    return fields
+
+EMULATED_FIELDS = _emulated_fields()
+
+
+def emulated_instruction(name, src_key, dst_key, same=False):
+    """    (emulated name, kept operand) for an instruction given by its decoded
+    fields, None if it does not implement an emulated instruction.
+    src_key is None unless the source is a constant or @SP+, dst_key is
+    None unless the destination is a register.
+    """
+    if src_key is not None:
+        hit = EMULATED_FIELDS.get((name, src_key, dst_key)) or EMULATED_FIELDS.get((name, src_key, ANY))
+        if hit is not None:
+            return hit
+    hit = EMULATED_FIELDS.get((name, ANY, dst_key))
+    if hit is None and same:
+        hit = EMULATED_FIELDS.get((name, SAME, ANY))
+    return hit
+
+
+def source_key(src, asrc):
+    """the emulated instruction source key of a source register and mode"""
+    if src == 3:
+        return (0, 1, 2, -1)[asrc]      # CG3, -1 is 0xff/0xffff
+    if src == 2 and asrc > 1:
+        return (4, 8)[asrc - 2]         # CG2
+    if src == 1 and asrc == 3:
+        return '@SP+'
+    return None
+
+
+def emulate_operands(emulate, name, src, dst):
+    """    emulated instructions that depend on operand values, for decode table
+    entries with emulate set: SAME for a memory operand added to itself,
+    VALUE for MSP430X immediates.
+    """
+    if emulate == SAME:
+        if src == dst:
+            return EMULATED_FIELDS[name, SAME, ANY][0], None, dst
+    else:
+        hit = EMULATED_FIELDS.get((name, int(src[1:], 0), ANY))
+        if hit is not None:
+            return hit[0], None, dst
+    return name, src, dst
+
+
+# instruction kinds in the decode table
+SINGLE, DOUBLE, JUMP, EXTENDED, PREFIX, ILLEGAL = range(6)
+KIND_NAMES = ('single', 'double', 'jump', 'extended', 'prefixed', 'illegal')
+
+# one decode table entry: operand templates take the next word as %(x)s (src)
+# or %(y)s (dst), or'ed with src_hi/dst_hi << 16. cycles include all words.
+# emulate is None unless the name depends on the operand words, see
+# emulate_operands().
+OpcodeInfo = collections.namedtuple('OpcodeInfo',
+        'kind name address_mode src dst src_hi dst_hi words cycles offset emulate')
+VALUE = 'value'
+
+
+def _opcode_info(kind, name, address_mode='', src=None, dst=None, src_hi=0, dst_hi=0, cycles=0, offset=0, emulate=None):
+    words = (src is not None and '%' in src) + (dst is not None and '%' in dst)
+    return OpcodeInfo(kind, name, address_mode, src, dst, src_hi, dst_hi, words, cycles + 1 + words, offset, emulate)
+
+
+def _emulated_info(kind, name, address_mode, src, dst, src_hi, dst_hi, cycles, src_key, dst_key, same=False, emulate=None):
+    """_opcode_info() for a double operand instruction, named as the emulated instruction it implements"""
+    hit = emulated_instruction(name, src_key, dst_key, same)
+    if hit is not None:
+        name, operand = hit
+        if operand == 'src':        # br/bra: the source is the target
+            dst, dst_hi = src.replace('%(x)', '%(y)'), src_hi
+        elif operand is None:
+            dst = None
+        src = None
+        emulate = None
+    return _opcode_info(kind, name, address_mode, src, dst, src_hi, dst_hi, cycles, emulate=emulate)
+
+
+def decode_opcode(opcode, msp430x=False, extension_word=None):
+    """\
+    decode one opcode word (without its operand words) into an OpcodeInfo.
+    extension_word is the MSP430X prefix word that came before opcode.
+    """
+    cycles = 0
+    src_hi = 0
+    dst_hi = 0
+    # single operand; 0x1340-0x13bf are the MSP430X calla, not reti
+    if ((opcode & 0xf000) == 0x1000 and
+            ((opcode >> 7) & 0x1f in singleOperandInstructions) and
+            not (msp430x and 0x1340 <= opcode <= 0x13bf)
+    ):
+        bytemode = (opcode >> 6) & 1
+        asrc = (opcode >> 4) & 3
+        src = opcode & 0xf
+        x,y,c = addressMode(bytemode, asrc=asrc, src=src)
+        name, addcyles = singleOperandInstructions[(opcode >> 7) & 0x1f]
+        cycles += c + addcyles # some functions have additional cycles (push etc)
+        if extension_word is not None:
+            name += 'x'
+            al = (extension_word >> 6) & 1
+            if asrc == 0:    # register mode
+                n = extension_word & 0xf
+                zc = (extension_word >> 8) & 1
+                cycles += 1 + n
+            else:           # non register mode
+                dst_hi = extension_word & 0xf
+        else:
+            al = 1
+        if al:
+            if bytemode:
+                address_mode = '.b'
+            else:
+                address_mode = ''
+        else:
+            if bytemode:
+                address_mode = '.a'
+            else:
+                address_mode = '.illegal'
+        if not (src == 2 or src == 3):
+            if asrc == 0:
+                if src == 0: cycles += 1 # destination PC adds one
+                if name == 'push': cycles += 2
+                if name == 'call': cycles += 2
+            elif asrc == 1 or asrc == 2:
+                cycles += 1
+            elif asrc == 3:
+                cycles += 1
+                if name == 'call': cycles += 1
+        else: # this happens for immediate values provided by the constant generators
+            if name == 'push': cycles += 2 - 1
+            if name == 'call': cycles += 3
+
+        if name in ('reti', 'retix'):
+            return _opcode_info(SINGLE, name, cycles=cycles)
+        # the single operand is printed as destination
+        return _opcode_info(SINGLE, name, address_mode, dst=x.replace('%(x)', '%(y)'), dst_hi=dst_hi, cycles=cycles)
+
+    # double operand
+    elif (opcode >> 12) & 0xf in doubleOperandInstructions:
+        bytemode = (opcode >> 6) & 1
+        adst = (opcode >> 7) & 1
+        asrc = (opcode >> 4) & 3
+        x,y,c = addressMode(
+                bytemode,
+                src=(opcode >> 8) & 0xf,
+                ad=adst,
+                asrc=asrc,
+                dest=opcode & 0xf)
+        name = doubleOperandInstructions[(opcode >> 12) & 0xf]
+        cycles += c
+        if extension_word is not None:
+            name += 'x'
+            al = (extension_word >> 6) & 1
+            if asrc == 0 and adst == 0:    # register mode
+                n = extension_word & 0xf
+                zc = (extension_word >> 8) & 1
+                cycles += 1 + n
+            else:           # non register mode
+                dst_hi = extension_word & 0xf
+                src_hi = (extension_word >> 7) & 0xf
+        else:
+            al = 1
+        if al:
+            if bytemode:
+                address_mode = '.b'
+            else:
+                address_mode = ''
+        else:
+            if bytemode:
+                address_mode = '.a'
+            else:
+                address_mode = '.illegal'
+        src = (opcode >> 8) & 0xf
+        dst = opcode & 0xf
+        # add &x, &x is rla &x: only known once the words are read
+        emulate = SAME if (asrc == 1 and src == 2 and adst and dst == 2) else None
+        src_key = source_key(src, asrc)
+        return _emulated_info(DOUBLE, name, address_mode, x, y, src_hi, dst_hi, cycles,
+                src_key, None if adst else dst,
+                same=(src_key is None and asrc == 0 and adst == 0 and src == dst), emulate=emulate)
+
+    # jump instructions
+    elif ((opcode & 0xe000) == 0x2000 and
+            ((opcode >> 10) & 0x7 in jumpInstructions)):
+        name = jumpInstructions[(opcode >> 10) & 0x7]
+        offset = ((opcode & 0x3ff) << 1)
+        if offset & 0x400:  # negative?
+            offset = -((~offset + 1) & 0x7ff)
+        cycles += 1 # jumps always have 2 cycles
+        return _opcode_info(JUMP, name, cycles=cycles, offset=offset)
+
+    # extended instructions
+    elif msp430x and (opcode & 0xf000) == 0x0000:
+        src = (opcode >> 8) & 0xf
+        dst = opcode & 0xf
+        insnid = (opcode >> 4) & 0xf
+        if dst == 0 and insnid not in (7, 9, 13): cycles += 2
+        if insnid == 0:
+            return _emulated_info(EXTENDED, 'mova', '', '@%s' % regnames[src], regnames[dst], 0, 0, cycles, None, dst)
+        elif insnid == 1:
+            return _emulated_info(EXTENDED, 'mova', '', '@%s+' % regnames[src], regnames[dst], 0, 0, cycles,
+                    '@SP+' if src == 1 else None, dst)
+        elif insnid == 2:
+            return _emulated_info(EXTENDED, 'mova', '', '&0x%(x)08x', regnames[dst], src, 0, cycles, None, dst)
+        elif insnid == 3:
+            return _emulated_info(EXTENDED, 'mova', '', '0x%%(x)04x(%s)' % regnames[src], regnames[dst], 0, 0, cycles, None, dst)
+        elif insnid == 4 or insnid == 5:
+            insnid_r = (opcode >> 8) & 0x3
+            n = (opcode >> 10) & 0x3
+            cycles += n
+            name = ('rrcm', 'rram', 'rlam', 'rrum')[insnid_r] + ('.a' if insnid == 4 else '.w')
+            return _opcode_info(EXTENDED, name, src='#%d' % (n,), dst=regnames[dst], cycles=cycles)
+        elif insnid == 6:
+            return _opcode_info(EXTENDED, 'mova', src=regnames[src], dst='&0x%(y)08x', dst_hi=dst, cycles=cycles)
+        elif insnid == 7:
+            return _opcode_info(EXTENDED, 'mova', src=regnames[src], dst='%%(y)04x(%s)' % regnames[dst], cycles=cycles)
+        elif 8 <= insnid <= 11:
+            name = ('mova', 'cmpa', 'adda', 'suba')[insnid - 8]
+            return _emulated_info(EXTENDED, name, '', '#0x%(x)08x', regnames[dst], src, 0, cycles, None, dst, emulate=VALUE)
+        else:
+            name = ('mova', 'cmpa', 'adda', 'suba')[insnid - 12]
+            return _emulated_info(EXTENDED, name, '', regnames[src], regnames[dst], 0, 0, cycles, None, dst)
+
+    # extended instructions 2
+    elif msp430x and (opcode & 0xf800) == 0x1000:
+        dst = opcode & 0xf
+        if opcode == 0b0001001100000000:
+            return _opcode_info(EXTENDED, 'reti', cycles=cycles)
+        elif opcode & 0xff00 == 0b0001001100000000:
+            call_mode = (opcode >> 4) & 0xf
+            if call_mode == 4:
+                return _opcode_info(EXTENDED, 'calla', dst=regnames[dst], cycles=cycles)
+            elif call_mode == 5:
+                return _opcode_info(EXTENDED, 'calla', dst='0x%%(y)04x(%s)' % regnames[dst], cycles=cycles)
+            elif call_mode == 6:
+                return _opcode_info(EXTENDED, 'calla', dst='@%s' % regnames[dst], cycles=cycles)
+            elif call_mode == 7:
+                return _opcode_info(EXTENDED, 'calla', dst='@%s+' % regnames[dst], cycles=cycles)
+            elif call_mode == 8:
+                return _opcode_info(EXTENDED, 'calla', dst='&0x%(y)08x', dst_hi=dst, cycles=cycles)
+            elif call_mode == 9:
+                return _opcode_info(EXTENDED, 'calla', dst='0x%(y)08x', dst_hi=dst, cycles=cycles)
+            elif call_mode == 11:
+                return _opcode_info(EXTENDED, 'calla', dst='#0x%(y)08x', dst_hi=dst, cycles=cycles)
+        elif 0b00010100 <= (opcode >> 8) <= 0b00010111:
+            n = (opcode >> 4) & 0xf
+            name = ('pushm.a', 'pushm.w', 'pop.a', 'pop.w')[(opcode >> 8) & 0x3]
+            return _opcode_info(EXTENDED, name, src='#%d' % n, dst=regnames[dst], cycles=cycles)
+
+    # extension word
+    elif msp430x and (opcode & 0xf800) == 0x1800:
+        return OpcodeInfo(PREFIX, None, '', None, None, 0, 0, 0, 1, 0, None)
+
+    # unknown instruction
+    return OpcodeInfo(ILLEGAL, 'illegal-insn-0x%04x' % opcode, '', None, None, 0, 0, 0, 1, 0, None)
+
+
+_decode_tables = {}
+
+def decode_table(msp430x=False):
+    """the 64K entry OpcodeInfo table, indexed by opcode word. built on first use."""
+    table = _decode_tables.get(msp430x)
+    if table is None:
+        table = _decode_tables[msp430x] = [decode_opcode(opcode, msp430x) for opcode in range(0x10000)]
+    return table
+
+
+# prefixed (MSP430X extension word) instructions are decoded on demand
+decode_extended = functools.lru_cache(maxsize=4096)(decode_opcode)
+
+
+class MSP430Disassembler(object):
+
+    def __init__(self, memory, msp430x=False, named_symbols=None):
+        self.memory = memory
+        self.msp430x = msp430x
+        self.named_symbols = named_symbols
+        self.cycles = 0
+        self.used_words = []
+        self.instructions = []
+        self.labels = {}
+        self.label_num = 1
+        self.next_word = None
+        self.address = None
+        self.first_address = None
+        self.table = decode_table(msp430x)
+        if self.msp430x:
+            self.adr_fmt = "0x%08x"
+        else:
+            self.adr_fmt = "0x%04x" 
+
+    def restart(self, address):
+        """reset internal state. used to restart decoding on each segment"""
+        self.address = address
+        self.cycles = 0
+        self.used_words = []
+        self.first_address = None
+        self.instructions = []
+
+
+    def _save_instruction(self, insn):
+        """store decoded instruction, prepare for next one"""
+        self.instructions.append(insn)
+        self.cycles = 0
+        self.used_words = []
+        self.first_address = None
+
+    def jump_instruction(self, name, offset):
+        """save a jump instruction"""
+        self._save_instruction(JumpInstruction(
+                self.first_address,
+                name,
+                offset,
+                used_words=self.used_words,
+                cycles=self.cycles,
+                named_symbols=self.named_symbols))
+
+    def instruction(self, name, address_mode='', src=None, dst=None):
+        """save a non-jump instruction"""
+        self._save_instruction(Instruction(
+                self.first_address,
+                name,
+                address_mode,
+                src=src,
+                dst=dst,
+                used_words=self.used_words,
+                cycles=self.cycles,
+                named_symbols=self.named_symbols))
+
+    def word(self):
+        """get next 16 bits from instruction stream"""
+        if self.first_address is None:
+            self.first_address = self.address
+        word = self.next_word()
+        self.cycles += 1
+        self.address += 2
+        self.used_words.append(word)
+        return word
+
+    def process_word(self):
+        """\
+        disassemble one instruction from a stream of words.
+        """
+        opcode = self.word()
+        info = self.table[opcode]
+        prefix_words = 0
+        while info.kind == PREFIX:      # MSP430X extension word
+            prefix_words += 1
+            extension_word = opcode
+            opcode = self.word()
+            info = decode_extended(opcode, self.msp430x, extension_word)
+        kind, name, address_mode, src, dst, src_hi, dst_hi, nwords, cycles, offset, emulate = info
+        if nwords:
+            if src is not None and '%' in src:
+                src = src % {'x': (src_hi << 16) | self.word()}
+            if dst is not None and '%' in dst:
+                dst = dst % {'y': (dst_hi << 16) | self.word()}
+            if emulate is not None:
+                name, src, dst = emulate_operands(emulate, name, src, dst)
+        self.cycles = cycles + prefix_words
+        if kind == JUMP:
+            self.jump_instruction(name, offset)
+        else:
+            self.instruction(name, address_mode, src=src, dst=dst)
+
+    def decode_at(self, address):
+        """\
+        decode the single instruction at address, found by random access
+        into its segment (no decoding from the segment start).
+        """
+        segment = self.memory.segment_at(address)
+        if segment is None:
+            raise IndexError('address 0x%04x not in memory' % (address,))
+        self.restart(address)
+        self.next_word = segment.word_stream().iter_from(address).__next__
+        try:
+            self.process_word()
+        except StopIteration:
+            raise IndexError('instruction at 0x%04x runs past the end of its segment' % (address,))
+        return self.instructions[-1]
+
+    def iter_decode(self, segment):
+        """\
+        generate the instructions of a segment one by one. same as calling
+        process_word() until the segment ends, with the word stream and the
+        decode table kept in locals.
+        """
+        stream = segment.word_stream()
+        next_word = iter(stream).__next__
+        table = self.table
+        msp430x = self.msp430x
+        named_symbols = self.named_symbols
+        address = segment.startaddress
+        try:
+            while True:
+                opcode = next_word()
+                count = 1
+                info = table[opcode]
+                while info.kind == PREFIX:      # MSP430X extension word
+                    extension_word = opcode
+                    opcode = next_word()
+                    count += 1
+                    info = decode_extended(opcode, msp430x, extension_word)
+                kind, name, address_mode, src, dst, src_hi, dst_hi, nwords, cycles, offset, emulate = info
+                if nwords:
+                    if src is not None and '%' in src:
+                        src = src % {'x': (src_hi << 16) | next_word()}
+                    if dst is not None and '%' in dst:
+                        dst = dst % {'y': (dst_hi << 16) | next_word()}
+                    if emulate is not None:
+                        name, src, dst = emulate_operands(emulate, name, src, dst)
+                cycles += count - 1                     # prefix words
+                count += nwords
+                if kind == JUMP:
+                    insn = JumpInstruction(address, name, offset, cycles=cycles, named_symbols=named_symbols, stream=stream, count=count)
+                else:
+                    insn = Instruction(address, name, address_mode, src=src, dst=dst, cycles=cycles, named_symbols=named_symbols, stream=stream, count=count)
+                address += 2 * count
+                yield insn
+        except StopIteration:
+            return
+
+    def decode(self, segment):
+        """decode all instructions of a segment, return them as list"""
+        self.restart(segment.startaddress)
+        self.instructions = list(self.iter_decode(segment))
+        return self.instructions
+
+    def iter_instructions(self):
+        """generate the instructions of all segments in address order"""
+        for segment in sorted(self.memory.segments):
+            yield from self.iter_decode(segment)
+
+    def jump_targets(self, segment):
+        """\
+        fast pre-scan of a segment: generate the target addresses of the
+        instructions that jumps() would report, in order, using only the
+        decode table (no Instruction objects, no text formatting).
+        """
+        next_word = iter(segment.word_stream()).__next__
+        table = self.table
+        msp430x = self.msp430x
+        address = segment.startaddress
+        try:
+            while True:
+                opcode = next_word()
+                length = 1
+                info = table[opcode]
+                while info.kind == PREFIX:      # MSP430X extension word
+                    extension_word = opcode
+                    opcode = next_word()
+                    length += 1
+                    info = decode_extended(opcode, msp430x, extension_word)
+                if info.kind == JUMP:
+                    yield address + 2 + info.offset
+                else:
+                    src, dst = info.src, info.dst
+                    src_value = dst_value = None
+                    if info.words:
+                        if src is not None and '%' in src:
+                            src_value = (info.src_hi << 16) | next_word()
+                            length += 1
+                        if dst is not None and '%' in dst:
+                            dst_value = (info.dst_hi << 16) | next_word()
+                            length += 1
+                    # call #x and br #x, see Instruction.jumps()
+                    if info.name in ('call', 'br') and dst[0:1] == '#':
+                        yield dst_value if dst_value is not None else int(dst[1:], 0)
+                address += 2 * length
+        except StopIteration:
+            return
+
+
+    def disassemble(self, output, source_only=False):
+        """\
+        Iterate through the segments and disassemble. A pre-scan collects
+        the labels, then lines are formatted and written as they are decoded.
+        """
+        segments = sorted(self.memory.segments)
+        for segment in segments:
+            for l_adr in self.jump_targets(segment):
+                if l_adr not in self.labels:
+                    # create a new label
+                    self.labels[l_adr] = '.L%04d' % self.label_num
+                    self.label_num += 1
+
+        write = output.write
+        unused_labels = dict(self.labels)        # work on a copy
+        for segment in segments:
+            write("%s %-7s %s" % ("; Segment starting at 0x%08x:" % (segment.startaddress,), '', '\n'))
+            for insn in self.iter_decode(segment):
+                # does this instruction jump? if so, use the label of the jump target
+                if insn.jumps():
+                    l_adr = insn.targetAddress(insn.address + 2)
+                    instext = insn.str_width_label(self.labels[l_adr])
+                    # update note with information about the values
+                    if isinstance(insn, JumpInstruction):
+                        note = ' %+d --> %s' % (insn.offset, self.adr_fmt % l_adr)
+                    else:
+                        note = ' --> %s' % (self.adr_fmt % l_adr, )
+                else:
+                    instext = str(insn)
+                    note = ''
+                # put the labels where they belong
+                label = unused_labels.pop(insn.address, None)
+                label = "%s:" % label if label is not None else ''
+                suffix = "%-36s ; ca. %d cycle%s%s\n" % (instext, insn.cycles, 's' if insn.cycles != 1 else '', note)
+                if source_only:
+                    write("%-7s %s" % (label, suffix))
+                else:
+                    bytes = ' '.join(['%04x' % x for x in insn.used_words])
+                    write("%s:  %-19s %-7s %s" % (self.adr_fmt % insn.address, bytes, label, suffix))
+                # after unconditional jumps, make an empty line
+                if insn.ends_a_block():
+                    write("%s %-7s %s" % ('', '', '\n'))
+        # if there are labels left, print them in a list
+        if unused_labels:
+            write("\nLabels that could not be placed:\n")
+            for address, label in unused_labels.items():
+                write("    %s = 0x%04x\n" % (label, address))
+
+
+_kind_arrays = {}
+
+def kind_arrays(msp430x=False):
+    """the kind and operand word count columns of the decode table as numpy arrays"""
+    arrays = _kind_arrays.get(msp430x)
+    if arrays is None:
+        table = decode_table(msp430x)
+        arrays = _kind_arrays[msp430x] = (
+                numpy.fromiter((info.kind for info in table), dtype=numpy.uint8, count=len(table)),
+                numpy.fromiter((info.words for info in table), dtype=numpy.uint8, count=len(table)))
+    return arrays
+
+
+class BulkDecoder(object):
+    """\
+    Classify all words of a segment at once with numpy. The segment data is
+    viewed as little endian 16 bit words without copying (a trailing odd byte
+    is ignored), kinds and instruction lengths are looked up for every word
+    position, and a linear sweep over the lengths finds the instruction
+    starts. Instruction objects are only built for the address ranges asked
+    for.
+    """
+    def __init__(self, segment, msp430x=False):
+        if numpy is None:
+            raise RuntimeError('bulk decoding needs numpy')
+        self.segment = segment
+        self.msp430x = msp430x
+        self.startaddress = segment.startaddress
+        self.words = numpy.frombuffer(segment.data, dtype='<u2', count=len(segment.data) // 2)
+        kinds, operand_words = kind_arrays(msp430x)
+        self.kinds = kinds[self.words]
+        self.lengths = operand_words[self.words].astype(numpy.intp) + 1
+        # an extension word belongs to the instruction after it (which may be prefixed again)
+        prefixes = numpy.flatnonzero(self.kinds == PREFIX)
+        prefixes = prefixes[prefixes + 1 < len(self.words)]
+        while len(prefixes):
+            lengths = self.lengths[prefixes + 1] + 1
+            changed = lengths != self.lengths[prefixes]
+            if not changed.any():
+                break
+            self.lengths[prefixes] = lengths
+            prefixes = prefixes[changed]
+        self.starts = self._sweep()
+
+    def _sweep(self):
+        """word indices where instructions start, as a linear sweep would find them"""
+        lengths = self.lengths.tolist()
+        end = len(lengths)
+        starts = []
+        i = 0
+        while i < end and i + lengths[i] <= end:  # partial instructions at the end are dropped
+            starts.append(i)
+            i += lengths[i]
+        return numpy.array(starts, dtype=numpy.intp)
+
+    def instruction_kinds(self):
+        """kind of each instruction, in address order"""
+        return self.kinds[self.starts]
+
+    def summary(self):
+        """number of instructions per kind name"""
+        counts = numpy.bincount(self.instruction_kinds(), minlength=len(KIND_NAMES))
+        return dict(zip(KIND_NAMES, counts.tolist()))
+
+    def addresses(self, kind=None):
+        """start addresses of all instructions, or of those of one kind"""
+        starts = self.starts if kind is None else self.starts[self.instruction_kinds() == kind]
+        return self.startaddress + 2 * starts
+
+    def instructions(self, start=None, end=None, named_symbols=None):
+        """decode the instructions starting in [start, end) into Instruction objects"""
+        first = 0 if start is None else numpy.searchsorted(self.starts, (start - self.startaddress + 1) // 2)
+        last = len(self.starts) if end is None else numpy.searchsorted(self.starts, (end - self.startaddress + 1) // 2)
+        if first >= last:
+            return []
+        offset = int(self.starts[first])
+        stop = int(self.starts[last - 1] + self.lengths[self.starts[last - 1]])
+        part = memory.Segment(self.startaddress + 2 * offset, self.segment.data[2 * offset:2 * stop])
+        dis = MSP430Disassembler(memory.Memory([part]), msp430x=self.msp430x, named_symbols=named_symbols)
+        return dis.decode(part)
+
+
+# control flow of the decoded instructions
+NEXT, CALL, BRANCH, JUMP_TO, STOP = range(5)
+FLOW_NAMES = {
+    'call': CALL, 'callx': CALL, 'calla': CALL,
+    'br': JUMP_TO, 'bra': JUMP_TO,
+    'ret': STOP, 'retx': STOP, 'reta': STOP, 'reti': STOP, 'retix': STOP,
+}
+# instructions that name the PC as destination without writing it
+PC_READ_ONLY = ('cmp', 'cmpx', 'cmpa', 'bit', 'bitx', 'tst', 'tstx', 'tsta')
+# the interrupt vectors, the last one is reset
+VECTORS = range(0xffe0, 0x10000, 2)
+
+
+class BasicBlock(object):
+    """a run of instructions only entered at the start and only left at the end"""
+    __slots__ = ('start', 'end', 'count', 'cycles', 'successors', 'calls')
+
+    def __init__(self, start, end, count, cycles, successors, calls):
+        self.start = start
+        self.end = end                  # address after the last instruction
+        self.count = count
+        self.cycles = cycles
+        self.successors = successors    # start addresses of the following blocks
+        self.calls = calls              # targets of the calls in the block
+
+    def __repr__(self):
+        return 'BasicBlock(0x%04x-0x%04x, %d cycles)' % (self.start, self.end, self.cycles)
+
+
+class ControlFlow(object):
+    """    Recursive descent over a memory image: decoding starts at the reset
+    and interrupt vectors and at the given entries, and follows jumps,
+    calls and branches with an immediate target through a worklist. Only
+    the decode table is used, no Instruction objects are built.
+
+    Afterwards, code holds one flag byte per memory byte (1 = code) for
+    each segment, instructions maps addresses to (length, cycles, flow,
+    target) and blocks maps start addresses to BasicBlocks.
+    """
+    def __init__(self, memory, msp430x=False, entries=None, vectors=VECTORS):
+        self.memory = memory
+        self.msp430x = msp430x
+        self.names = {}                 # address --> entry name
+        if entries is not None:
+            if hasattr(entries, 'items'):
+                self.names.update((address, name) for name, address in entries.items())
+            else:
+                self.names.update((address, '0x%04x' % address) for address in entries)
+        for vector in vectors or ():
+            address = self.read_word(vector)
+            if address is not None and address not in (0, 0xffff):
+                self.names.setdefault(address, 'reset' if vector == 0xfffe else 'vector_%04x' % vector)
+        self.segments = sorted(memory.segments)
+        self.code = {segment.startaddress: bytearray(len(segment)) for segment in self.segments}
+        self.instructions = {}
+        self.leaders = set()
+        self.functions = set()          # call targets
+        self.invalid = set()            # addresses where decoding hit an illegal instruction
+        self._explore(list(self.names))
+        self.blocks = self._blocks()
+
+    def read_word(self, address):
+        """the word at address, None if it is not in memory"""
+        segment = self.memory.segment_at(address)
+        if segment is None or address + 1 not in segment:
+            return None
+        offset = address - segment.startaddress
+        return segment.data[offset] | (segment.data[offset + 1] << 8)
+
+    def _explore(self, worklist):
+        table = decode_table(self.msp430x)
+        msp430x = self.msp430x
+        starts = [segment.startaddress for segment in self.segments]
+        streams = [segment.word_stream().words for segment in self.segments]
+        instructions = self.instructions
+        leaders = self.leaders
+        while worklist:
+            address = worklist.pop()
+            if address in instructions:         # a target inside decoded code splits its block
+                leaders.add(address)
+                continue
+            if address & 1:
+                continue
+            i = bisect.bisect_right(starts, address) - 1
+            if i < 0:
+                continue
+            words = streams[i]
+            base = starts[i]
+            code = self.code[base]
+            index = (address - base) // 2
+            if index >= len(words):
+                continue
+            leaders.add(address)
+            while True:
+                if address in instructions:     # ran into decoded code
+                    leaders.add(address)
+                    break
+                try:
+                    opcode = words[index]
+                    count = 1
+                    info = table[opcode]
+                    while info.kind == PREFIX:  # MSP430X extension word
+                        extension_word = opcode
+                        opcode = words[index + count]
+                        count += 1
+                        info = decode_extended(opcode, msp430x, extension_word)
+                    src_value = dst_value = None
+                    if info.words:
+                        if info.src is not None and '%' in info.src:
+                            src_value = (info.src_hi << 16) | words[index + count]
+                            count += 1
+                        if info.dst is not None and '%' in info.dst:
+                            dst_value = (info.dst_hi << 16) | words[index + count]
+                            count += 1
+                except IndexError:              # runs past the end of the segment
+                    break
+                kind, name, dst = info.kind, info.name, info.dst
+                if kind == ILLEGAL:
+                    self.invalid.add(address)
+                    break
+                target = None
+                if kind == JUMP:
+                    target = address + 2 + info.offset
+                    flow = JUMP_TO if name == 'jmp' else BRANCH
+                elif name in FLOW_NAMES:
+                    flow = FLOW_NAMES[name]
+                    if flow != STOP and dst[0:1] == '#':
+                        target = dst_value if dst_value is not None else int(dst[1:], 0)
+                elif dst == 'PC' and name not in PC_READ_ONLY:
+                    flow = STOP                 # computed jump
+                else:
+                    flow = NEXT
+                length = 2 * count
+                instructions[address] = (length, info.cycles + count - 1 - info.words, flow, target)
+                offset = address - base
+                code[offset:offset + length] = b'\x01' * length
+                if target is not None:
+                    worklist.append(target)
+                    if flow == CALL:
+                        self.functions.add(target)
+                if flow == JUMP_TO or flow == STOP:
+                    break
+                address += length
+                index += count
+                if flow == BRANCH:              # the fall through path starts a block too
+                    leaders.add(address)
+                if index >= len(words):
+                    break
+
+    def _blocks(self):
+        instructions = self.instructions
+        leaders = self.leaders
+        blocks = {}
+        for start in sorted(leaders):
+            if start not in instructions:
+                continue
+            address = start
+            count = cycles = 0
+            calls = []
+            while True:
+                length, insn_cycles, flow, target = instructions[address]
+                count += 1
+                cycles += insn_cycles
+                address += length
+                if flow == CALL and target is not None:
+                    calls.append(target)
+                if flow == BRANCH:
+                    successors = (target, address)
+                    break
+                if flow == JUMP_TO:
+                    successors = (target,) if target is not None else ()
+                    break
+                if flow == STOP:
+                    successors = ()
+                    break
+                if address in leaders or address not in instructions:
+                    successors = (address,) if address in instructions else ()
+                    break
+            blocks[start] = BasicBlock(start, address, count, cycles,
+                    tuple(successor for successor in successors if successor in instructions), tuple(calls))
+        return blocks
+
+    def is_code(self, address):
+        segment = self.memory.segment_at(address)
+        return segment is not None and bool(self.code[segment.startaddress][address - segment.startaddress])
+
+    def code_size(self):
+        """number of bytes decoded as code"""
+        return sum(code.count(1) for code in self.code.values())
+
+    def data_ranges(self):
+        """generate (start, end) address ranges that were not reached as code"""
+        for base, code in sorted(self.code.items()):
+            offset = code.find(0)
+            while offset >= 0:
+                end = code.find(1, offset)
+                if end < 0:
+                    end = len(code)
+                yield base + offset, base + end
+                offset = code.find(0, end)
+
+    def write(self, output, adr_fmt='0x%04x'):
+        """write the basic block graph, one block per line"""
+        write = output.write
+        total = sum(len(code) for code in self.code.values())
+        code_size = self.code_size()
+        write('; %d blocks, %d bytes code, %d bytes data\n' % (len(self.blocks), code_size, total - code_size))
+        for start in sorted(self.blocks):
+            block = self.blocks[start]
+            if start in self.names:
+                write('%s:\n' % (self.names[start],))
+            elif start in self.functions:
+                write('func_%04x:\n' % (start,))
+            line = '    %s-%s %5d insn%s %7d cycles' % (adr_fmt % block.start, adr_fmt % block.end,
+                    block.count, 's' if block.count != 1 else ' ', block.cycles)
+            if block.successors:
+                line += '  -> %s' % ', '.join(adr_fmt % successor for successor in block.successors)
+            if block.calls:
+                line += '  calls %s' % ', '.join(adr_fmt % target for target in block.calls)
+            write(line + '\n')
+        if self.invalid:
+            write('; illegal instructions reached at %s\n' % ', '.join(adr_fmt % address for address in sorted(self.invalid)))
+
+
+debug = False
+
+def inner_main():
+    from optparse import OptionParser
+    parser = OptionParser(usage="""\
+%prog [options] [SOURCE...]
+
+MSP430(X) disassembler.
+""")
+
+    parser.add_option("-o", "--output",
+            dest="output",
+            help="write result to given file",
+            metavar="DESTINATION")
+
+    parser.add_option("--debug",
+            dest="debug",
+            help="print debug messages",
+            default=False,
+            action='store_true')
+
+    parser.add_option("-v", "--verbose",
+            dest="verbose",
+            help="print more details",
+            default=False,
+            action='store_true')
+
+    parser.add_option("-i", "--input-format",
+            dest="input_format",
+            help="input format name (%s)" % (', '.join(memory.load_formats),),
+            default=None,
+            metavar="TYPE")
+
+    parser.add_option("--no-cache",
+            dest="cache",
+            default=True,
+            action='store_false',
+            help="do not read or write the parsed image cache of text formats")
+
+    parser.add_option("--symbols",
+            dest="symbols",
+            help="use register and bit names from a device definition file (C header or linker .cmd)",
+            default=None,
+            metavar="FILE")
+
+    parser.add_option("-x", "--msp430x",
+            action = "store_true",
+            dest = "msp430x",
+            default = False,
+            help = "Enable MSP430X instruction set")
+
+    parser.add_option("--summary",
+            dest="summary",
+            default = False,
+            action='store_true',
+            help="only count instructions per kind (needs numpy)")
+
+    parser.add_option("--flow",
+            dest="flow",
+            default = False,
+            action='store_true',
+            help="recursive descent from the vectors and entries, print the basic block graph")
+
+    parser.add_option("--entry",
+            dest="entries",
+            default=[],
+            action='append',
+            metavar="ADDRESS",
+            help="code entry point for --flow (may be given more than once)")
+
+    parser.add_option("--source",
+            dest="source",
+            default = False,
+            action='store_true',
+            help="omit hex dump, just output assembler source")
+
+    (options, args) = parser.parse_args()
+
+    if not args:
+        parser.error("missing object file name")
+
+    if options.input_format is not None and options.input_format not in memory.load_formats:
+        parser.error('Input format %s not supported.' % (options.input_format))
+
+    global debug
+    debug = options.debug
+
+    if options.symbols is not None:
+        named_symbols = NamedSymbols()
+        named_symbols.load(options.symbols)
+    else:
+        named_symbols = None
+
+    output = sys.stdout
+    if options.output:
+        output = open(options.output, 'w')
+
+    for filename in args:
+        if filename == '-':                 # get data from stdin
+            fileobj = sys.stdin.buffer
+            filename = '<stdin>'
+        elif not os.path.exists(filename):
+            sys.stderr.write('disassemble: %s: File not found\n' % (filename,))
+            sys.exit(1)
+        else:
+            fileobj = None                  # memory.load maps or caches the file
+        mem = memory.load(filename, fileobj, options.input_format, cache=options.cache)
+
+        if options.verbose:
+            output.write('%s (%d segments):\n' % (filename, len(mem)))
+
+        if options.summary:
+            for segment in sorted(mem.segments):
+                counts = BulkDecoder(segment, msp430x=options.msp430x).summary()
+                output.write('%s: 0x%08x %s\n' % (filename, segment.startaddress,
+                        ' '.join('%s=%d' % item for item in counts.items())))
+            continue
+
+        if options.flow:
+            entries = [int(entry, 0) for entry in options.entries]
+            ControlFlow(mem, msp430x=options.msp430x, entries=entries).write(
+                    output, "0x%08x" if options.msp430x else "0x%04x")
+            continue
+
+        dis = MSP430Disassembler(mem, msp430x=options.msp430x, named_symbols=named_symbols)
+        dis.disassemble(output, options.source)
+
+
+def main():
+    try:
+        inner_main()
+    except SystemExit:
+        raise                                   # let pass exit() calls
+    except KeyboardInterrupt:
+        if debug: raise                         # show full trace in debug mode
+        sys.stderr.write("User abort.\n")       # short messy in user mode
+        sys.exit(1)                             # set error level for script usage
+    except Exception as msg:                    # every Exception is caught and displayed
+        if debug: raise                         # show full trace in debug mode
+        sys.stderr.write("\nAn error occurred:\n%s\n" % msg) # short messy in user mode
+        sys.exit(1)                             # set error level for script usage
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
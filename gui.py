@@ -1,8 +1,10 @@
+import os
+import re
 import sys
 import importlib.util
-from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QTextEdit, QPlainTextEdit, QPushButton, QLabel, QFileDialog
-from PyQt5.QtGui import QFont, QTextCharFormat, QColor, QSyntaxHighlighter
-from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QTextEdit, QPlainTextEdit, QPushButton, QLabel, QFileDialog, QProgressBar, QCheckBox, QSpinBox, QTableView, QLineEdit, QHeaderView, QAbstractItemView
+from PyQt5.QtGui import QFont, QTextCharFormat, QColor, QSyntaxHighlighter, QTextFormat
+from PyQt5.QtCore import Qt, QObject, QRunnable, QThreadPool, QTimer, QAbstractTableModel, QSortFilterProxyModel, QModelIndex, QItemSelection, QItemSelectionModel, pyqtSignal
 
 # 21g.py dosyasını dinamik olarak içe aktarma
 spec = importlib.util.spec_from_file_location("msp430_assembler", "assembler.py")
@@ -10,27 +12,175 @@ msp430_assembler = importlib.util.module_from_spec(spec)
 spec.loader.exec_module(msp430_assembler)
 
 # Syntax Highlighter
+# Tüm belirteçler tek bir önceden derlenmiş desenle, tam kelime olarak eşleşir (ADD, ADDC içinde boyanmaz)
+def token_pattern():
+    def words(names):
+        return "|".join(re.escape(name) for name in sorted(names, key=len, reverse=True))
+    mnemonics = list(msp430_assembler.OPTAB) + list(msp430_assembler.EMULATED)
+    return re.compile(
+        r"(?P<comment>;.*)"
+        r"|(?P<label>^\s*[A-Za-z_.][\w.]*:)"
+        r"|(?P<immediate>#[-+]?[\w.]+)"
+        rf"|(?P<mnemonic>(?<![\w.])(?:{words(mnemonics)})(?![\w.]))"
+        rf"|(?P<register>(?<![\w.])(?:{words(msp430_assembler.REGISTERS)})(?![\w.]))"
+    )
+
+TOKEN_PATTERN = token_pattern()
+
 class Highlighter(QSyntaxHighlighter):
+    COLORS = {
+        "mnemonic": ("lightgreen", True),
+        "register": ("#9cdcfe", False),
+        "immediate": ("#ce9178", False),
+        "label": ("#dcdcaa", True),
+        "comment": ("#6a9955", False),
+    }
+
     def __init__(self, parent):
         super().__init__(parent)
-        self.format = QTextCharFormat()
-        self.format.setForeground(QColor("lightgreen"))
-        self.format.setFontWeight(QFont.Bold)
+        self.formats = {}
+        for name, (color, bold) in self.COLORS.items():
+            text_format = QTextCharFormat()
+            text_format.setForeground(QColor(color))
+            if bold:
+                text_format.setFontWeight(QFont.Bold)
+            self.formats[name] = text_format
     
     def highlightBlock(self, text):
-        keywords = ["MOV", "ADD", "SUB", "JMP", "CALL", "RET", "NOP", "ADDC", 
-                    "SUBC", "CMP", "DADD", "BIT", "BIC", "BIS", "XOR", "AND", 
-                    "RRC", "SWPB", "RRA", "SXT", "PUSH", "JNE", "JEQ", "JNC", 
-                    "JC", "JN", "JGE", "JL", "JMP", "START", "END", ".DATA", 
-                    ".CODE", ".ORG"]
-        for word in keywords:
-            if word in text:
-                self.setFormat(text.index(word), len(word), self.format)
+        for match in TOKEN_PATTERN.finditer(text):
+            self.setFormat(match.start(), match.end() - match.start(), self.formats[match.lastgroup])
+
+# Makine kodu tablosu: satırlar yalnızca görüntülendiklerinde biçimlendirilir
+class ObjectCodeModel(QAbstractTableModel):
+    HEADERS = ["Adres", "HEX", "BIN", "Çevrim", "Kaynak"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.object_code = []
+        self.object_info = []
+        self.source_lines = []
+
+    def set_image(self, object_code, object_info, source_lines):
+        self.beginResetModel()
+        self.object_code = object_code
+        self.object_info = object_info
+        self.source_lines = source_lines
+        self.endResetModel()
+
+    def set_source_lines(self, source_lines):
+        # Kaynak metni değişti ama satır yapısı ve makine kodu aynı kaldı
+        self.source_lines = source_lines
+        if self.object_code:
+            column = len(self.HEADERS) - 1
+            self.dataChanged.emit(self.index(0, column), self.index(len(self.object_code) - 1, column))
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.object_code)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.UserRole):
+            return None
+        loc, code = self.object_code[index.row()]
+        line_no, cycles = self.object_info[index.row()]
+        column = index.column()
+        if role == Qt.UserRole:  # sıralama için ham değerler
+            return (loc, code, code, cycles if cycles is not None else -1, line_no)[column]
+        if column == 0:
+            return format(loc, "04X")
+        if column == 1:
+            return format(code, "04X")
+        if column == 2:
+            return format(code, "016b")
+        if column == 3:
+            return "" if cycles is None else str(cycles)
+        return f"{line_no}: {self.source_lines[line_no - 1].strip()}"
+
+# Arka plan derleme işçisi ve sinyalleri
+class AssemblerSignals(QObject):
+    progress = pyqtSignal(int, int, int, int)  # iş no, geçiş, işlenen, toplam
+    finished = pyqtSignal(int, object, list, object)  # iş no, (makine kodu, bilgiler, kaynak satırları, kaynak haritası), [(satır, hata)], kaynak anahtarı
+    skipped = pyqtSignal(int, list)            # iş no (kaynak değişmemiş), güncel kaynak satırları
+    failed = pyqtSignal(int, str)              # iş no, hata mesajı
+
+class AssemblyCancelled(Exception):
+    pass
+
+class AssemblerWorker(QRunnable):
+    PROGRESS_STEP = 256  # her satırda sinyal göndermemek için
+
+    def __init__(self, job_id, assembly_code, previous_key=None, save=True):
+        super().__init__()
+        self.job_id = job_id
+        self.assembly_code = assembly_code
+        self.previous_key = previous_key
+        self.save = save
+        self.signals = AssemblerSignals()
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def report(self, pass_no):
+        def progress(done, total):
+            if self.cancelled:
+                raise AssemblyCancelled()
+            if done % self.PROGRESS_STEP == 0 or done == total:
+                self.signals.progress.emit(self.job_id, pass_no, done, total)
+        return progress
+
+    def source_key(self):
+        # Yorum ve boşluk değişiklikleri derlemeyi etkilemez; satır yapısı anahtarda kalır,
+        # satır ekleyen ya da silen her değişiklik yeniden derlenir
+        return "\n".join([" ".join(line.split(";")[0].split()) for line in self.assembly_code.splitlines()])
+
+    def run(self):
+        # assembler modülü global durum kullandığı için işler tek iş parçacıklı havuzda sırayla çalışır
+        if self.cancelled:
+            return
+        try:
+            key = self.source_key()
+            if key == self.previous_key:
+                self.signals.skipped.emit(self.job_id, self.assembly_code.splitlines())
+                return
+            msp430_assembler.reset()
+            msp430_assembler.pass1(self.assembly_code, self.report(1))
+            if msp430_assembler.errors:
+                errors = list(zip(msp430_assembler.error_lines, msp430_assembler.errors))
+                self.signals.finished.emit(self.job_id, None, errors, key)
+                return
+            msp430_assembler.pass2(self.report(2))
+            image = (list(msp430_assembler.object_code), list(msp430_assembler.object_info), self.assembly_code.splitlines(), msp430_assembler.source_map)
+            if self.cancelled:
+                return
+            if self.save:
+                msp430_assembler.save_object_code("output.hex")
+            self.signals.finished.emit(self.job_id, image, [], key)
+        except AssemblyCancelled:
+            pass
+        except Exception as e:
+            self.signals.failed.emit(self.job_id, str(e))
 
 # Ana GUI sınıfı
 class AssemblerGUI(QWidget):
     def __init__(self):
         super().__init__()
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(1)
+        self.job_id = 0
+        self.worker = None
+        self.last_key = None
+        self.source_map = None
+        self.live_timer = QTimer(self)
+        self.live_timer.setSingleShot(True)
+        self.live_timer.timeout.connect(self.live_assemble)
         self.initUI()
     
     def initUI(self):
@@ -43,7 +193,7 @@ class AssemblerGUI(QWidget):
                 font-family: Consolas, monospace;
                 font-size: 12px;
             }
-            QPlainTextEdit, QTextEdit {
+            QPlainTextEdit, QTextEdit, QTableView, QLineEdit {
                 background-color: #3e3e3e;
                 border: 1px solid #555;
                 color: #f0f0f0;
@@ -78,6 +228,26 @@ class AssemblerGUI(QWidget):
         self.button_assemble = QPushButton("Derle")
         self.button_assemble.clicked.connect(self.assemble_code)
         left_layout.addWidget(self.button_assemble)
+
+        # Canlı derleme: son tuşa basıştan belirli bir süre sonra arka planda derle
+        live_layout = QHBoxLayout()
+        self.check_live = QCheckBox("Canlı derleme")
+        self.check_live.toggled.connect(self.toggle_live)
+        live_layout.addWidget(self.check_live)
+        self.spin_delay = QSpinBox()
+        self.spin_delay.setRange(50, 5000)
+        self.spin_delay.setSingleStep(50)
+        self.spin_delay.setValue(400)
+        self.spin_delay.setSuffix(" ms")
+        live_layout.addWidget(self.spin_delay)
+        left_layout.addLayout(live_layout)
+        self.text_code.textChanged.connect(self.schedule_live_assemble)
+        self.text_code.cursorPositionChanged.connect(self.select_line_words)
+
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setFormat("Hazır")
+        self.progress_bar.setValue(0)
+        left_layout.addWidget(self.progress_bar)
         
         self.save_button = QPushButton("Kaydet")
         self.save_button.clicked.connect(self.save_code)
@@ -86,6 +256,10 @@ class AssemblerGUI(QWidget):
         self.load_button = QPushButton("Yükle")
         self.load_button.clicked.connect(self.load_code)
         left_layout.addWidget(self.load_button)
+
+        self.device_button = QPushButton("Cihaz Tanımı")  # &P1OUT gibi register adları için
+        self.device_button.clicked.connect(self.load_device)
+        left_layout.addWidget(self.device_button)
         
         main_layout.addLayout(left_layout, 1)  # sol sütun esneklik kazansın
 
@@ -93,9 +267,26 @@ class AssemblerGUI(QWidget):
         right_layout = QVBoxLayout()
         self.label_result = QLabel("Makine Kodu:")
         right_layout.addWidget(self.label_result)
-        self.text_result = QTextEdit()
-        self.text_result.setReadOnly(True)
-        right_layout.addWidget(self.text_result, 1)  # sonuç alanı genişleyebilsin
+        self.filter_result = QLineEdit()
+        self.filter_result.setPlaceholderText("Filtrele...")
+        right_layout.addWidget(self.filter_result)
+        self.result_model = ObjectCodeModel(self)
+        self.result_proxy = QSortFilterProxyModel(self)
+        self.result_proxy.setSourceModel(self.result_model)
+        self.result_proxy.setSortRole(Qt.UserRole)
+        self.result_proxy.setFilterKeyColumn(-1)  # tüm sütunlarda ara
+        self.result_proxy.setFilterCaseSensitivity(Qt.CaseInsensitive)
+        self.filter_result.textChanged.connect(self.result_proxy.setFilterFixedString)
+        self.table_result = QTableView()
+        self.table_result.setModel(self.result_proxy)
+        self.table_result.setSortingEnabled(True)
+        self.table_result.sortByColumn(-1, Qt.AscendingOrder)  # başlangıçta derleme sırası
+        self.table_result.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table_result.verticalHeader().setVisible(False)
+        self.table_result.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)  # satır yüksekliği ölçülmez
+        self.table_result.horizontalHeader().setStretchLastSection(True)
+        self.table_result.clicked.connect(self.jump_to_source)
+        right_layout.addWidget(self.table_result, 1)  # sonuç alanı genişleyebilsin
         
         self.label_errors = QLabel("Hatalar:")
         right_layout.addWidget(self.label_errors)
@@ -109,23 +300,116 @@ class AssemblerGUI(QWidget):
     
     def assemble_code(self):
         # Her derlemeden önce çıktıları temizle
-        self.text_result.clear()
+        self.result_model.set_image([], [], [])
+        self.source_map = None
         self.text_errors.clear()
-        msp430_assembler.SYMTAB.clear()
+        self.start_worker(AssemblerWorker(self.job_id + 1, self.text_code.toPlainText()))
 
-        assembly_code = self.text_code.toPlainText()
-        object_code, errors = self.assemble(assembly_code)
-        self.text_result.setPlainText(object_code)
-        self.text_errors.setPlainText(errors)
-    
-    def assemble(self, assembly_code):
-        msp430_assembler.pass1(assembly_code)
-        if msp430_assembler.errors:
-            return "", "\n".join(msp430_assembler.errors)
-        msp430_assembler.pass2()
-        output = "\n".join([f"ADDR: {format(loc, 'X')} | HEX: {format(code, 'X')} | BIN: {bin(code)[2:].zfill(16)}" for loc, code in msp430_assembler.object_code])
-        msp430_assembler.save_object_code("output.hex")
-        return output, ""
+    def start_worker(self, worker):
+        # Çalışan derlemeyi iptal et, sıradakileri at; yeni istek eskisinin yerini alır
+        if self.worker:
+            self.worker.cancel()
+            self.mark_error_lines([])  # iptal edilen derlemenin işaretleri artık geçerli değil
+        self.pool.clear()
+
+        self.job_id = worker.job_id
+        self.worker = worker
+        self.worker.signals.progress.connect(self.on_progress)
+        self.worker.signals.finished.connect(self.on_finished)
+        self.worker.signals.skipped.connect(self.on_skipped)
+        self.worker.signals.failed.connect(self.on_failed)
+        self.progress_bar.setFormat("Derleniyor...")
+        self.pool.start(self.worker)
+
+    def toggle_live(self, enabled):
+        if enabled:
+            self.schedule_live_assemble()
+        else:
+            self.live_timer.stop()
+
+    def schedule_live_assemble(self):
+        if self.check_live.isChecked():
+            self.live_timer.start(self.spin_delay.value())
+
+    def live_assemble(self):
+        self.start_worker(AssemblerWorker(self.job_id + 1, self.text_code.toPlainText(), self.last_key, save=False))
+
+    def on_progress(self, job_id, pass_no, done, total):
+        if job_id != self.job_id:
+            return
+        self.progress_bar.setMaximum(max(total, 1))
+        self.progress_bar.setValue(done)
+        self.progress_bar.setFormat(f"Geçiş {pass_no}: %v / %m satır")
+
+    def on_finished(self, job_id, image, errors, key):
+        if job_id != self.job_id:
+            return
+        self.worker = None
+        self.last_key = key
+        self.progress_bar.setFormat("Tamamlandı" if not errors else "Hatalı")
+        object_code, object_info, source_lines, self.source_map = image or ([], [], [], None)
+        self.result_model.set_image(object_code, object_info, source_lines)
+        self.text_errors.setPlainText("\n".join([f"Satır {line_no}: {message}" if line_no else message for line_no, message in errors]))
+        self.mark_error_lines(errors)
+
+    def jump_to_source(self, proxy_index):
+        # Makine kodu satırına tıklanınca ilgili kaynak satırına git
+        if not self.source_map:
+            return
+        loc, code = self.result_model.object_code[self.result_proxy.mapToSource(proxy_index).row()]
+        line_no = self.source_map.line_for_address(loc)
+        if not line_no:
+            return
+        cursor = self.text_code.textCursor()
+        cursor.setPosition(self.text_code.document().findBlockByNumber(line_no - 1).position())
+        self.text_code.setTextCursor(cursor)
+        self.text_code.centerCursor()
+
+    def select_line_words(self):
+        # Seçili kaynak satırının ürettiği kelimeleri tabloda işaretle
+        if not self.source_map:
+            return
+        rows = self.source_map.word_indices(self.text_code.textCursor().blockNumber() + 1)
+        selection = QItemSelection()
+        for row in rows:
+            proxy_index = self.result_proxy.mapFromSource(self.result_model.index(row, 0))
+            if proxy_index.isValid():
+                selection.select(proxy_index, proxy_index.siblingAtColumn(self.result_model.columnCount() - 1))
+        self.table_result.selectionModel().select(selection, QItemSelectionModel.ClearAndSelect)
+        if not selection.isEmpty():
+            self.table_result.scrollTo(selection.indexes()[0])
+
+    def on_skipped(self, job_id, source_lines):
+        if job_id != self.job_id:
+            return
+        self.worker = None
+        self.result_model.set_source_lines(source_lines)  # yorumlar değişmiş olabilir
+        self.progress_bar.setFormat("Değişiklik yok")
+
+    def mark_error_lines(self, errors, limit=500):
+        # Hatalı satırları editör içinde işaretle
+        selections = []
+        document = self.text_code.document()
+        for line_no, message in errors[:limit]:
+            if not line_no:
+                continue
+            selection = QTextEdit.ExtraSelection()
+            selection.format.setBackground(QColor("#6b2020"))
+            selection.format.setProperty(QTextFormat.FullWidthSelection, True)
+            selection.format.setToolTip(message)
+            selection.cursor = self.text_code.textCursor()
+            selection.cursor.setPosition(document.findBlockByNumber(line_no - 1).position())
+            selections.append(selection)
+        self.text_code.setExtraSelections(selections)
+
+    def on_failed(self, job_id, message):
+        if job_id != self.job_id:
+            return
+        self.worker = None
+        self.last_key = None
+        self.progress_bar.setFormat("Hatalı")
+        self.text_errors.setPlainText(message)
+        self.mark_error_lines([])
     
     def save_code(self):
         filename, _ = QFileDialog.getSaveFileName(self, "Kod Kaydet", "", "Assembly Files (*.asm);;All Files (*)")
@@ -139,8 +423,21 @@ class AssemblerGUI(QWidget):
             with open(filename, "r") as file:
                 self.text_code.setPlainText(file.read())
 
+    def load_device(self):
+        filename, _ = QFileDialog.getOpenFileName(self, "Cihaz Tanımı Yükle", "", "Device Files (*.h *.cmd);;All Files (*)")
+        if filename:
+            try:
+                msp430_assembler.load_peripherals(filename)
+            except (OSError, ValueError) as e:
+                self.text_errors.setPlainText(str(e))
+                return
+            self.last_key = None  # kaynak aynı olsa da yeniden derlenmeli
+            self.device_button.setText(f"Cihaz: {os.path.basename(filename)}")
+
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     gui = AssemblerGUI()
     gui.show()
-    sys.exit(app.exec_())
+    exit_code = app.exec_()
+    gui.pool.waitForDone()
+    sys.exit(exit_code)
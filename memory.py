@@ -0,0 +1,358 @@
+"""\
+Memory images for the disassembler: a list of segments, each a start
+address and its bytes. Replaces the msp430.memory module the original
+disassembler imported.
+
+Raw binaries are memory mapped. Text formats (the assembler's object
+listing, Intel HEX and TI-TXT) are parsed once into a binary sidecar file
+next to the image, which is then mapped like a raw binary on later loads.
+"""
+
+import bisect
+import mmap
+import os
+import stat as stat_module
+import struct
+import sys
+import tempfile
+from array import array
+
+
+class WordStream(object):
+    """\
+    Random access to the 16 bit little endian words of a block of bytes.
+    On little endian hosts the bytes are only cast, not copied; otherwise
+    (and for an odd number of bytes, whose last word gets a zero high byte)
+    they are copied once into an array('H').
+    """
+    def __init__(self, data, startaddress=0):
+        self.startaddress = startaddress
+        if sys.byteorder == 'little' and len(data) % 2 == 0:
+            self.words = memoryview(data).cast('B').cast('H')
+        else:
+            self.words = array('H')
+            self.words.frombytes(bytes(data) + b'\0' * (len(data) % 2))
+            if sys.byteorder != 'little':
+                self.words.byteswap()
+
+    def __len__(self):
+        return len(self.words)
+
+    def __getitem__(self, index):
+        return self.words[index]
+
+    def __iter__(self):
+        return iter(self.words)
+
+    def index(self, address):
+        """word index of an address in this stream"""
+        if address & 1 or not 0 <= address - self.startaddress < 2 * len(self.words):
+            raise IndexError('address 0x%04x not in stream' % (address,))
+        return (address - self.startaddress) // 2
+
+    def word_at(self, address):
+        return self.words[self.index(address)]
+
+    def iter_from(self, address):
+        """iterate over the words from address to the end of the stream"""
+        return iter(self.words[self.index(address):])
+
+
+class Segment(object):
+    """\
+    a contiguous block of memory. data is any bytes-like object; images
+    opened with load() hold read-only memoryviews into a mapped file.
+    """
+    def __init__(self, startaddress=0, data=None):
+        self.startaddress = startaddress
+        self.data = bytearray() if data is None else data
+
+    def __len__(self):
+        return len(self.data)
+
+    def __lt__(self, other):
+        return self.startaddress < other.startaddress
+
+    def __contains__(self, address):
+        return 0 <= address - self.startaddress < len(self.data)
+
+    def word_stream(self):
+        return WordStream(self.data, self.startaddress)
+
+    def __repr__(self):
+        return 'Segment(startaddress=0x%04x, data=<%d bytes>)' % (self.startaddress, len(self.data))
+
+
+class Memory(object):
+    """\
+    a collection of segments, kept sorted by start address with the start
+    addresses alongside in starts; add segments with add()
+    """
+    def __init__(self, segments=None):
+        self.segments = sorted(segments or [])
+        self.starts = [segment.startaddress for segment in self.segments]
+
+    def __len__(self):
+        return len(self.segments)
+
+    def __iter__(self):
+        return iter(self.segments)
+
+    def add(self, segment):
+        i = bisect.bisect_right(self.starts, segment.startaddress)
+        self.starts.insert(i, segment.startaddress)
+        self.segments.insert(i, segment)
+
+    def segment_at(self, address):
+        """the segment holding address, None if there is none"""
+        i = bisect.bisect_right(self.starts, address) - 1
+        if i >= 0 and address in self.segments[i]:
+            return self.segments[i]
+        return None
+
+
+def from_object_code(object_code):
+    """build a memory image from (address, word) pairs as produced by
+    assembler.pass2(). Later words win, contiguous words share a segment."""
+    words = {}
+    for address, word in object_code:
+        words[address] = word & 0xffff
+    memory = Memory()
+    segment = None
+    for address in sorted(words):
+        if segment is None or segment.startaddress + len(segment) != address:
+            segment = Segment(address)
+            memory.add(segment)
+        segment.data += words[address].to_bytes(2, 'little')
+    return memory
+
+
+def merge_chunks(chunks):
+    """turn (address, bytes) chunks into a memory image, joining contiguous
+    chunks into one segment. Later chunks win where they overlap."""
+    memory = Memory()
+    segment = None
+    for address, data in sorted(chunks, key=lambda chunk: chunk[0]):
+        if segment is not None and address <= segment.startaddress + len(segment):
+            offset = address - segment.startaddress
+            segment.data[offset:offset + len(data)] = data
+        else:
+            segment = Segment(address, bytearray(data))
+            memory.add(segment)
+    return memory
+
+
+def load_object(lines):
+    """read the assembler's output.hex format: '0x1002: 0x4203' per line"""
+    object_code = []
+    for line_no, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            address, word = line.split(':')
+            object_code.append((int(address, 16), int(word, 16)))
+        except ValueError:
+            raise ValueError('line %d: not an object code line: %r' % (line_no, line))
+    return from_object_code(object_code)
+
+
+def load_ihex(lines):
+    """read Intel HEX records (data, end of file and address extensions)"""
+    chunks = []
+    base = 0
+    for line_no, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            if line[0:1] != ':':
+                raise ValueError('record does not start with ":"')
+            record = bytes.fromhex(line[1:])
+            length, address, kind = record[0], (record[1] << 8) | record[2], record[3]
+            if len(record) != length + 5:
+                raise ValueError('record length mismatch')
+            if sum(record) & 0xff:
+                raise ValueError('checksum error')
+        except ValueError as e:
+            raise ValueError('line %d: %s: %r' % (line_no, e, line))
+        data = record[4:-1]
+        if kind == 0x00:        # data
+            chunks.append((base + address, data))
+        elif kind == 0x01:      # end of file
+            break
+        elif kind == 0x02:      # extended segment address
+            base = int.from_bytes(data, 'big') << 4
+        elif kind == 0x04:      # extended linear address
+            base = int.from_bytes(data, 'big') << 16
+        # 0x03 and 0x05 (start address) do not carry memory contents
+    return merge_chunks(chunks)
+
+
+def load_titxt(lines):
+    """read TI-TXT: '@ADDR' lines followed by lines of hex bytes, 'q' ends"""
+    chunks = []
+    address = None
+    data = bytearray()
+    for line_no, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            if line[0] == '@':
+                if data:
+                    chunks.append((address, data))
+                address = int(line[1:], 16)
+                data = bytearray()
+            elif line[0] in 'qQ':
+                break
+            elif address is None:
+                raise ValueError('data before first address')
+            else:
+                data += bytes.fromhex(line)
+        except ValueError as e:
+            raise ValueError('line %d: %s: %r' % (line_no, e, line))
+    if data:
+        chunks.append((address, data))
+    return merge_chunks(chunks)
+
+
+def load_bin(fileobj, startaddress=0):
+    """\
+    read a raw binary image. files on disk are memory mapped read-only and
+    the segment holds a memoryview of the mapping, nothing is read up front.
+    """
+    try:
+        fileno = fileobj.fileno()
+        stat = os.fstat(fileno)
+        if stat_module.S_ISREG(stat.st_mode) and stat.st_size:  # empty files can not be mapped
+            return Memory([Segment(startaddress, memoryview(mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)))])
+    except (AttributeError, OSError, ValueError):   # in-memory files...
+        pass
+    return Memory([Segment(startaddress, fileobj.read())])    # pipes, empty files
+
+
+text_loaders = {
+    'object': load_object,
+    'ihex': load_ihex,
+    'titxt': load_titxt,
+}
+
+load_formats = ['object', 'ihex', 'titxt', 'bin']
+
+
+# sidecar: magic, source size and mtime, segment count, (start, length)
+# per segment, then the segment data back to back
+SIDECAR_SUFFIX = '.segcache'
+SIDECAR_MAGIC = b'MSPSEG01'
+SIDECAR_HEADER = struct.Struct('<8sQqI')
+SIDECAR_SEGMENT = struct.Struct('<QQ')
+
+
+def sidecar_name(filename, format):
+    return '%s.%s%s' % (filename, format, SIDECAR_SUFFIX)
+
+
+def write_sidecar(filename, format, memory, stat):
+    """\
+    store a parsed image; stat is the source's os.stat() from before it was
+    parsed, so a source changed meanwhile leaves a stale sidecar that is
+    not used. Failing to write the cache is not an error.
+    """
+    segments = memory.segments
+    name = sidecar_name(filename, format)
+    tmp_name = None
+    try:
+        fd, tmp_name = tempfile.mkstemp(dir=os.path.dirname(name) or '.',
+                                        prefix=os.path.basename(name), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(SIDECAR_HEADER.pack(SIDECAR_MAGIC, stat.st_size, stat.st_mtime_ns, len(segments)))
+            for segment in segments:
+                f.write(SIDECAR_SEGMENT.pack(segment.startaddress, len(segment)))
+            for segment in segments:
+                f.write(segment.data)
+        os.replace(tmp_name, name)
+    except OSError:
+        if tmp_name is not None:
+            try:
+                os.unlink(tmp_name)
+            except OSError:
+                pass
+
+
+def read_sidecar(filename, format):
+    """map a sidecar that is up to date with its source, None otherwise"""
+    try:
+        stat = os.stat(filename)
+        with open(sidecar_name(filename, format), 'rb') as f:
+            data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    except (OSError, ValueError):
+        return None
+    if len(data) < SIDECAR_HEADER.size:
+        return None
+    magic, size, mtime_ns, count = SIDECAR_HEADER.unpack_from(data)
+    if magic != SIDECAR_MAGIC or size != stat.st_size or mtime_ns != stat.st_mtime_ns:
+        return None
+    memory = Memory()
+    offset = SIDECAR_HEADER.size + count * SIDECAR_SEGMENT.size
+    try:
+        for i in range(count):
+            startaddress, length = SIDECAR_SEGMENT.unpack_from(data, SIDECAR_HEADER.size + i * SIDECAR_SEGMENT.size)
+            memory.add(Segment(startaddress, data[offset:offset + length]))
+            offset += length
+    except struct.error:
+        return None
+    if offset != len(data):
+        return None
+    return memory
+
+
+def guess_format(filename, fileobj=None):
+    """guess the format from the extension, text files from their first character"""
+    if os.path.splitext(filename)[1].lower() == '.bin':
+        return 'bin'
+    if fileobj is None:
+        with open(filename, 'rb') as f:
+            head = f.read(64)
+    elif hasattr(fileobj, 'peek'):
+        head = fileobj.peek(64)
+    else:
+        return 'object'
+    head = head.lstrip()
+    if head[0:1] == b':':
+        return 'ihex'
+    if head[0:1] == b'@':
+        return 'titxt'
+    return 'object'
+
+
+def load(filename, fileobj=None, format=None, cache=True):
+    """\
+    load a memory image from a file, the format is guessed if not given.
+    fileobj (e.g. stdin) is read directly, without mapping or caching.
+    """
+    if format is None:
+        format = guess_format(filename, fileobj)
+    if format not in load_formats:
+        raise ValueError('unsupported file format %r' % (format,))
+    if fileobj is not None:
+        if format == 'bin':
+            return load_bin(fileobj)
+        lines = fileobj
+        if isinstance(fileobj.read(0), bytes):   # e.g. binary stdin
+            lines = (line.decode('ascii') for line in fileobj)
+        return text_loaders[format](lines)
+
+    if format == 'bin':
+        with open(filename, 'rb') as f:
+            return load_bin(f)
+    if cache:
+        memory = read_sidecar(filename, format)
+        if memory is not None:
+            return memory
+        stat = os.stat(filename)
+    with open(filename, 'r') as f:
+        memory = text_loaders[format](f)
+    if cache:
+        write_sidecar(filename, format, memory, stat)
+    return memory
@@ -0,0 +1,302 @@
+"""\
+Peripheral register and bit names of a device, for the disassembler
+(NamedSymbols) and the assembler (&NAME operands). Replaces the
+msp430.asm.peripherals module the original disassembler imported.
+
+Definitions are read from a TI C header (SFR_8BIT(P1OUT) / sfrb(P1OUT,
+P1OUT_) declarations with #define'd addresses, the defines after a register
+are its bits and named values) or from a linker .cmd file (NAME = 0x0021;
+addresses only). They are parsed once into a binary sidecar file next to
+the definition file, later loads only read its index arrays.
+"""
+
+import ast
+import bisect
+import os
+import re
+import struct
+import sys
+import tempfile
+from array import array
+
+
+class Peripherals(object):
+    """\
+    registers indexed by address and by name. For register i (in address
+    order) its bits are bit_masks/bit_names[bit_start[i]:bit_start[i + 1]],
+    sorted by mask, and its named values likewise from value_start.
+    """
+    def __init__(self, names, addresses, name_index, by_name, bit_start, bit_masks, bit_names,
+                 value_start, values, value_names):
+        self.names = names                  # string table
+        self.addresses = addresses          # sorted
+        self.name_index = name_index        # register --> string
+        self.by_name = by_name              # registers sorted by name
+        self.sorted_names = [names[name_index[r]] for r in by_name]    # their names, to bisect
+        self.bit_start = bit_start
+        self.bit_masks = bit_masks
+        self.bit_names = bit_names
+        self.value_start = value_start
+        self.values = values
+        self.value_names = value_names
+
+    @classmethod
+    def from_definitions(cls, registers, bits=None, values=None):
+        """\
+        build the index from {name: address}, {register: {mask: name}} and
+        {register: {value: name}}. Registers sharing an address are found
+        by address in the order they were defined.
+        """
+        bits = bits or {}
+        values = values or {}
+        names = []
+        strings = {}
+
+        def string(name):
+            if name not in strings:
+                strings[name] = len(names)
+                names.append(name)
+            return strings[name]
+
+        order = sorted(registers, key=lambda name: registers[name])   # stable: definition order
+        addresses = array('I', [registers[name] for name in order])
+        name_index = array('I', [string(name) for name in order])
+        by_name = array('I', sorted(range(len(order)), key=lambda i: order[i]))
+        bit_start, bit_masks, bit_names = array('I', [0]), array('I'), array('I')
+        value_start, value_list, value_names = array('I', [0]), array('I'), array('I')
+        for name in order:
+            for mask, bit in sorted(bits.get(name, {}).items()):
+                bit_masks.append(mask)
+                bit_names.append(string(bit))
+            bit_start.append(len(bit_masks))
+            for value, value_name in sorted(values.get(name, {}).items()):
+                value_list.append(value)
+                value_names.append(string(value_name))
+            value_start.append(len(value_list))
+        return cls(names, addresses, name_index, by_name, bit_start, bit_masks, bit_names,
+                   value_start, value_list, value_names)
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def _index(self, name):
+        """register index of a name, None if unknown"""
+        i = bisect.bisect_left(self.sorted_names, name)
+        if i < len(self.sorted_names) and self.sorted_names[i] == name:
+            return self.by_name[i]
+        return None
+
+    def address_of(self, name):
+        """address of a register, None if unknown"""
+        i = self._index(name)
+        return self.addresses[i] if i is not None else None
+
+    def name_at(self, address):
+        """name of the (first) register at address, None if there is none"""
+        i = bisect.bisect_left(self.addresses, address)
+        if i < len(self.addresses) and self.addresses[i] == address:
+            return self.names[self.name_index[i]]
+        return None
+
+    def bits(self, name):
+        """(mask, bit name) pairs of a register, sorted by mask"""
+        i = self._index(name)
+        if i is None:
+            return []
+        start, end = self.bit_start[i], self.bit_start[i + 1]
+        return [(self.bit_masks[j], self.names[self.bit_names[j]]) for j in range(start, end)]
+
+    def value_name(self, name, value):
+        """the name of a value of a register, None if it has none"""
+        i = self._index(name)
+        if i is None:
+            return None
+        start, end = self.value_start[i], self.value_start[i + 1]
+        j = bisect.bisect_left(self.values, value, start, end)
+        if j < end and self.values[j] == value:
+            return self.names[self.value_names[j]]
+        return None
+
+    def registers(self):
+        """generate (name, address) in address order"""
+        for i, address in enumerate(self.addresses):
+            yield self.names[self.name_index[i]], address
+
+
+# C integer expressions of the headers: numbers, names, + - * << >> | & ~
+NUMBER_SUFFIX = re.compile(r'\b(0[xX][0-9a-fA-F]+|\d+)[uUlL]+\b')
+OPERATORS = {
+    ast.Add: lambda a, b: a + b, ast.Sub: lambda a, b: a - b, ast.Mult: lambda a, b: a * b,
+    ast.LShift: lambda a, b: a << b, ast.RShift: lambda a, b: a >> b,
+    ast.BitOr: lambda a, b: a | b, ast.BitAnd: lambda a, b: a & b,
+}
+
+
+def evaluate(expression, names):
+    """value of a C constant expression, names are earlier defines. ValueError if it is none"""
+    def value(node):
+        if isinstance(node, ast.Constant) and isinstance(node.value, int):
+            return node.value
+        if isinstance(node, ast.Name) and node.id in names:
+            return names[node.id]
+        if isinstance(node, ast.BinOp) and type(node.op) in OPERATORS:
+            return OPERATORS[type(node.op)](value(node.left), value(node.right))
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.Invert)):
+            return -value(node.operand) if isinstance(node.op, ast.USub) else ~value(node.operand)
+        raise ValueError('not a constant: %r' % (expression,))
+    try:
+        return value(ast.parse(NUMBER_SUFFIX.sub(r'\1', expression), mode='eval').body)
+    except SyntaxError:
+        raise ValueError('not a constant: %r' % (expression,))
+
+
+COMMENT = re.compile(r'/\*.*?\*/|//[^\n]*', re.S)
+DEFINE = re.compile(r'^\s*#\s*define\s+(\w+)\s+(.+?)\s*$')
+SFR = re.compile(r'\b(?:SFR_\d+BIT|sfr_[bwal]|sfr[bwa])\s*\(\s*(\w+)\s*(?:,\s*(\w+)\s*)?\)')
+GENERIC_BIT = re.compile(r'^BIT[0-9A-F]$')
+
+
+def parse_header(text):
+    """registers, bits and values of a TI C header"""
+    registers, bits, values = {}, {}, {}
+    defines = {}
+    current = None
+    for line in COMMENT.sub(' ', text).splitlines():
+        sfr = SFR.search(line)
+        if sfr is not None:
+            name, address = sfr.group(1), sfr.group(2) or sfr.group(1) + '_'
+            if address in defines:
+                registers[name] = defines[address]
+                current = name
+            else:
+                try:
+                    registers[name] = evaluate(address, defines)
+                    current = name
+                except ValueError:
+                    pass
+            continue
+        define = DEFINE.match(line)
+        if define is None:
+            continue
+        name, expression = define.groups()
+        try:
+            defines[name] = value = evaluate(expression, defines)
+        except ValueError:
+            continue
+        # addresses end in '_', BIT0..BITF are not specific to a register
+        if current is None or name.endswith('_') or GENERIC_BIT.match(name) or name in registers:
+            continue
+        if value > 0 and value & (value - 1) == 0:
+            bits.setdefault(current, {}).setdefault(value, name)
+        elif value >= 0:
+            values.setdefault(current, {}).setdefault(value, name)
+    return registers, bits, values
+
+
+LINKER_SYMBOL = re.compile(r'^\s*(?:PROVIDE\s*\(\s*)?(\w+)\s*=\s*(0[xX][0-9a-fA-F]+|\d+)\s*\)?\s*;')
+
+
+def parse_linker(text):
+    """registers of a linker .cmd file, it has no bits or values"""
+    registers = {}
+    for line in COMMENT.sub(' ', text).splitlines():
+        match = LINKER_SYMBOL.match(line)
+        if match is not None:
+            registers[match.group(1)] = int(match.group(2), 0)
+    return registers, {}, {}
+
+
+def parse(filename, text):
+    """parse a definition file, linker files by their extension"""
+    if os.path.splitext(filename)[1].lower() in ('.cmd', '.ld', '.x'):
+        return parse_linker(text)
+    return parse_header(text)
+
+
+# sidecar: magic, source size and mtime, counts of registers, bits, values
+# and the string table bytes, then the index arrays as little endian uint32
+# and the '\n' separated string table
+SIDECAR_SUFFIX = '.symcache'
+SIDECAR_MAGIC = b'MSPSYM01'
+SIDECAR_HEADER = struct.Struct('<8sQqIIII')
+SIDECAR_ARRAYS = ('addresses', 'name_index', 'by_name', 'bit_start', 'bit_masks', 'bit_names',
+                  'value_start', 'values', 'value_names')
+
+
+def sidecar_name(filename):
+    return filename + SIDECAR_SUFFIX
+
+
+def write_sidecar(filename, peripherals, stat):
+    """\
+    store the index; stat is the source's os.stat() from before it was
+    parsed. Failing to write the cache is not an error.
+    """
+    strings = '\n'.join(peripherals.names).encode('utf-8')
+    sidecar = sidecar_name(filename)
+    tmp_name = None
+    try:
+        fd, tmp_name = tempfile.mkstemp(dir=os.path.dirname(sidecar) or '.',
+                                        prefix=os.path.basename(sidecar), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(SIDECAR_HEADER.pack(SIDECAR_MAGIC, stat.st_size, stat.st_mtime_ns, len(peripherals),
+                                        len(peripherals.bit_masks), len(peripherals.values), len(strings)))
+            for name in SIDECAR_ARRAYS:
+                data = array('I', getattr(peripherals, name))
+                if sys.byteorder != 'little':
+                    data.byteswap()
+                f.write(data.tobytes())
+            f.write(strings)
+        os.replace(tmp_name, sidecar)
+    except OSError:
+        if tmp_name is not None:
+            try:
+                os.unlink(tmp_name)
+            except OSError:
+                pass
+
+
+def read_sidecar(filename):
+    """the index of a sidecar that is up to date with its source, None otherwise"""
+    try:
+        stat = os.stat(filename)
+        with open(sidecar_name(filename), 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    if len(data) < SIDECAR_HEADER.size:
+        return None
+    magic, size, mtime_ns, registers, bits, values, strings = SIDECAR_HEADER.unpack_from(data)
+    if magic != SIDECAR_MAGIC or size != stat.st_size or mtime_ns != stat.st_mtime_ns:
+        return None
+    lengths = {
+        'addresses': registers, 'name_index': registers, 'by_name': registers,
+        'bit_start': registers + 1, 'bit_masks': bits, 'bit_names': bits,
+        'value_start': registers + 1, 'values': values, 'value_names': values,
+    }
+    offset = SIDECAR_HEADER.size
+    if len(data) != offset + 4 * sum(lengths.values()) + strings:
+        return None
+    arrays = {}
+    for name in SIDECAR_ARRAYS:
+        arrays[name] = array('I')
+        arrays[name].frombytes(data[offset:offset + 4 * lengths[name]])
+        if sys.byteorder != 'little':
+            arrays[name].byteswap()
+        offset += 4 * lengths[name]
+    names = data[offset:].decode('utf-8').split('\n') if strings else []
+    return Peripherals(names, **arrays)
+
+
+def load(filename, cache=True):
+    """load the peripherals of a definition file, from its sidecar if it is up to date"""
+    if cache:
+        peripherals = read_sidecar(filename)
+        if peripherals is not None:
+            return peripherals
+        stat = os.stat(filename)
+    with open(filename, 'r') as f:
+        peripherals = Peripherals.from_definitions(*parse(filename, f.read()))
+    if cache:
+        write_sidecar(filename, peripherals, stat)
+    return peripherals
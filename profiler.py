@@ -0,0 +1,286 @@
+"""\
+Profiler of simulated firmware: executions and cycles per address, summed
+up per symbol into a flat profile, a call graph and a listing annotated
+with the counts that marks the hot lines.
+
+Profiler(sim) counts exactly. It is attached as Simulator.trace, so run()
+executes one instruction at a time and every instruction, interrupt entry,
+sleep and skipped polling loop pass is counted. CALL, RET, interrupts and
+RETI are followed on a shadow stack for the call graph.
+
+Profiler(sim, interval) samples instead: a passive event reads the PC
+every interval cycles while run() goes on as usual, translated blocks
+included. A sample counts for the instruction about to be executed; there
+is no call graph.
+
+    python simulate.py --profile [--listing LISTING] FILE
+    python simulate.py --sample CYCLES [--listing LISTING] FILE
+"""
+
+import bisect
+
+import memory
+import simulator
+import tracing
+from simulator import PC, SP, SR, CPUOFF, INTERRUPT_CYCLES, REG, AUTOINC, exec_format1, exec_format2, op_mov
+
+# what an instruction does to the shadow stack
+PLAIN, CALL, RETURN = range(3)
+
+# lines of the listing with at least this share of the cycles are hot
+HOT = 0.05
+
+
+def stack_effect(insn):
+    """CALL, RETURN (RET and RETI) or PLAIN"""
+    if insn.execute is exec_format2:
+        if insn.dst == 'CALL':
+            return CALL
+        if insn.dst == 'RETI':
+            return RETURN
+    elif insn.execute is exec_format1 and insn.op is op_mov and \
+            insn.src[:2] == (AUTOINC, SP) and insn.dst[:2] == (REG, PC):
+        return RETURN
+    return PLAIN
+
+
+class Profiler(object):
+    """\
+    profile of sim from now on. counts holds the executions (the samples
+    when sampling) and cycles the cycles (samples times interval) of each
+    address. functions maps the address of every function called and
+    interrupt handler entered to [calls, inclusive cycles, self cycles],
+    arcs maps (caller, callee) to [calls, inclusive cycles]; handlers are
+    called by '<interrupt 0xfff2>'. Cycles spent in handlers and asleep
+    are not part of the inclusive cycles of the code they interrupted.
+    """
+    def __init__(self, sim, interval=None):
+        self.sim = sim
+        self.interval = interval
+        self.counts = [0] * 0x10000
+        self.cycles = [0] * 0x10000
+        self.sleep_cycles = 0
+        self.entry_cycles = 0           # taking interrupts
+        self.functions = {}
+        self.arcs = {}
+        # frames of [function, SP, entry cycles, excluded at entry, inclusive cycles of callees, vector]
+        self.stack = [[sim.regs[PC], 0x10000, sim.cycles, 0, 0, None]]
+        self.excluded = 0               # cycles in interrupt handlers and asleep
+        self.effects = [None] * 0x10000     # pc --> (Decoded, stack_effect())
+        if interval is None:
+            sim.trace = self
+        elif interval <= 0:
+            raise ValueError('sampling interval must be positive: %d' % (interval,))
+        else:
+            sim.schedule(sim.cycles + interval, self.sample, passive=True)
+
+    # recording, as Simulator.trace
+    def instruction(self, sim, pc, insn, cycles):
+        self.counts[pc] += 1
+        self.cycles[pc] += insn.cycles
+        effect = self.effects[pc]
+        if effect is None or effect[0] is not insn:
+            effect = self.effects[pc] = (insn, stack_effect(insn))
+        if effect[1]:
+            self.follow(effect[1], sim.regs, cycles + insn.cycles)
+
+    def follow(self, effect, regs, now):
+        """\
+        update the shadow stack after a CALL or a return at cycle now.
+        Frames whose return address is above SP were left, by a return or
+        by code that dropped them.
+        """
+        sp = regs[SP]
+        stack = self.stack
+        if effect == CALL:
+            while len(stack) > 1 and stack[-1][1] <= sp:
+                self.pop(now)
+            self.push(regs[PC], sp, now)
+        else:
+            while len(stack) > 1 and stack[-1][1] < sp:
+                self.pop(now)
+
+    def push(self, function, sp, now, vector=None):
+        caller = self.stack[-1][0] if vector is None else '<interrupt 0x%04x>' % (vector,)
+        self.functions.setdefault(function, [0, 0, 0])[0] += 1
+        self.arcs.setdefault((caller, function), [0, 0])[0] += 1
+        self.stack.append([function, sp, now, self.excluded, 0, vector])
+
+    def pop(self, now):
+        function, sp, entry, excluded, callees, vector = self.stack.pop()
+        inclusive = now - entry - (self.excluded - excluded)
+        stats = self.functions.setdefault(function, [0, 0, 0])
+        stats[2] += inclusive - callees
+        if vector is not None or not self.running(function):
+            stats[1] += inclusive           # recursive calls are in the outermost one
+        if not self.stack:
+            return
+        caller = self.stack[-1][0] if vector is None else '<interrupt 0x%04x>' % (vector,)
+        self.arcs[(caller, function)][1] += inclusive
+        if vector is None:
+            self.stack[-1][4] += inclusive
+        else:
+            self.excluded += inclusive
+
+    def running(self, function):
+        """\
+        whether function is on the shadow stack up to the handler entered
+        last; the code below it was interrupted, handlers calling it again
+        do not recurse
+        """
+        for frame in reversed(self.stack):
+            if frame[0] == function:
+                return True
+            if frame[5] is not None:
+                return False
+        return False
+
+    def interrupt(self, sim, vector, handler, cycles):
+        self.entry_cycles += INTERRUPT_CYCLES
+        self.push(handler, sim.regs[SP], cycles, vector)
+
+    def sleep(self, pc, sr, cycles, slept):
+        self.sleep_cycles += slept
+        self.excluded += slept
+
+    def skip(self, pc, cycles, steps):
+        start, length, loop_cycles, addresses = self.sim.loops[pc]
+        passes = steps // length
+        for address in addresses:
+            self.counts[address] += passes
+            self.cycles[address] += passes * self.sim.decoded[address].cycles
+
+    def sample(self, time):
+        sim = self.sim
+        if sim.regs[SR] & CPUOFF:
+            self.sleep_cycles += self.interval
+        else:
+            self.counts[sim.regs[PC]] += 1
+            self.cycles[sim.regs[PC]] += self.interval
+        sim.schedule(time + self.interval, self.sample, passive=True)
+
+    # results
+    def call_graph_totals(self):
+        """(functions, arcs) with the functions still running returned now"""
+        saved = self.functions, self.arcs, self.stack, self.excluded
+        self.functions = {function: list(stats) for function, stats in self.functions.items()}
+        self.arcs = {arc: list(stats) for arc, stats in self.arcs.items()}
+        self.stack = [list(frame) for frame in self.stack]
+        try:
+            while self.stack:
+                self.pop(self.sim.cycles)
+            return self.functions, self.arcs
+        finally:
+            self.functions, self.arcs, self.stack, self.excluded = saved
+
+    def decoder(self, symbols=None):
+        """\
+        a tracing.TraceDecoder of the simulator memory with symbols, plus
+        sub_XXXX labels for the functions run that have none
+        """
+        symbols = dict(symbols or {})
+        labelled = set(symbols.values())
+        for function in set(self.functions) | set(frame[0] for frame in self.stack):
+            if function not in labelled:
+                symbols['sub_%04x' % (function,)] = function
+        return tracing.TraceDecoder(memory.Memory([memory.Segment(0, bytes(self.sim.memory))]), symbols)
+
+    def active_cycles(self):
+        """cycles of the code, without the sleeping"""
+        return sum(self.cycles) + self.entry_cycles
+
+    def flat_profile(self, symbols=None):
+        """lines of the flat profile: cycles, executions and calls per symbol, the most cycles first"""
+        decoder = self.decoder(symbols)
+        counts, cycles = self.counts, self.cycles
+        rows = {}                       # label address --> [cycles, executions]
+        for pc in range(0x10000):
+            if counts[pc]:
+                label = decoder.label(pc)
+                row = rows.setdefault(label[0] if label else None, [0, 0])
+                row[0] += cycles[pc]
+                row[1] += counts[pc]
+        total = self.active_cycles() or 1
+        sampling = self.interval is not None
+        yield '%8s %12s %12s %12s %8s  %s' % (
+                '%cycles', 'cumulative', 'cycles', 'samples' if sampling else 'executions', 'calls', 'symbol')
+        cumulative = 0
+        for address, (row_cycles, executions) in sorted(rows.items(), key=lambda item: -item[1][0]):
+            cumulative += row_cycles
+            calls = self.functions[address][0] if address in self.functions and not sampling else ''
+            yield '%8.2f %12d %12d %12d %8s  %s' % (
+                    100.0 * row_cycles / total, cumulative, row_cycles, executions, calls,
+                    '<no symbol>' if address is None else decoder.symbol(address))
+        if self.entry_cycles:
+            yield '%8.2f %12d %12d %12s %8s  %s' % (
+                    100.0 * self.entry_cycles / total, cumulative + self.entry_cycles, self.entry_cycles, '', '',
+                    '<interrupt entry>')
+        yield '%d cycles active, %d asleep%s' % (
+                self.active_cycles(), self.sleep_cycles,
+                ', estimated from samples every %d cycles' % (self.interval,) if sampling else '')
+
+    def call_graph(self, symbols=None):
+        """\
+        lines of the call graph: per function, the most inclusive cycles
+        first, its callers (<-) and its callees (->) with the calls and the
+        inclusive cycles of the function in them
+        """
+        if self.interval is not None:
+            yield 'no call graph when sampling'
+            return
+        decoder = self.decoder(symbols)
+        functions, arcs = self.call_graph_totals()
+        total = self.active_cycles() or 1
+
+        def name(function):
+            return function if isinstance(function, str) else decoder.symbol(function)
+        yield '%12s %8s %12s %8s  %s' % ('inclusive', '%cycles', 'self', 'calls', 'function')
+        for function, (calls, inclusive, self_cycles) in sorted(functions.items(), key=lambda item: -item[1][1]):
+            yield '%12d %8.2f %12d %8d  %s' % (inclusive, 100.0 * inclusive / total, self_cycles, calls, name(function))
+            for (caller, callee), (arc_calls, arc_cycles) in sorted(arcs.items(), key=lambda item: -item[1][1]):
+                if callee == function:
+                    yield '%12d %8s %12s %8d      <- %s' % (arc_cycles, '', '', arc_calls, name(caller))
+            for (caller, callee), (arc_calls, arc_cycles) in sorted(arcs.items(), key=lambda item: -item[1][1]):
+                if caller == function:
+                    yield '%12d %8s %12s %8d      -> %s' % (arc_cycles, '', '', arc_calls, name(callee))
+
+    def listing(self, symbols=None, hot=HOT):
+        """\
+        lines of the disassembly of the code that ran, from the label
+        before it on, with the executions and cycles of every instruction.
+        Lines with at least hot of the cycles are marked with '>>'.
+        """
+        decoder = self.decoder(symbols)
+        counts, cycles = self.counts, self.cycles
+        active = [pc for pc in range(0x10000) if counts[pc]]
+        total = self.active_cycles() or 1
+        yield '%10s %10s %7s     %s' % ('samples' if self.interval is not None else 'executions', 'cycles', '%', 'code')
+        i = 0
+        while i < len(active):
+            label = decoder.label(active[i])
+            address = label[0] if label else active[i]
+            j = bisect.bisect_right(decoder.addresses, address)
+            end = decoder.addresses[j] if j < len(decoder.addresses) else 0x10000
+            k = bisect.bisect_left(active, end)
+            last = active[k - 1]
+            yield ''
+            while address <= last:
+                if address in decoder.labels:
+                    yield '%s:' % (decoder.labels[address],)
+                text = decoder.disassemble(address, self.sim.read_word(address))
+                if counts[address]:
+                    share = float(cycles[address]) / total
+                    yield '%10d %10d %7.2f %2s  %04x  %s' % (
+                            counts[address], cycles[address], 100 * share, '>>' if share >= hot else '',
+                            address, text)
+                else:
+                    yield '%10s %10s %7s %2s  %04x  %s' % ('', '', '', '', address, text)
+                try:
+                    next_address = address + ((self.sim.decode(address).next_pc - address) & 0xffff)
+                except simulator.SimulatorError:
+                    next_address = address + 2
+                n = bisect.bisect_right(active, address)
+                if n < len(active) and active[n] < next_address:
+                    next_address = active[n]    # keep in step with the code that ran
+                address = next_address
+            i = k
@@ -0,0 +1,131 @@
+"""\
+Command line of the MSP430 instruction set simulator: assembles a source
+or loads an image, runs it with simulator.Simulator and prints the CPU
+state, cache, interrupt and power statistics, and optionally a profile.
+
+    python simulate.py [-i FORMAT] [--break ADDRESS] [--max-steps N] [--until CYCLES]
+                       [--translate] [--timer VECTOR:PERIOD[:START]] [--vector VECTOR:TARGET]
+                       [--frequency HZ] [--restore SNAPSHOT] [--save SNAPSHOT]
+                       [--trace TRACE] [--trace-size RECORDS] [--profile | --sample CYCLES]
+                       [--listing LISTING] FILE
+
+FILE is assembler source (.asm) or an image memory.load() can read.
+"""
+
+import argparse
+import sys
+
+import assembler
+import memory
+import profiler
+import simulator
+import tracing
+
+
+def parse_address(text):
+    """a number, or a label of the last assembled source"""
+    try:
+        return int(text, 0)
+    except ValueError:
+        if text in assembler.SYMTAB or text.upper() in assembler.SYMTAB:
+            return assembler.SYMTAB.get(text, assembler.SYMTAB.get(text.upper()))
+        raise ValueError('not an address or label: %r' % (text,))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('filename', metavar='FILE', help='assembler source (.asm) or memory image')
+    parser.add_argument('-i', '--input-format', choices=memory.load_formats, help='image format, guessed if not given')
+    parser.add_argument('--break', dest='breakpoints', default=[], action='append', metavar='ADDRESS',
+            help='stop at this address (may be given more than once)')
+    parser.add_argument('--max-steps', type=int, help='instruction limit (default 10M, none with --until)')
+    parser.add_argument('--until', type=int, help='stop when the cycle count reaches this')
+    parser.add_argument('--translate', action='store_true', help='run translated basic blocks')
+    parser.add_argument('--timer', default=[], action='append', metavar='VECTOR:PERIOD[:START]',
+            help='request the interrupt VECTOR every PERIOD cycles, first at cycle START (may be given more than once)')
+    parser.add_argument('--vector', default=[], action='append', metavar='VECTOR:TARGET',
+            help='set an interrupt vector to an address or label (may be given more than once)')
+    parser.add_argument('--frequency', type=float, default=1e6, metavar='HZ',
+            help='CPU clock for the time and energy figures (default 1 MHz)')
+    parser.add_argument('--restore', metavar='SNAPSHOT', help='start from a snapshot saved with --save')
+    parser.add_argument('--save', metavar='SNAPSHOT', help='save a snapshot of the state when stopped')
+    parser.add_argument('--trace', metavar='TRACE', help='write an execution trace, see tracing.py')
+    parser.add_argument('--trace-size', type=int, default=1 << 20, metavar='RECORDS',
+            help='records the trace keeps, the last ones (default 1M)')
+    profiling = parser.add_mutually_exclusive_group()
+    profiling.add_argument('--profile', action='store_true',
+            help='count the executions and cycles of every instruction, see profiler.py')
+    profiling.add_argument('--sample', type=int, metavar='CYCLES', help='profile by sampling the PC every CYCLES cycles')
+    parser.add_argument('--listing', metavar='LISTING', help='write the profile as an annotated listing to LISTING')
+    args = parser.parse_args()
+    if args.profile and args.trace:
+        parser.error('--profile and --trace can not be used together, use --sample')
+    if args.listing and not (args.profile or args.sample):
+        parser.error('--listing needs --profile or --sample')
+    try:
+        if args.filename.lower().endswith('.asm'):
+            with open(args.filename) as f:
+                sim = simulator.Simulator(simulator.assemble(f.read()), args.translate)
+        else:
+            sim = simulator.Simulator(memory.load(args.filename, format=args.input_format), args.translate)
+        if args.restore:
+            sim.restore(simulator.Snapshot.load(args.restore))
+        for address in args.breakpoints:
+            sim.add_breakpoint(parse_address(address))
+        for setting in args.vector:
+            vector, target = setting.split(':')
+            sim.write_word(int(vector, 0), parse_address(target))
+        for setting in args.timer:
+            vector, period, start = (setting + '::').split(':')[:3]
+            simulator.Timer(sim, int(vector, 0), int(period, 0), int(start, 0) if start else None)
+        if args.trace:
+            sim.trace = tracing.Trace(args.trace_size)
+        if args.profile or args.sample:
+            profile = profiler.Profiler(sim, args.sample)
+        if args.max_steps is None and args.until is None:
+            args.max_steps = 10000000
+        reason = sim.run(args.max_steps, args.until)
+        if args.save:
+            sim.snapshot().save(args.save)
+        if args.trace:
+            sim.trace.save(args.trace)
+        symbols = dict(assembler.SYMTAB) if args.filename.lower().endswith('.asm') else {}
+        if args.listing:
+            with open(args.listing, 'w') as f:
+                for line in profile.listing(symbols):
+                    f.write(line.rstrip() + '\n')
+    except (OSError, ValueError, simulator.SimulatorError) as e:
+        sys.stderr.write('simulator: %s\n' % (e,))
+        sys.exit(1)
+    print('stopped: %s' % (reason,))
+    print(sim)
+    stats = sim.cache_stats()
+    print('instruction cache: %d lookups, %d misses, %d invalidations, %.2f%% hits' % (
+            stats['lookups'], stats['misses'], stats['invalidations'], 100 * stats['hit_rate']))
+    if args.translate:
+        print('translated blocks: %d cached, %d translations' % (stats['blocks'], stats['translations']))
+    for vector, stats in sim.interrupt_stats().items():
+        if stats['taken']:
+            print('interrupt 0x%04x: %d taken, %d nested, %d lost, latency %d/%.1f/%d cycles (min/mean/max)' % (
+                    vector, stats['taken'], stats['nested'], stats['lost'],
+                    stats['latency_min'], stats['latency_mean'], stats['latency_max']))
+        else:
+            print('interrupt 0x%04x: none taken, %d lost' % (vector, stats['lost']))
+    power = sim.power_stats(args.frequency)
+    print('power: %s; %.6g s, %.4g uJ at %g MHz' % (
+            ', '.join('%s %d cycles' % (mode, power[mode]['cycles']) for mode in simulator.POWER_MODES
+                      if power[mode]['cycles'] or mode == simulator.ACTIVE),
+            sum(stats['seconds'] for stats in power.values()),
+            1e6 * sum(stats['energy'] for stats in power.values()), args.frequency / 1e6))
+    if args.profile or args.sample:
+        print('')
+        for line in profile.flat_profile(symbols):
+            print(line)
+        if args.profile:
+            print('')
+            for line in profile.call_graph(symbols):
+                print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1330 @@
+"""\
+MSP430 instruction set simulator: runs the assembler's object code or a
+memory image in a flat 64 KB address space.
+
+All Format I (two operand), Format II (single operand) and Format III
+(jump) instructions with all addressing modes, byte mode and the constant
+generators are executed, with the C, Z, N and V flags of the status
+register. Cycles are counted with the assembler's cycle tables.
+
+Instructions are decoded once and cached by address; writes to memory a
+cached instruction was decoded from drop it from the cache. With translate
+set, basic blocks are translated to Python functions and run as a whole.
+
+Interrupts and timers are events in a heap keyed on the cycle count. run()
+only looks at them when the next one is due, or when the SR changed while
+an interrupt is pending. Interrupts are dispatched through the vector
+table, with GIE, nesting and latency statistics per vector.
+
+Time is skipped, not stepped, where nothing can happen before the next
+event: in low power modes and in polling loops that only compare and test
+(WAIT: BIT #1, &FLAG / JEQ WAIT). Cycles are counted per power mode for
+energy estimates.
+
+snapshot() captures the CPU and memory state in 256 byte pages, which
+snapshots share until a page differs; restore() only copies back the pages
+that changed and keeps the decoded code. Snapshots are saved to disk with
+the zero pages left out and the others compressed.
+
+simulate.py runs programs from the command line.
+"""
+
+import collections
+import heapq
+import itertools
+import struct
+import zlib
+
+import assembler
+import memory
+
+# registers
+PC, SP, SR, CG = 0, 1, 2, 3
+# status register bits
+C, Z, N, GIE, CPUOFF, OSCOFF, SCG0, SCG1, V = 0x1, 0x2, 0x4, 0x8, 0x10, 0x20, 0x40, 0x80, 0x100
+FLAGS = C | Z | N | V
+
+RESET_VECTOR = 0xfffe
+NMI_VECTOR = 0xfffc
+INTERRUPT_CYCLES = 6            # from the request being taken to the first instruction of the handler
+NEVER = 1 << 62                 # a cycle count no run reaches
+
+# memory pages of snapshots (and of batch.BatchSimulator)
+PAGE_BITS = 8
+PAGE_SIZE = 1 << PAGE_BITS
+PAGE_COUNT = 0x10000 >> PAGE_BITS
+ZERO_PAGE = bytes(PAGE_SIZE)
+
+# power modes, by the SR bits CPUOFF, SCG0, SCG1 and OSCOFF
+ACTIVE, LPM0, LPM1, LPM2, LPM3, LPM4 = 'active', 'LPM0', 'LPM1', 'LPM2', 'LPM3', 'LPM4'
+POWER_MODES = (ACTIVE, LPM0, LPM1, LPM2, LPM3, LPM4)
+# typical supply currents in uA at 3 V (MSP430F2xx data sheets), the active one at 1 MHz
+CURRENTS = {ACTIVE: 300.0, LPM0: 85.0, LPM1: 85.0, LPM2: 25.0, LPM3: 0.9, LPM4: 0.1}
+
+# operand kinds: (kind, register, value)
+REG, CONST, ABS, INDEXED, INDIRECT, AUTOINC = range(6)
+
+# why run() stopped
+BREAKPOINT = 'breakpoint'       # PC reached a breakpoint
+HALT = 'halt'                   # CPUOFF is set, no interrupt can wake the CPU
+IDLE = 'idle'                   # a jump to itself or a polling loop, no event can end it
+LIMIT = 'limit'                 # max_steps instructions executed or the cycle count reached until
+
+
+class SimulatorError(Exception):
+    """the CPU can not continue, e.g. at an illegal instruction"""
+
+
+# one decoded instruction: execute(sim, insn) runs it. op is the operation
+# function (Format I/II) or the jump condition, mask 0xff for byte mode,
+# src and dst are operands, dst is the target address for jumps.
+Decoded = collections.namedtuple('Decoded', 'execute op mask src dst next_pc cycles')
+
+
+def _add(s, d, carry, mask, sr):
+    r = s + d + carry
+    sign = (mask + 1) >> 1
+    flags = C if r > mask else 0
+    r &= mask
+    if not r:
+        flags |= Z
+    if r & sign:
+        flags |= N
+    if (s ^ r) & (d ^ r) & sign:
+        flags |= V
+    return r, (sr & ~FLAGS) | flags
+
+
+def _logic(r, mask, sr, overflow=0):
+    """flags of AND, BIT, XOR, SXT: N, Z, C = not Z"""
+    flags = (C | overflow) if r else (Z | overflow)
+    if r & ((mask + 1) >> 1):
+        flags |= N
+    return r, (sr & ~FLAGS) | flags
+
+
+def op_mov(s, d, mask, sr):
+    return s, sr
+
+def op_add(s, d, mask, sr):
+    return _add(s, d, 0, mask, sr)
+
+def op_addc(s, d, mask, sr):
+    return _add(s, d, sr & C, mask, sr)
+
+def op_sub(s, d, mask, sr):
+    return _add(~s & mask, d, 1, mask, sr)
+
+def op_subc(s, d, mask, sr):
+    return _add(~s & mask, d, sr & C, mask, sr)
+
+def op_cmp(s, d, mask, sr):
+    return None, _add(~s & mask, d, 1, mask, sr)[1]
+
+def op_dadd(s, d, mask, sr):
+    carry = sr & C
+    r = 0
+    for shift in range(0, 16 if mask == 0xffff else 8, 4):
+        digit = ((s >> shift) & 0xf) + ((d >> shift) & 0xf) + carry
+        carry = digit > 9
+        if carry:
+            digit -= 10
+        r |= (digit & 0xf) << shift
+    flags = C if carry else 0
+    if not r:
+        flags |= Z
+    if r & ((mask + 1) >> 1):
+        flags |= N
+    return r, (sr & ~(C | Z | N)) | flags      # V is undefined, left as is
+
+def op_bit(s, d, mask, sr):
+    return None, _logic(s & d, mask, sr)[1]
+
+def op_bic(s, d, mask, sr):
+    return d & ~s & mask, sr
+
+def op_bis(s, d, mask, sr):
+    return d | s, sr
+
+def op_xor(s, d, mask, sr):
+    sign = (mask + 1) >> 1
+    return _logic(s ^ d, mask, sr, V if s & d & sign else 0)
+
+def op_and(s, d, mask, sr):
+    return _logic(s & d, mask, sr)
+
+
+FORMAT_I = {
+    0x4: ('MOV', op_mov), 0x5: ('ADD', op_add), 0x6: ('ADDC', op_addc), 0x7: ('SUBC', op_subc),
+    0x8: ('SUB', op_sub), 0x9: ('CMP', op_cmp), 0xa: ('DADD', op_dadd), 0xb: ('BIT', op_bit),
+    0xc: ('BIC', op_bic), 0xd: ('BIS', op_bis), 0xe: ('XOR', op_xor), 0xf: ('AND', op_and),
+}
+
+
+def op_rrc(v, mask, sr):
+    r = (v >> 1) | ((sr & C) * ((mask + 1) >> 1))
+    return _shift(r, v, mask, sr)
+
+def op_rra(v, mask, sr):
+    r = (v >> 1) | (v & ((mask + 1) >> 1))
+    return _shift(r, v, mask, sr)
+
+def _shift(r, v, mask, sr):
+    flags = v & 1                               # C is the bit shifted out, V is reset
+    if not r:
+        flags |= Z
+    if r & ((mask + 1) >> 1):
+        flags |= N
+    return r, (sr & ~FLAGS) | flags
+
+def op_swpb(v, mask, sr):
+    return ((v << 8) | (v >> 8)) & 0xffff, sr
+
+def op_sxt(v, mask, sr):
+    r = v & 0xff
+    if r & 0x80:
+        r |= 0xff00
+    return _logic(r, 0xffff, sr)
+
+# PUSH, CALL and RETI are executed by exec_format2() itself
+FORMAT_II = {
+    0: ('RRC', op_rrc), 1: ('SWPB', op_swpb), 2: ('RRA', op_rra), 3: ('SXT', op_sxt),
+    4: ('PUSH', None), 5: ('CALL', None), 6: ('RETI', None),
+}
+
+# Format III conditions on SR
+JUMPS = {
+    0: ('JNE', lambda sr: not sr & Z),
+    1: ('JEQ', lambda sr: sr & Z),
+    2: ('JNC', lambda sr: not sr & C),
+    3: ('JC', lambda sr: sr & C),
+    4: ('JN', lambda sr: sr & N),
+    5: ('JGE', lambda sr: bool(sr & N) == bool(sr & V)),
+    6: ('JL', lambda sr: bool(sr & N) != bool(sr & V)),
+    7: ('JMP', None),
+}
+
+
+def exec_format1(sim, insn):
+    execute, op, mask, src, dst, next_pc, cycles = insn
+    regs = sim.regs
+    s = sim.read_operand(src, mask)
+    kind, reg, x = dst
+    if kind == REG:
+        r, regs[SR] = op(s, regs[reg] & mask, mask, regs[SR])
+        if r is not None:
+            sim.set_register(reg, r, mask)
+    else:
+        address = (regs[reg] + x) & 0xffff if kind == INDEXED else x
+        r, regs[SR] = op(s, sim.load(address, mask), mask, regs[SR])
+        if r is not None:
+            sim.store(address, r, mask)
+
+
+def exec_format2(sim, insn):
+    execute, op, mask, src, name, next_pc, cycles = insn
+    regs = sim.regs
+    if name == 'RETI':
+        regs[SR] = sim.load(regs[SP], 0xffff)
+        regs[PC] = sim.load((regs[SP] + 2) & 0xffff, 0xffff) & 0xfffe
+        regs[SP] = (regs[SP] + 4) & 0xffff
+        if sim.depth:
+            sim.depth -= 1
+        sim.deadline = 0                        # GIE may be set again
+        return
+    kind, reg, x = src
+    if kind == REG or kind == CONST:
+        address = None
+        v = regs[reg] & mask if kind == REG else x & mask
+    else:
+        address = sim.operand_address(src, mask)
+        v = sim.load(address, mask)
+    if op is not None:
+        r, regs[SR] = op(v, mask, regs[SR])
+        if kind == REG:
+            sim.set_register(reg, r, mask)
+        elif address is not None:
+            sim.store(address, r, mask)
+    elif name == 'PUSH':
+        regs[SP] = (regs[SP] - 2) & 0xffff
+        sim.store(regs[SP], v, mask)
+    else:                                       # CALL
+        regs[SP] = (regs[SP] - 2) & 0xffff
+        sim.store(regs[SP], next_pc, 0xffff)
+        regs[PC] = v & 0xfffe
+
+
+def exec_jump(sim, insn):
+    if insn.op is None or insn.op(sim.regs[SR]):
+        sim.regs[PC] = insn.dst
+
+
+def power_mode(sr):
+    """the power mode the SR value selects"""
+    if not sr & CPUOFF:
+        return ACTIVE
+    if sr & OSCOFF:
+        return LPM4
+    return POWER_MODES[1 + ((sr >> 6) & 3)]
+
+
+def only_sets_flags(insn):
+    """\
+    true for instructions that read registers and memory and only change
+    the flags, with the flags depending on nothing else: CMP, BIT and
+    NOP-like writes to the constant generator
+    """
+    if insn.execute is not exec_format1 or insn.src[0] == AUTOINC or (REG, SR) in (insn.src[:2], insn.dst[:2]):
+        return False
+    if insn.op in (op_cmp, op_bit):
+        return True
+    return insn.dst[:2] == (REG, CG) and insn.op not in (op_addc, op_subc, op_dadd)
+
+
+# basic block translation: a run of instructions up to the next jump,
+# CALL, RETI or write to PC or SR becomes one Python function with the
+# registers in locals, compiled once per entry address
+BLOCK_LIMIT = 32                # instructions per block
+
+# the jump conditions as expressions on the SR local
+JUMP_CONDITIONS = {
+    JUMPS[0][1]: 'not r2 & 2', JUMPS[1][1]: 'r2 & 2', JUMPS[2][1]: 'not r2 & 1', JUMPS[3][1]: 'r2 & 1',
+    JUMPS[4][1]: 'r2 & 4', JUMPS[5][1]: '(r2 & 4) == ((r2 >> 6) & 4)', JUMPS[6][1]: '(r2 & 4) != ((r2 >> 6) & 4)',
+}
+CARRY_IN = {op_add: '', op_addc: ' + (r2 & 1)', op_sub: ' + 1', op_subc: ' + (r2 & 1)', op_cmp: ' + 1'}
+
+
+class Block(object):
+    """\
+    a translated basic block. function(sim, regs, memory, code) executes
+    it and returns the number of instructions it executed, n, which took
+    cycles[n] cycles; it stops early after a write to cached code.
+    """
+    __slots__ = ('start', 'end', 'length', 'cycles', 'jump_pc', 'function', 'source')
+
+    def __init__(self, start, end, length, cycles, jump_pc, function, source):
+        self.start = start
+        self.end = end                  # address after the last instruction
+        self.length = length
+        self.cycles = cycles
+        self.jump_pc = jump_pc          # address of a final jump, -1 if it does not end with one
+        self.function = function
+        self.source = source
+
+    def __repr__(self):
+        return 'Block(0x%04x-0x%04x, %d instructions)' % (self.start, self.end, self.length)
+
+
+def ends_block(insn):
+    """true for instructions that change the PC or the SR other than through the flags"""
+    if insn.execute is exec_jump:
+        return True
+    if insn.execute is exec_format2:
+        return insn.dst in ('CALL', 'RETI') or (insn.src[:2] == (REG, SR) and insn.op is not None)
+    return insn.dst[:2] in ((REG, PC), (REG, SR))
+
+
+class BlockWriter(object):
+    """generates the source of a Block from (address, Decoded) pairs"""
+    def __init__(self):
+        self.lines = []
+        self.used = {SR}                # registers loaded into locals
+        self.written = {SR}             # registers written back
+        self.names = {}                 # functions and instructions the code refers to
+
+    def emit(self, line, indent=1):
+        self.lines.append('    ' * indent + line)
+
+    def exit(self, count, next_pc, indent=1, call=None):
+        """write back the registers and return count, after calling the instruction call"""
+        self.lines.append((indent, count, next_pc, call))
+
+    def reg(self, reg):
+        self.used.add(reg)
+        return 'r%d' % reg
+
+    def set_reg(self, reg, value, mask):
+        """like Simulator.set_register()"""
+        if reg == CG:
+            return
+        self.used.add(reg)
+        self.written.add(reg)
+        if value.startswith('0x'):
+            self.emit('r%d = 0x%x' % (reg, int(value, 16) & (mask & 0xfffe if reg == SP else mask)))
+        elif reg == SP:
+            self.emit('r1 = %s & 0x%x' % (value, mask & 0xfffe))
+        elif mask == 0xff:
+            self.emit('r%d = %s & 0xff' % (reg, value))
+        else:
+            self.emit('r%d = %s' % (reg, value))
+
+    def address(self, operand, mask):
+        """a = the address of a memory operand, aligned for words; @Rn+ increments Rn"""
+        kind, reg, x = operand
+        align = 0xfffe if mask == 0xffff else 0xffff
+        if kind == ABS:
+            self.emit('a = 0x%04x' % (x & align))
+        elif kind == INDEXED:
+            self.emit('a = (%s + 0x%04x) & 0x%04x' % (self.reg(reg), x, align))
+        else:
+            self.emit('a = %s' % self.reg(reg))
+            if kind == AUTOINC:
+                self.written.add(reg)
+                self.emit('r%d = (a + %d) & 0xffff' % (reg, 1 if mask == 0xff and reg != SP else 2))
+            if mask == 0xffff:
+                self.emit('a &= 0xfffe')
+
+    def load(self, name, mask):
+        if mask == 0xff:
+            self.emit('%s = memory[a]' % name)
+        else:
+            self.emit('%s = memory[a] | (memory[a + 1] << 8)' % name)
+
+    def store(self, value, mask, count, next_pc):
+        """store at a, leave the block if that changed cached code"""
+        self.emit('memory[a] = %s & 0xff' % value)
+        if mask == 0xff:
+            self.emit('if code[a]:')
+            self.emit('sim.invalidate(a)', 2)
+        else:
+            self.emit('memory[a + 1] = %s >> 8' % value)
+            self.emit('if code[a] or code[a + 1]:')
+            self.emit('sim.invalidate(a)', 2)
+            self.emit('sim.invalidate(a + 1)', 2)
+        self.exit(count, next_pc, 2)
+
+    def source(self, operand, mask):
+        """expression of a source operand value"""
+        kind, reg, x = operand
+        if kind == CONST:
+            return '0x%x' % (x & mask)
+        if kind == REG:
+            if mask == 0xffff:
+                return self.reg(reg)
+            self.emit('s = %s & 0xff' % self.reg(reg))
+            return 's'
+        self.address(operand, mask)
+        self.load('s', mask)
+        return 's'
+
+    def call(self, function, *args):
+        """v, r2 = function(args..., r2) for the operations that are not inlined"""
+        self.names[function.__name__] = function
+        self.emit('v, r2 = %s(%s, r2)' % (function.__name__, ', '.join(args)))
+        return 'v'
+
+    def operation(self, op, s, d, mask):
+        """a Format I operation on the values s and d, the result expression or None"""
+        n = '((v >> %d) & 4)' % (13 if mask == 0xffff else 5)
+        overflow = '>> 7' if mask == 0xffff else '<< 1'           # the sign bit to V
+        if op is op_mov:
+            return s
+        if op is op_bic:
+            self.emit('v = %s & ~%s' % (d, s))
+        elif op is op_bis:
+            self.emit('v = %s | %s' % (d, s))
+        elif op in CARRY_IN:
+            if op in (op_sub, op_subc, op_cmp):
+                self.emit('u = %s ^ 0x%x' % (s, mask))
+                s = 'u'
+            self.emit('t = %s + %s%s' % (s, d, CARRY_IN[op]))
+            self.emit('v = t & 0x%x' % mask)
+            self.emit('r2 = (r2 & 0xfef8) | (t >> %d) | (0 if v else 2) | %s | (((%s ^ v) & (%s ^ v) & 0x%x) %s)' % (
+                    16 if mask == 0xffff else 8, n, s, d, (mask + 1) >> 1, overflow))
+            return None if op is op_cmp else 'v'
+        elif op in (op_and, op_bit, op_xor):
+            self.emit('v = %s %s %s' % (s, '^' if op is op_xor else '&', d))
+            v = ' | ((%s & %s & 0x%x) %s)' % (s, d, (mask + 1) >> 1, overflow) if op is op_xor else ''
+            self.emit('r2 = (r2 & 0xfef8) | (1 if v else 2) | %s%s' % (n, v))
+            return None if op is op_bit else 'v'
+        else:
+            return self.call(op, s, d, '0x%x' % mask)
+        return 'v'
+
+    def format1(self, insn, count):
+        execute, op, mask, src, dst, next_pc, cycles = insn
+        s = self.source(src, mask)
+        kind, reg, x = dst
+        if kind == REG:
+            d = self.reg(reg) if mask == 0xffff else '(%s & 0xff)' % self.reg(reg)
+        else:
+            self.address(dst, mask)
+            d = 'd'
+            if op is not op_mov:
+                self.load(d, mask)
+        result = self.operation(op, s, d, mask)
+        if result is None:
+            return
+        if kind == REG:
+            self.set_reg(reg, result, mask)
+        else:
+            self.store(result, mask, count, next_pc)
+
+    def format2(self, insn, count):
+        execute, op, mask, src, name, next_pc, cycles = insn
+        kind, reg, x = src
+        s = self.source(src, mask)
+        if name == 'PUSH':
+            if s[0] == 'r':                     # read before SP moves
+                self.emit('s = %s' % s)
+                s = 's'
+            self.used.add(SP)
+            self.written.add(SP)
+            self.emit('r1 = (r1 - 2) & 0xffff')
+            self.emit('a = r1' if mask == 0xff else 'a = r1 & 0xfffe')
+            self.store(s, mask, count, next_pc)
+            return
+        n = '((v >> %d) & 4)' % (13 if mask == 0xffff else 5)
+        if op is op_rra:
+            self.emit('v = (%s >> 1) | (%s & 0x%x)' % (s, s, (mask + 1) >> 1))
+        elif op is op_rrc:
+            self.emit('v = (%s >> 1) | ((r2 & 1) << %d)' % (s, 15 if mask == 0xffff else 7))
+        else:
+            self.call(op, s, '0x%x' % mask)
+        if op in (op_rra, op_rrc):
+            self.emit('r2 = (r2 & 0xfef8) | (%s & 1) | (0 if v else 2) | %s' % (s, n))
+        if kind == REG:
+            self.set_reg(reg, 'v', mask)
+        elif kind != CONST:
+            self.store('v', mask, count, next_pc)
+
+    def instruction(self, address, insn, count):
+        """the count'th instruction of the block"""
+        self.emit('# 0x%04x' % address)
+        if insn.execute is exec_jump:
+            if insn.op is None:
+                self.exit(count, '0x%04x' % insn.dst)
+            else:
+                self.exit(count, '0x%04x if %s else 0x%04x' % (insn.dst, JUMP_CONDITIONS[insn.op], insn.next_pc))
+        elif ends_block(insn):
+            name = 'i%d' % count
+            self.names[name] = insn
+            self.exit(count, insn.next_pc, call=name)
+        elif insn.execute is exec_format1:
+            self.format1(insn, count)
+        else:
+            self.format2(insn, count)
+
+    def source_code(self):
+        lines = ['def block(sim, regs, memory, code):']
+        lines.extend('    r%d = regs[%d]' % (reg, reg) for reg in sorted(self.used))
+        for line in self.lines:
+            if isinstance(line, str):
+                lines.append(line)
+                continue
+            indent, count, next_pc, call = line
+            indent = '    ' * indent
+            lines.extend('%sregs[%d] = r%d' % (indent, reg, reg) for reg in sorted(self.written))
+            lines.append('%sregs[0] = %s' % (indent, next_pc if isinstance(next_pc, str) else '0x%04x' % next_pc))
+            if call is not None:
+                lines.append('%s%s.execute(sim, %s)' % (indent, call, call))
+            lines.append('%sreturn %d' % (indent, count))
+        return '\n'.join(lines) + '\n'
+
+
+def translate_block(instructions):
+    """a Block of (address, Decoded) pairs, only the last may end a block"""
+    writer = BlockWriter()
+    cycles = [0]
+    for count, (address, insn) in enumerate(instructions, 1):
+        writer.instruction(address, insn, count)
+        cycles.append(cycles[-1] + insn.cycles)
+    start = instructions[0][0]
+    last, insn = instructions[-1]
+    if not ends_block(insn):
+        writer.exit(len(instructions), insn.next_pc)
+    source = writer.source_code()
+    namespace = dict(writer.names)
+    exec(compile(source, '<block 0x%04x>' % start, 'exec'), namespace)
+    return Block(start, last + ((insn.next_pc - last) & 0xffff), len(instructions), cycles,
+                 last if insn.execute is exec_jump else -1, namespace['block'], source)
+
+
+class Simulator(object):
+    """\
+    an MSP430 CPU with 64 KB of memory. load_image(), reset(), then
+    step() or run(). breakpoints is a set of addresses run() stops at.
+
+    decoded holds the Decoded instruction of each address that was
+    executed, code flags the bytes they were decoded from. With translate
+    set, run() executes the Blocks in blocks, by entry address.
+    """
+    def __init__(self, image=None, translate=False):
+        self.memory = bytearray(0x10000)
+        self.regs = [0] * 16
+        self.cycles = 0
+        self.steps = 0                  # instructions executed
+        self.breakpoints = set()
+        self.entry = None               # lowest loaded address, used when there is no reset vector
+        self.decoded = [None] * 0x10000
+        self.code = bytearray(0x10000)
+        self.lookups = 0                # cache statistics, over all runs
+        self.misses = 0
+        self.invalidations = 0
+        self.translate = translate
+        self.blocks = {}
+        self.block_breakpoints = set()  # the breakpoints blocks were translated with
+        self.translations = 0
+        self.events = []                # heap of (cycles, sequence, action, passive)
+        self.sequence = itertools.count()   # keeps events of the same cycle in order
+        self.wakers = 0                 # events that are not passive
+        self.pending = {}               # interrupt vector --> (request cycles, maskable)
+        self.deadline = NEVER           # cycles at which run() must call service()
+        self.until = NEVER              # cycle limit of the current run()
+        self.depth = 0                  # interrupt handlers being executed
+        self.interrupts = {}            # vector --> [taken, nested, lost, latency min, max, total]
+        self.loops = {}                 # jump address --> polling loop from polling_loop(), False for other loops
+        self.services = 0               # service() calls, anything may have changed since the last one
+        self.last_poll = None           # (jump address, services, cycles) of the last poll()
+        self.sleep_cycles = dict.fromkeys(POWER_MODES[1:], 0)  # cycles spent in each low power mode
+        self.base = None                # the Snapshot of the last snapshot() or restore(), shares its pages
+        self.trace = None               # a tracing.Trace or profiler.Profiler that run() records into
+        if image is not None:
+            self.load_image(image)
+            self.reset()
+
+    def load_image(self, image):
+        """load object code ((address, word) pairs from assembler.pass2()) or a memory.Memory"""
+        if not isinstance(image, memory.Memory):
+            image = memory.from_object_code(image)
+        for segment in image:
+            start = segment.startaddress
+            if start < 0 or start + len(segment) > len(self.memory):
+                raise SimulatorError('segment 0x%04x-0x%04x is outside of the 64 KB address space' % (
+                        start, start + len(segment)))
+            self.memory[start:start + len(segment)] = segment.data
+            if self.entry is None or start < self.entry:
+                self.entry = start
+        self.base = None
+        self.flush()
+
+    def reset(self, pc=None):
+        """\
+        clear registers and counters, drop events and pending interrupts; PC
+        from the reset vector if it is set, else pc or the entry address
+        """
+        self.regs = [0] * 16
+        self.cycles = 0
+        self.steps = 0
+        self.events = []
+        self.wakers = 0
+        self.pending = {}
+        self.deadline = NEVER
+        self.depth = 0
+        self.interrupts = {}
+        self.sleep_cycles = dict.fromkeys(POWER_MODES[1:], 0)
+        self.services = 0
+        self.last_poll = None
+        vector = self.read_word(RESET_VECTOR)
+        if pc is None:
+            pc = vector if vector not in (0, 0xffff) else (self.entry or 0)
+        self.regs[PC] = pc & 0xfffe
+
+    # memory
+    def read_byte(self, address):
+        return self.memory[address & 0xffff]
+
+    def read_word(self, address):
+        address &= 0xfffe                       # word accesses ignore bit 0
+        return self.memory[address] | (self.memory[address + 1] << 8)
+
+    def write_byte(self, address, value):
+        address &= 0xffff
+        self.memory[address] = value & 0xff
+        if self.code[address]:
+            self.invalidate(address)
+
+    def write_word(self, address, value):
+        address &= 0xfffe
+        self.memory[address] = value & 0xff
+        self.memory[address + 1] = (value >> 8) & 0xff
+        if self.code[address] or self.code[address + 1]:
+            self.invalidate(address)
+            self.invalidate(address + 1)
+
+    def load(self, address, mask):
+        return self.read_byte(address) if mask == 0xff else self.read_word(address)
+
+    def store(self, address, value, mask):
+        if mask == 0xff:
+            self.write_byte(address, value)
+        else:
+            self.write_word(address, value)
+
+    # operands
+    def set_register(self, reg, value, mask):
+        """write a register; byte results clear the high byte, writes to the constant generator are lost"""
+        if reg == PC:
+            self.regs[PC] = value & 0xfffe
+        elif reg == SP:
+            self.regs[SP] = value & mask & 0xfffe
+        elif reg == SR:
+            self.regs[SR] = value & mask
+            self.deadline = 0                   # GIE or CPUOFF may have changed
+        elif reg != CG:
+            self.regs[reg] = value & mask
+
+    def operand_address(self, operand, mask):
+        """address of a memory operand, @Rn+ increments Rn"""
+        kind, reg, x = operand
+        if kind == ABS:
+            return x
+        if kind == INDEXED:
+            return (self.regs[reg] + x) & 0xffff
+        address = self.regs[reg]
+        if kind == AUTOINC:
+            self.regs[reg] = (address + (1 if mask == 0xff and reg != SP else 2)) & 0xffff
+        return address
+
+    def read_operand(self, operand, mask):
+        kind, reg, x = operand
+        if kind == REG:
+            return self.regs[reg] & mask
+        if kind == CONST:
+            return x & mask
+        return self.load(self.operand_address(operand, mask), mask)
+
+    # decoding
+    def _source(self, As, reg, pc, ext):
+        """(operand, next extension word address, addressing mode name for the cycle tables)"""
+        if reg == CG:
+            return (CONST, CG, (0, 1, 2, 0xffff)[As]), ext, 'REGISTER'
+        if reg == SR and As >= 2:
+            return (CONST, SR, (4, 8)[As - 2]), ext, 'REGISTER'
+        if As == 0:
+            if reg == PC:                       # the PC as read by the instruction
+                return (CONST, PC, (pc + 2) & 0xffff), ext, 'REGISTER'
+            return (REG, reg, 0), ext, 'REGISTER'
+        if As == 1:
+            x = self.read_word(ext)
+            if reg == PC:
+                return (ABS, PC, (ext + x) & 0xffff), ext + 2, 'SYMBOLIC'
+            if reg == SR:
+                return (ABS, SR, x), ext + 2, 'ABSOLUTE'
+            return (INDEXED, reg, x), ext + 2, 'INDEXED'
+        if As == 2:
+            if reg == PC:
+                return (ABS, PC, ext & 0xffff), ext, 'INDIRECT'
+            return (INDIRECT, reg, 0), ext, 'INDIRECT'
+        if reg == PC:
+            return (CONST, PC, self.read_word(ext)), ext + 2, 'IMMEDIATE'
+        return (AUTOINC, reg, 0), ext, 'INDIRECT_INC'
+
+    def decode(self, pc):
+        """decode the instruction at pc into a Decoded tuple"""
+        word = self.read_word(pc)
+        ext = (pc + 2) & 0xffff
+        if word >= 0x4000:                      # Format I
+            name, op = FORMAT_I[word >> 12]
+            mask = 0xff if word & 0x40 else 0xffff
+            src, ext, src_mode = self._source((word >> 4) & 3, (word >> 8) & 0xf, pc, ext)
+            reg = word & 0xf
+            if not word & 0x80:
+                dst, dst_mode = (REG, reg, 0), 'REGISTER'
+            else:
+                x = self.read_word(ext)
+                if reg == PC:
+                    dst, dst_mode = (ABS, PC, (ext + x) & 0xffff), 'SYMBOLIC'
+                elif reg == SR:
+                    dst, dst_mode = (ABS, SR, x), 'ABSOLUTE'
+                else:
+                    dst, dst_mode = (INDEXED, reg, x), 'INDEXED'
+                ext += 2
+            cycles = assembler.FORMAT_I_CYCLES[src_mode][0 if dst_mode == 'REGISTER' else 1]
+            if dst_mode == 'REGISTER' and reg == PC and src_mode in ('REGISTER', 'INDIRECT_INC', 'IMMEDIATE'):
+                cycles += 1                     # writing the PC costs one more cycle
+            return Decoded(exec_format1, op, mask, src, dst, ext & 0xffff, cycles)
+        if word & 0xe000 == 0x2000:             # Format III
+            name, condition = JUMPS[(word >> 10) & 7]
+            offset = word & 0x3ff
+            if offset & 0x200:
+                offset -= 0x400
+            return Decoded(exec_jump, condition, 0xffff, None, (pc + 2 + 2 * offset) & 0xffff, ext, assembler.JUMP_CYCLES)
+        if word & 0xfc00 == 0x1000 and (word >> 7) & 7 in FORMAT_II:   # Format II
+            name, op = FORMAT_II[(word >> 7) & 7]
+            mask = 0xff if word & 0x40 else 0xffff
+            if name == 'RETI':
+                return Decoded(exec_format2, None, 0xffff, None, name, ext, 5)
+            src, ext, mode = self._source((word >> 4) & 3, word & 0xf, pc, ext)
+            rotate, push, call = assembler.FORMAT_II_CYCLES[mode]
+            cycles = push if name == 'PUSH' else call if name == 'CALL' else rotate
+            return Decoded(exec_format2, op, mask, src, name, ext & 0xffff, cycles or 1)
+        raise SimulatorError('illegal instruction 0x%04x at 0x%04x' % (word, pc))
+
+    # decoded instruction cache
+    def fetch(self, pc):
+        """the Decoded instruction at pc, from the cache or decoded into it"""
+        insn = self.decoded[pc]
+        if insn is None:
+            insn = self.decoded[pc] = self.decode(pc)
+            self.misses += 1
+            end = pc + ((insn.next_pc - pc) & 0xffff)
+            self.code[pc:end] = b'\x01' * (end - pc)
+        return insn
+
+    def invalidate(self, address):
+        """drop the cached instructions decoded from the byte at address (at most 6 bytes long)"""
+        decoded = self.decoded
+        for start in range(address & 0xfffe, max((address & 0xfffe) - 6, -1), -2):
+            insn = decoded[start]
+            if insn is not None and address < start + ((insn.next_pc - start) & 0xffff):
+                decoded[start] = None
+                self.invalidations += 1
+        if self.blocks:
+            for start in [start for start, block in self.blocks.items() if block.start <= address < block.end]:
+                del self.blocks[start]
+        self.loops.clear()
+
+    def flush(self):
+        """empty the instruction cache, e.g. after loading memory directly"""
+        self.decoded = [None] * 0x10000
+        self.code = bytearray(0x10000)
+        self.blocks = {}
+        self.loops.clear()
+
+    def translate_block(self, pc):
+        """translate the basic block at pc into blocks and return it"""
+        instructions = []
+        address = pc
+        while len(instructions) < BLOCK_LIMIT:
+            if instructions and address in self.breakpoints:
+                break
+            try:
+                insn = self.fetch(address)
+            except SimulatorError:
+                if not instructions:
+                    raise
+                break                           # raised when it is executed
+            self.lookups += 1
+            instructions.append((address, insn))
+            if ends_block(insn) or insn.next_pc < address:
+                break
+            address = insn.next_pc
+        block = self.blocks[pc] = translate_block(instructions)
+        self.translations += 1
+        return block
+
+    def cache_stats(self):
+        """instruction cache lookups, misses, invalidations and hit rate"""
+        return {
+            'lookups': self.lookups,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'hit_rate': 1 - self.misses / self.lookups if self.lookups else 0.0,
+            'blocks': len(self.blocks),
+            'translations': self.translations,
+        }
+
+    # events and interrupts
+    def schedule(self, time, action, passive=False):
+        """\
+        call action(time) when the cycle count reaches time. A passive
+        action only looks at the simulator (like profiler samples), it
+        neither wakes a halted CPU nor ends a polling loop.
+        """
+        heapq.heappush(self.events, (time, next(self.sequence), action, passive))
+        if not passive:
+            self.wakers += 1
+        if time < self.deadline:
+            self.deadline = time
+
+    def request_interrupt(self, vector, time=None, maskable=True):
+        """\
+        set the interrupt flag of vector, requested at time (default now).
+        maskable interrupts are only taken with GIE set, a request while the
+        flag is still set is lost.
+        """
+        stats = self.interrupts.setdefault(vector, [0, 0, 0, NEVER, 0, 0])
+        if vector in self.pending:
+            stats[2] += 1
+            return
+        self.pending[vector] = (self.cycles if time is None else time, maskable)
+        self.deadline = 0
+
+    def service(self):
+        """run the events that are due and take the highest priority interrupt the CPU accepts"""
+        events = self.events
+        self.services += 1
+        while events and events[0][0] <= self.cycles:
+            time, sequence, action, passive = heapq.heappop(events)
+            if not passive:
+                self.wakers -= 1
+            action(time)
+        if self.pending:
+            gie = self.regs[SR] & GIE
+            vectors = [vector for vector, (time, maskable) in self.pending.items() if gie or not maskable]
+            if vectors:
+                self.accept(max(vectors))       # the highest vector has the highest priority
+        if self.pending:
+            self.deadline = 0                   # masked: check again after every instruction
+        else:
+            self.deadline = min(events[0][0] if events else NEVER, self.until)
+
+    def accept(self, vector):
+        """\
+        enter an interrupt handler: push PC and SR, clear SR but SCG0 (also
+        waking the CPU), load PC from the vector
+        """
+        time, maskable = self.pending.pop(vector)
+        regs = self.regs
+        regs[SP] = (regs[SP] - 2) & 0xffff
+        self.write_word(regs[SP], regs[PC])
+        regs[SP] = (regs[SP] - 2) & 0xffff
+        self.write_word(regs[SP], regs[SR])
+        regs[SR] &= SCG0
+        regs[PC] = self.read_word(vector) & 0xfffe
+        if self.trace is not None:
+            self.trace.interrupt(self, vector, regs[PC], self.cycles)
+        self.cycles += INTERRUPT_CYCLES
+        latency = self.cycles - time
+        stats = self.interrupts[vector]
+        stats[0] += 1
+        if self.depth:
+            stats[1] += 1
+        stats[3] = min(stats[3], latency)
+        stats[4] = max(stats[4], latency)
+        stats[5] += latency
+        self.depth += 1
+
+    def sleep(self):
+        """\
+        with CPUOFF set, let time pass to the next event and service it.
+        returns HALT if no interrupt can wake the CPU, LIMIT at until.
+        """
+        if not self.wakers or not self.regs[SR] & GIE:
+            return HALT
+        time = self.events[0][0]
+        reason = None
+        if time >= self.until:
+            time, reason = self.until, LIMIT
+        if time > self.cycles:
+            self.sleep_cycles[power_mode(self.regs[SR])] += time - self.cycles
+            if self.trace is not None:
+                self.trace.sleep(self.regs[PC], self.regs[SR], self.cycles, time - self.cycles)
+            self.cycles = time
+        if reason is None:
+            self.service()
+        return reason
+
+    def polling_loop(self, pc):
+        """\
+        (start, instructions, cycles, addresses) of the loop closed by the
+        backward jump at pc, if it is a polling loop, else False. A polling
+        loop is straight code of instructions that only_sets_flags(), so a
+        pass leaves the CPU as the pass before it did: only an event can
+        end it.
+        """
+        loop = self.loops.get(pc)
+        if loop is not None:
+            return loop
+        jump = self.fetch(pc)
+        address = start = jump.dst
+        addresses = []
+        cycles = jump.cycles
+        loop = False
+        try:
+            while address < pc and len(addresses) < BLOCK_LIMIT:
+                insn = self.fetch(address)
+                if not only_sets_flags(insn):
+                    break
+                addresses.append(address)
+                cycles += insn.cycles
+                address = insn.next_pc
+            if address == pc:
+                addresses.append(pc)
+                loop = (start, len(addresses), cycles, tuple(addresses))
+        except SimulatorError:
+            pass
+        self.loops[pc] = loop
+        return loop
+
+    def poll(self, pc, now, steps_left=None):
+        """\
+        after the jump at pc went backwards at cycle now: (instructions,
+        cycles) of the passes of its polling loop that run before the next
+        event, (0, 0) if it is no polling loop or has a breakpoint, None if
+        it can not end. Passes are only skipped after one whole pass without
+        a service() in it, an interrupt in the middle of a pass may have
+        changed what it reads.
+        """
+        loop = self.polling_loop(pc)
+        if not loop:
+            return (0, 0)
+        start, length, cycles, addresses = loop
+        if self.breakpoints and not self.breakpoints.isdisjoint(addresses):
+            return (0, 0)                       # runs into the breakpoint
+        if length > 1:                          # a jump to itself changes nothing in any case
+            clean = self.last_poll == (pc, self.services, now - cycles)
+            self.last_poll = (pc, self.services, now)
+            if not clean:
+                return (0, 0)
+        if not self.wakers:
+            return None
+        passes = (self.deadline - now) // cycles    # every pass ends at or before the deadline
+        if steps_left is not None:
+            passes = min(passes, steps_left // length)
+        if passes <= 0:
+            return (0, 0)
+        if self.trace is not None:
+            self.trace.skip(pc, now, passes * length)
+        self.last_poll = (pc, self.services, now + passes * cycles)
+        return (passes * length, passes * cycles)
+
+    def power_stats(self, frequency=1000000, voltage=3.0, currents=CURRENTS):
+        """\
+        cycles, seconds and energy in J per power mode with a clock of
+        frequency Hz. currents are in uA, the active one at 1 MHz and
+        taken to grow with the clock.
+        """
+        cycles = dict(self.sleep_cycles)
+        cycles[ACTIVE] = self.cycles - sum(self.sleep_cycles.values())
+        stats = {}
+        for mode in POWER_MODES:
+            seconds = cycles[mode] / frequency
+            current = currents[mode] * (frequency / 1e6 if mode == ACTIVE else 1)
+            stats[mode] = {'cycles': cycles[mode], 'seconds': seconds, 'energy': voltage * current * 1e-6 * seconds}
+        return stats
+
+    def interrupt_stats(self):
+        """per vector: interrupts taken, taken while nested, lost, and latency in cycles from request to handler"""
+        stats = {}
+        for vector, (taken, nested, lost, low, high, total) in sorted(self.interrupts.items()):
+            stats[vector] = {
+                'taken': taken, 'nested': nested, 'lost': lost,
+                'latency_min': low if taken else None, 'latency_max': high if taken else None,
+                'latency_mean': total / taken if taken else None,
+            }
+        return stats
+
+    # snapshots
+    def snapshot(self):
+        """\
+        a Snapshot of the CPU and memory state. Pages that are the same as
+        in the last snapshot taken or restored are shared with it.
+        """
+        base = self.base.pages if self.base is not None else (ZERO_PAGE,) * PAGE_COUNT
+        memory = self.memory
+        if memory == b''.join(base):
+            pages = base
+        else:
+            pages = []
+            for start, page in zip(range(0, 0x10000, PAGE_SIZE), base):
+                if memory[start:start + PAGE_SIZE] != page:
+                    page = bytes(memory[start:start + PAGE_SIZE])
+                pages.append(page)
+        self.base = Snapshot(
+            tuple(self.regs), self.cycles, self.steps, tuple(pages), self.depth,
+            tuple((vector, time, maskable) for vector, (time, maskable) in sorted(self.pending.items())),
+            tuple((vector,) + tuple(stats) for vector, stats in sorted(self.interrupts.items())),
+            tuple(self.sleep_cycles[mode] for mode in POWER_MODES[1:]))
+        return self.base
+
+    def restore(self, snapshot):
+        """\
+        go back to the state of snapshot. Cached code is kept unless the
+        page it was decoded from changed. Scheduled events are dropped like
+        in reset(), pending interrupts restored.
+        """
+        memory = snapshot.memory()
+        if self.memory != memory:
+            code = self.code
+            address = code.find(1)
+            while address >= 0:                 # the pages with cached code
+                start = address & -PAGE_SIZE
+                if self.memory[start:start + PAGE_SIZE] != snapshot.pages[start >> PAGE_BITS]:
+                    self.memory[start:start + PAGE_SIZE] = snapshot.pages[start >> PAGE_BITS]
+                    for address in range(address, start + PAGE_SIZE):
+                        if code[address]:
+                            self.invalidate(address)
+                address = code.find(1, start + PAGE_SIZE)
+            self.memory[:] = memory
+        self.regs = list(snapshot.regs)
+        self.cycles = snapshot.cycles
+        self.steps = snapshot.steps
+        self.events = []
+        self.wakers = 0
+        self.pending = {vector: (time, maskable) for vector, time, maskable in snapshot.pending}
+        self.deadline = 0
+        self.depth = snapshot.depth
+        self.interrupts = {record[0]: list(record[1:]) for record in snapshot.interrupts}
+        self.sleep_cycles = dict(zip(POWER_MODES[1:], snapshot.sleep_cycles))
+        self.last_poll = None
+        self.base = snapshot
+
+    # execution
+    def execute(self, insn):
+        """execute a decoded instruction, PC already points to it"""
+        pc = self.regs[PC]
+        self.regs[PC] = insn.next_pc
+        insn.execute(self, insn)
+        if self.trace is not None:
+            self.trace.instruction(self, pc, insn, self.cycles)
+        self.cycles += insn.cycles
+        self.steps += 1
+
+    def step(self):
+        """execute one instruction, after the events that are due; return the Decoded instruction"""
+        if self.cycles >= self.deadline:
+            self.service()
+        insn = self.fetch(self.regs[PC])
+        self.lookups += 1
+        self.execute(insn)
+        return insn
+
+    def run(self, max_steps=None, until=None):
+        """\
+        execute until PC reaches a breakpoint (not checked for the first
+        instruction, so run() continues from a breakpoint), the CPU halts
+        or idles, max_steps instructions were executed or the cycle count
+        reached until. returns why it stopped: BREAKPOINT, HALT, IDLE or
+        LIMIT. With CPUOFF set and an event to come, time passes to it.
+        With a trace set, instructions are executed one at a time.
+        """
+        self.until = NEVER if until is None else until
+        self.deadline = min(self.deadline, self.until)
+        trace = self.trace
+        if self.translate and trace is None:
+            return self.run_blocks(max_steps)
+        regs = self.regs
+        breakpoints = self.breakpoints
+        fetch = self.fetch
+        loops = self.loops
+        steps = 0
+        now = self.cycles
+        try:
+            while max_steps is None or steps < max_steps:
+                if now >= self.deadline:
+                    if now >= self.until:
+                        return LIMIT
+                    self.cycles = now
+                    self.service()
+                    now = self.cycles
+                pc = regs[PC]
+                if steps and pc in breakpoints:
+                    return BREAKPOINT
+                if regs[SR] & CPUOFF:
+                    self.cycles = now
+                    reason = self.sleep()
+                    now = self.cycles
+                    if reason is not None:
+                        return reason
+                    continue
+                insn = self.decoded[pc] or fetch(pc)
+                regs[PC] = insn.next_pc
+                insn.execute(self, insn)
+                if trace is not None:
+                    trace.instruction(self, pc, insn, now)
+                now += insn.cycles
+                steps += 1
+                if regs[PC] <= pc and insn.execute is exec_jump and loops.get(pc) is not False:
+                    skipped = self.poll(pc, now, None if max_steps is None else max_steps - steps)
+                    if skipped is None:
+                        return IDLE
+                    steps += skipped[0]
+                    now += skipped[1]
+            return LIMIT
+        finally:
+            self.steps += steps
+            self.cycles = now
+            self.lookups += steps
+            self.until = NEVER
+
+    def run_blocks(self, max_steps=None):
+        """\
+        run() with translated blocks. blocks end before breakpoints, a
+        block that does not fit in max_steps or would run past the next
+        event is run one instruction at a time.
+        """
+        regs, memory, code = self.regs, self.memory, self.code
+        loops = self.loops
+        breakpoints = self.breakpoints
+        if self.block_breakpoints != breakpoints:
+            self.blocks.clear()
+            self.block_breakpoints = set(breakpoints)
+        blocks = self.blocks
+        steps = 0
+        now = self.cycles
+        try:
+            while max_steps is None or steps < max_steps:
+                if now >= self.deadline:
+                    if now >= self.until:
+                        return LIMIT
+                    self.cycles = now
+                    self.service()
+                    now = self.cycles
+                pc = regs[PC]
+                if steps and pc in breakpoints:
+                    return BREAKPOINT
+                if regs[SR] & CPUOFF:
+                    self.cycles = now
+                    reason = self.sleep()
+                    now = self.cycles
+                    if reason is not None:
+                        return reason
+                    continue
+                block = blocks.get(pc) or self.translate_block(pc)
+                if (max_steps is not None and block.length > max_steps - steps) or \
+                        now + block.cycles[-2] >= self.deadline:
+                    insn = self.fetch(pc)
+                    self.lookups += 1
+                    regs[PC] = insn.next_pc
+                    insn.execute(self, insn)
+                    now += insn.cycles
+                    steps += 1
+                    jump_pc = pc if insn.execute is exec_jump else -1
+                else:
+                    count = block.function(self, regs, memory, code)
+                    steps += count
+                    now += block.cycles[count]
+                    jump_pc = block.jump_pc if count == block.length else -1
+                if regs[PC] <= jump_pc and loops.get(jump_pc) is not False:
+                    skipped = self.poll(jump_pc, now, None if max_steps is None else max_steps - steps)
+                    if skipped is None:
+                        return IDLE
+                    steps += skipped[0]
+                    now += skipped[1]
+            return LIMIT
+        finally:
+            self.steps += steps
+            self.cycles = now
+            self.until = NEVER
+
+    def add_breakpoint(self, address):
+        self.breakpoints.add(address)
+
+    def remove_breakpoint(self, address):
+        self.breakpoints.discard(address)
+
+    def __str__(self):
+        regs = self.regs
+        flags = ''.join(name if regs[SR] & bit else '-' for name, bit in (('V', V), ('N', N), ('Z', Z), ('C', C)))
+        lines = ['PC=%04x SP=%04x SR=%04x [%s]  %d instructions, %d cycles' % (
+                regs[PC], regs[SP], regs[SR], flags, self.steps, self.cycles)]
+        for row in range(4, 16, 6):
+            lines.append('  '.join('R%-2d=%04x' % (r, regs[r]) for r in range(row, min(row + 6, 16))))
+        return '\n'.join(lines)
+
+
+class Snapshot(object):
+    """\
+    the state of a Simulator: registers, counters, memory as PAGE_COUNT
+    bytes pages, interrupt state. Snapshots are not changed after they are
+    taken, so they share pages and can be restored any number of times.
+    """
+    __slots__ = ('regs', 'cycles', 'steps', 'pages', 'depth', 'pending', 'interrupts', 'sleep_cycles')
+
+    # file format: header, (vector, time, maskable) per pending interrupt,
+    # (vector, taken, nested, lost, latency min, max, total) per vector,
+    # a bitmap of the pages that are not zero, then those pages zlib compressed
+    MAGIC = b'MSP430S1'
+    HEADER = struct.Struct('<8s16HQQH5QHH')
+    PENDING = struct.Struct('<HQB')
+    INTERRUPT = struct.Struct('<H6Q')
+
+    def __init__(self, regs, cycles, steps, pages, depth=0, pending=(), interrupts=(), sleep_cycles=(0,) * 5):
+        self.regs = regs
+        self.cycles = cycles
+        self.steps = steps
+        self.pages = pages
+        self.depth = depth
+        self.pending = pending          # (vector, request cycles, maskable)
+        self.interrupts = interrupts    # (vector, taken, nested, lost, latency min, max, total)
+        self.sleep_cycles = sleep_cycles    # per low power mode, LPM0..LPM4
+
+    def __repr__(self):
+        return 'Snapshot(PC=0x%04x, %d cycles)' % (self.regs[PC], self.cycles)
+
+    def memory(self):
+        """the 64 KB of memory"""
+        return b''.join(self.pages)
+
+    def to_bytes(self):
+        used = [page != ZERO_PAGE for page in self.pages]
+        parts = [self.HEADER.pack(self.MAGIC, *(self.regs + (self.cycles, self.steps, self.depth) +
+                                               self.sleep_cycles + (len(self.pending), len(self.interrupts))))]
+        parts.extend(self.PENDING.pack(*record) for record in self.pending)
+        parts.extend(self.INTERRUPT.pack(*record) for record in self.interrupts)
+        parts.append(bytes(sum(used[i + bit] << bit for bit in range(8)) for i in range(0, PAGE_COUNT, 8)))
+        parts.append(zlib.compress(b''.join(page for page, is_used in zip(self.pages, used) if is_used)))
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        if len(data) < cls.HEADER.size or data[:8] != cls.MAGIC:
+            raise ValueError('not a simulator snapshot')
+        fields = cls.HEADER.unpack_from(data)
+        regs, (cycles, steps, depth), sleep_cycles = fields[1:17], fields[17:20], fields[20:25]
+        pending_count, interrupt_count = fields[25:27]
+        offset = cls.HEADER.size
+        pending = []
+        for _ in range(pending_count):
+            vector, time, maskable = cls.PENDING.unpack_from(data, offset)
+            pending.append((vector, time, bool(maskable)))
+            offset += cls.PENDING.size
+        interrupts = []
+        for _ in range(interrupt_count):
+            interrupts.append(cls.INTERRUPT.unpack_from(data, offset))
+            offset += cls.INTERRUPT.size
+        bitmap = data[offset:offset + PAGE_COUNT // 8]
+        try:
+            used = zlib.decompress(data[offset + PAGE_COUNT // 8:])
+        except zlib.error as e:
+            raise ValueError('corrupt snapshot: %s' % (e,))
+        pages = []
+        start = 0
+        for i in range(PAGE_COUNT):
+            if bitmap[i >> 3] & (1 << (i & 7)):
+                pages.append(used[start:start + PAGE_SIZE])
+                start += PAGE_SIZE
+            else:
+                pages.append(ZERO_PAGE)
+        if start != len(used):
+            raise ValueError('corrupt snapshot: the page data does not match its bitmap')
+        return cls(regs, cycles, steps, tuple(pages), depth, tuple(pending), tuple(interrupts), sleep_cycles)
+
+    def save(self, filename):
+        with open(filename, 'wb') as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, 'rb') as f:
+            return cls.from_bytes(f.read())
+
+
+class Timer(object):
+    """\
+    a periodic interrupt source, like a timer in up mode with its own
+    vector: requests vector every period cycles, first at start (default
+    one period from now). reset() of the simulator drops it.
+    """
+    def __init__(self, sim, vector, period, start=None):
+        if period <= 0:
+            raise ValueError('timer period must be positive: %d' % (period,))
+        self.sim = sim
+        self.vector = vector
+        self.period = period
+        self.expirations = 0
+        self.running = True
+        sim.schedule(sim.cycles + period if start is None else start, self.expire)
+
+    def expire(self, time):
+        if not self.running:
+            return
+        self.expirations += 1
+        self.sim.request_interrupt(self.vector, time)
+        self.sim.schedule(time + self.period, self.expire)
+
+    def stop(self):
+        self.running = False
+
+
+def assemble(source):
+    """object code of assembler source, SimulatorError if it does not assemble"""
+    assembler.reset()
+    assembler.pass1(source)
+    if not assembler.errors:
+        assembler.pass2()
+    if assembler.errors:
+        raise SimulatorError('assembler errors:\n%s' % '\n'.join(assembler.errors))
+    return list(assembler.object_code)
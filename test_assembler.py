@@ -0,0 +1,89 @@
+import pytest
+
+import assembler
+import disassembler
+import memory
+import simulator
+
+
+def assemble(lines):
+    """object code of source lines, assembled at 0xf000"""
+    assembler.reset()
+    assembler.pass1('START F000\n%s\nEND\n' % '\n'.join(lines))
+    assert not assembler.errors
+    assembler.pass2()
+    return list(assembler.object_code)
+
+
+def disassemble(object_code):
+    dis = disassembler.MSP430Disassembler(memory.from_object_code(object_code))
+    end = max(address for address, word in object_code) + 2
+    address = 0xf000
+    while address < end:
+        insn = dis.decode_at(address)
+        yield address, insn
+        address += 2 * len(insn.used_words)
+
+
+@pytest.mark.parametrize('name', sorted(assembler.EMULATED))
+def test_emulated_instruction_round_trip(name):
+    opcode, src, dst = assembler.EMULATED[name]
+    operand = ['R5'] if '{op}' in (src, dst) else []
+    object_code = assemble([' '.join([name] + operand)])
+    assert len(object_code) == 1                # constant generator or registers only, no extension word
+    [(address, insn)] = list(disassemble(object_code))
+    assert str(insn).split() == [name.lower()] + operand
+    line_no, cycles = assembler.object_info[0]
+    assert cycles == simulator.Simulator(object_code).decode(0xf000).cycles
+
+
+@pytest.mark.parametrize('value, word', [
+    ('0', 0x4305), ('1', 0x4315), ('2', 0x4325), ('-1', 0x4335), ('0FFFF', 0x4335), ('4', 0x4225), ('8', 0x4235),
+])
+def test_constant_generator_immediates(value, word):
+    assert assemble(['MOV #%s, R5' % value]) == [(0xf000, word)]
+
+
+def test_other_immediates_take_an_extension_word():
+    assert assemble(['MOV #10, R5', 'MOV #3, R5']) == [
+        (0xf000, 0x4035), (0xf002, 0x0010), (0xf004, 0x4035), (0xf006, 0x0003)]
+
+
+def test_labels_are_not_constants():
+    # FOUR is at 4, a constant generator value, but pass1 sizes #FOUR before it knows that
+    assembler.reset()
+    assembler.pass1('START 0\nMOV #FOUR, R5\nFOUR: NOP\nEND\n')
+    assembler.pass2()
+    assert assembler.object_code == [(0, 0x4035), (2, 4), (4, 0x4303)]
+
+
+@pytest.mark.parametrize('line, words', [
+    ('MOV R5, 0(R4)', [0x4584, 0x0000]),
+    ('MOV 6(R4), R5', [0x4415, 0x0006]),
+    ('MOV #1234, &0200', [0x40b2, 0x1234, 0x0200]),       # two extension words, in order
+    ('MOV &0200, 2(R6)', [0x4296, 0x0200, 0x0002]),
+    ('PUSH @R5', [0x1225]),
+    ('PUSH #10', [0x1230, 0x0010]),
+    ('SWPB R7', [0x1087]),
+    ('CALL #F010', [0x12b0, 0xf010]),
+])
+def test_operand_encoding(line, words):
+    object_code = assemble([line])
+    assert object_code == [(0xf000 + 2 * i, word) for i, word in enumerate(words)]
+
+
+def test_label_operands():
+    object_code = assemble([
+        'CALL #SUB',            # f000
+        'MOV VALUE, R6',        # f004, symbolic: PC relative to the extension word
+        'MOV R6, VALUE',        # f008
+        'SUB: RET',             # f00c
+        'VALUE: NOP',           # f00e
+    ])
+    assert object_code == [
+        (0xf000, 0x12b0), (0xf002, 0xf00c),
+        (0xf004, 0x4016), (0xf006, 0xf00e - 0xf006),
+        (0xf008, 0x4680), (0xf00a, 0xf00e - 0xf00a),
+        (0xf00c, 0x4130),
+        (0xf00e, 0x4303),
+    ]
@@ -0,0 +1,90 @@
+import pytest
+
+import simulator
+
+batch = pytest.importorskip('batch')
+numpy = pytest.importorskip('numpy')
+
+MULTIPLY = """\
+START F000
+MUL:    CLR R14
+        MOV #10, R15
+LOOP:   BIT #1, R12
+        JEQ SKIP
+        ADD R13, R14
+SKIP:   RLA R13
+        CLRC
+        RRC R12
+        DEC R15
+        JNE LOOP
+        RET
+END
+"""
+
+PATCH = """\
+START F000
+MAIN:   MOV #432C, &PATCH
+PATCH:  MOV #1, R12
+        RET
+END
+"""
+
+
+def call(object_code, address, args=(), stack=0x0400):
+    """a Simulator after calling the routine at address, like BatchSimulator.call()"""
+    sim = simulator.Simulator(object_code)
+    for reg, arg in zip(range(12, 16), args):
+        sim.regs[reg] = arg & 0xffff
+    sim.regs[simulator.SP] = stack - 2
+    sim.write_word(stack - 2, 0)
+    sim.regs[simulator.PC] = address
+    sim.breakpoints.add(0)
+    assert sim.run(10000) == simulator.BREAKPOINT
+    return sim
+
+
+def test_batch_matches_scalar():
+    object_code = simulator.assemble(MULTIPLY)
+    a = [0, 1, 3, 0x3ff, 7, 100, 0x155, 2]
+    b = [0, 5, 0x101, 3, 0x7fff, 0x40, 0x0abc, 0xffff]
+    sims = batch.BatchSimulator(object_code, len(a))
+    reasons = sims.call(0xf000, (a, b))
+    assert [batch.REASONS[r] for r in reasons] == [simulator.BREAKPOINT] * len(a)
+    for i in range(len(a)):
+        sim = call(object_code, 0xf000, (a[i], b[i]))
+        assert [int(r) for r in sims.regs[:, i]] == sim.regs
+        assert int(sims.cycles[i]) == sim.cycles
+        assert int(sims.steps[i]) == sim.steps
+        assert sims.memory_of(i) == bytes(sim.memory)
+    assert int(sims.regs[14, 3]) == (0x3ff * 3) & 0xffff
+
+
+def test_store_to_code_not_run_yet():
+    object_code = simulator.assemble(PATCH)
+    assert call(object_code, 0xf000).regs[12] == 2     # the simulator runs the patched code
+    with pytest.raises(simulator.SimulatorError, match='0xf006'):
+        batch.BatchSimulator(object_code, 3).call(0xf000)
+
+
+def test_store_to_code_already_run():
+    object_code = simulator.assemble(PATCH)
+    sims = batch.BatchSimulator(object_code, 3)
+    sims.call(0xf006)
+    with pytest.raises(simulator.SimulatorError, match='0xf006'):
+        sims.write_word(0xf006, 0x432c)
+
+
+def test_restore_from_snapshot():
+    object_code = simulator.assemble(MULTIPLY)
+    sim = call(object_code, 0xf000, (3, 5))
+    sim.write_word(0x0200, 0x1234)
+    snapshot = sim.snapshot()
+    sims = batch.BatchSimulator(object_code, 4)
+    sims.restore(snapshot)
+    for i in range(4):
+        assert [int(r) for r in sims.regs[:, i]] == sim.regs
+        assert int(sims.cycles[i]) == sim.cycles and int(sims.steps[i]) == sim.steps
+        assert sims.memory_of(i) == bytes(sim.memory)
+    sims.call(0xf000, ([1, 2, 3, 4], 7))
+    assert [int(r) for r in sims.regs[14]] == [7, 14, 21, 28]
+    assert all(int(sims.cycles[i]) > sim.cycles for i in range(4))
@@ -0,0 +1,105 @@
+import io
+import random
+
+import pytest
+
+import assembler
+import memory
+from disassembler import BulkDecoder, ControlFlow, MSP430Disassembler, decode_opcode
+
+
+def disassemble(words, msp430x=False, start=0xf000):
+    data = b''.join(word.to_bytes(2, 'little') for word in words)
+    dis = MSP430Disassembler(memory.Memory([memory.Segment(start, data)]), msp430x=msp430x)
+    return [str(insn).split() for insn in dis.iter_instructions()]
+
+
+def test_calla_is_not_reti():
+    for opcode in range(0x1340, 0x13c0):
+        assert decode_opcode(opcode, msp430x=True).name != 'reti', hex(opcode)
+        assert disassemble([opcode, 0x0010], msp430x=True)[0][0] != 'reti', hex(opcode)
+    assert decode_opcode(0x1344, msp430x=True).name == 'calla'
+    assert disassemble([0x1300], msp430x=True) == [['reti']]
+    assert disassemble([0x1300]) == [['reti']]
+
+
+def test_calla_operands():
+    lines = disassemble([0x1344, 0x1354, 0x0010, 0x1384, 0x2345, 0x13b1, 0x2345, 0x1300], msp430x=True)
+    assert lines == [
+        ['calla', 'R4'],
+        ['calla', '0x0010(R4)'],
+        ['calla', '&0x00042345'],
+        ['calla', '#0x00012345'],
+        ['reti'],
+    ]
+
+
+@pytest.mark.parametrize('msp430x', [False, True])
+def test_bulk_decoder_matches_decode(msp430x):
+    pytest.importorskip('numpy')
+    data = random.Random(430).getrandbits(8 * 0x4000).to_bytes(0x4000, 'little')
+    segment = memory.Segment(0x4000, data)
+    decoded = MSP430Disassembler(memory.Memory([segment]), msp430x=msp430x).decode(segment)
+    bulk = BulkDecoder(segment, msp430x=msp430x)
+    assert bulk.addresses().tolist() == [insn.address for insn in decoded]
+    assert [(insn.address, insn.used_words, str(insn)) for insn in bulk.instructions()] == [
+            (insn.address, insn.used_words, str(insn)) for insn in decoded]
+    part = [insn for insn in decoded if 0x5000 <= insn.address < 0x5100]
+    assert [str(insn) for insn in bulk.instructions(0x5000, 0x5100)] == [str(insn) for insn in part]
+
+
+def test_streamed_listing_matches_iter_instructions():
+    def segment(start, words):
+        return memory.Segment(start, b''.join(word.to_bytes(2, 'little') for word in words))
+    segments = [segment(0xf000, [0x4031, 0x0400, 0x4506, 0x5437, 0x1205, 0x4130]),
+                segment(0xe000, [0x4215, 0x0200, 0x4303])]
+    expected = [str(insn).rstrip() for insn in MSP430Disassembler(memory.Memory(segments)).iter_instructions()]
+    output = io.StringIO()
+    MSP430Disassembler(memory.Memory(segments)).disassemble(output, source_only=True)
+    listed = [line[8:].split(' ;')[0].rstrip() for line in output.getvalue().splitlines()
+              if line.strip() and not line.startswith(';')]     # segment headers, block gaps
+    assert '\n'.join(listed) == '\n'.join(expected)
+    assert expected[0].split() == ['mov', '&0x0200,', 'R5']
+
+
+LOOP_AND_TABLE = '''\
+START F000
+MAIN:   MOV #5, R5
+LOOP:   ADD R5, R6
+        SUB #1, R5
+        JNE LOOP
+        MOV R6, R12
+        RET
+TABLE:  MOV #1234, R7       ; never reached, a data table
+        MOV #5678, R7
+END
+'''
+
+
+def test_control_flow_blocks():
+    assembler.reset()
+    assembler.pass1(LOOP_AND_TABLE)
+    assembler.pass2()
+    assert not assembler.errors
+    image = memory.from_object_code(assembler.object_code)
+    flow = ControlFlow(image, entries=[0xf000])
+    blocks = [(block.start, block.end, block.count, block.successors) for block in
+              sorted(flow.blocks.values(), key=lambda block: block.start)]
+    assert blocks == [
+        (0xf000, 0xf004, 1, (0xf004,)),
+        (0xf004, 0xf00a, 3, (0xf004, 0xf00a)),  # LOOP ends at the JNE, both ways are blocks
+        (0xf00a, 0xf00e, 2, ()),                # ends with the RET
+    ]
+    assert list(flow.data_ranges()) == [(0xf00e, 0xf016)]
+    assert flow.is_code(0xf00c) and not flow.is_code(0xf00e)
+    # the cycles of a block add up those the disassembler lists for its instructions
+    dis = MSP430Disassembler(image)
+    for block in flow.blocks.values():
+        cycles = 0
+        address = block.start
+        while address < block.end:
+            insn = dis.decode_at(address)
+            cycles += insn.cycles
+            address += 2 * len(insn.used_words)
+        assert block.cycles == cycles
+    assert [flow.blocks[start].cycles for start in (0xf000, 0xf004, 0xf00a)] == [2, 4, 3]
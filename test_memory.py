@@ -0,0 +1,113 @@
+import io
+
+import pytest
+
+import memory
+from memory import Memory, Segment
+
+
+def test_segment_at_finds_segments_added_out_of_order():
+    image = Memory([Segment(0xf000, bytes(4))])
+    image.add(Segment(0x0200, bytes(2)))
+    image.add(Segment(0xe000, bytes(16)))
+    assert image.starts == [0x0200, 0xe000, 0xf000]
+    assert image.segment_at(0x0201).startaddress == 0x0200
+    assert image.segment_at(0xe00f).startaddress == 0xe000
+    assert image.segment_at(0xf003).startaddress == 0xf000
+    assert image.segment_at(0x0202) is None
+    assert image.segment_at(0x0100) is None
+    assert image.segment_at(0xf004) is None
+
+
+def test_from_object_code_joins_contiguous_words():
+    image = memory.from_object_code([(0xf002, 0x1234), (0xf000, 0x4031), (0xfffe, 0xf000)])
+    assert image.starts == [0xf000, 0xfffe]
+    assert bytes(image.segments[0].data) == b'\x31\x40\x34\x12'
+    assert image.segment_at(0xfffe).word_stream().word_at(0xfffe) == 0xf000
+
+
+def ihex_record(kind, address, data):
+    record = bytes([len(data), address >> 8, address & 0xff, kind]) + bytes(data)
+    return ':%s%02X' % (record.hex().upper(), -sum(record) & 0xff)
+
+
+def test_load_ihex():
+    lines = [
+        ihex_record(0x00, 0xf000, [0x31, 0x40, 0x00, 0x04]),
+        ihex_record(0x00, 0xf004, [0x03, 0x43]),
+        ihex_record(0x00, 0xfffe, [0x00, 0xf0]),
+        ihex_record(0x04, 0x0000, [0x00, 0x01]),      # extended linear address 0x10000
+        ihex_record(0x00, 0x0010, [0xaa]),
+        ihex_record(0x01, 0x0000, []),
+        ihex_record(0x00, 0x0100, [0xbb]),            # after the end of file record
+    ]
+    image = memory.load_ihex(lines)
+    assert image.starts == [0xf000, 0xfffe, 0x10010]
+    assert bytes(image.segments[0].data) == b'\x31\x40\x00\x04\x03\x43'
+    assert bytes(image.segment_at(0x10010).data) == b'\xaa'
+
+
+@pytest.mark.parametrize('line, message', [
+    ('0200000031400D', 'does not start'),
+    (':0200000031400E', 'checksum'),
+    (':03000000314000', 'length'),
+])
+def test_load_ihex_errors(line, message):
+    with pytest.raises(ValueError, match=message):
+        memory.load_ihex(['', line])
+
+
+def test_load_titxt():
+    image = memory.load_titxt(['@F000', '31 40 00 04', '03 43', '', '@FFFE', '00 F0', 'q', '@0200', '11'])
+    assert image.starts == [0xf000, 0xfffe]
+    assert bytes(image.segments[0].data) == b'\x31\x40\x00\x04\x03\x43'
+    assert image.segment_at(0xfffe).word_stream().word_at(0xfffe) == 0xf000
+    with pytest.raises(ValueError, match='line 1'):
+        memory.load_titxt(['31 40'])
+
+
+def test_load_bin(tmp_path):
+    data = bytes(range(16))
+    image = memory.load_bin(io.BytesIO(data), 0xf000)
+    assert image.starts == [0xf000]
+    assert bytes(image.segments[0].data) == data
+    (tmp_path / 'image.bin').write_bytes(data)
+    image = memory.load(str(tmp_path / 'image.bin'))
+    assert isinstance(image.segments[0].data, memoryview)       # mapped, not read
+    assert image.segments[0].word_stream().word_at(2) == 0x0302
+
+
+def test_load_guesses_the_format_and_caches_it(tmp_path):
+    path = tmp_path / 'image.txt'
+    path.write_text('@F000\n31 40 00 04\nq\n')
+    image = memory.load(str(path))
+    assert bytes(image.segments[0].data) == b'\x31\x40\x00\x04'
+    assert (tmp_path / 'image.txt.titxt.segcache').exists()
+    cached = memory.load(str(path))
+    assert cached.starts == [0xf000] and bytes(cached.segments[0].data) == b'\x31\x40\x00\x04'
+    path = tmp_path / 'output.hex'
+    path.write_text('0xF000: 0x4031\n0xF002: 0x0400\n')
+    assert bytes(memory.load(str(path), cache=False).segments[0].data) == b'\x31\x40\x00\x04'
+    assert [p.name for p in tmp_path.iterdir() if p.suffix == '.tmp'] == []
+
+
+def test_failed_sidecar_write_leaves_no_temporary_file(tmp_path, monkeypatch):
+    path = tmp_path / 'image.txt'
+    path.write_text('@F000\n31 40\nq\n')
+
+    def replace(src, dst):
+        raise OSError('read-only')
+    monkeypatch.setattr(memory.os, 'replace', replace)
+    image = memory.load(str(path))
+    assert bytes(image.segments[0].data) == b'\x31\x40'
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['image.txt']
+
+
+def test_sidecar_from_a_stale_stat_is_not_used(tmp_path):
+    path = tmp_path / 'image.txt'
+    path.write_text('@F000\n31 40\nq\n')
+    stat = path.stat()
+    path.write_text('@F000\n31 40 03 43\nq\n')      # changed while being parsed
+    memory.write_sidecar(str(path), 'titxt', memory.load_titxt(['@F000', '31 40']), stat)
+    assert memory.read_sidecar(str(path), 'titxt') is None
+    assert bytes(memory.load(str(path)).segments[0].data) == b'\x31\x40\x03\x43'
@@ -0,0 +1,68 @@
+import peripherals
+
+HEADER = """\
+#define P1OUT_ 0x0021
+SFR_8BIT(P1OUT);
+#define P1DIR_ 0x0022
+SFR_8BIT(P1DIR);
+#define WDTCTL_ 0x0120
+SFR_16BIT(WDTCTL);
+#define WDTHOLD (0x0080)
+#define WDTPW (0x5A00)
+#define IE1_ 0x0000
+SFR_8BIT(IE1);
+#define WDTIE (0x01)
+"""
+
+
+def test_lookup_by_name_and_address():
+    device = peripherals.Peripherals.from_definitions(*peripherals.parse_header(HEADER))
+    assert device.sorted_names == ['IE1', 'P1DIR', 'P1OUT', 'WDTCTL']
+    assert device.address_of('P1OUT') == 0x0021
+    assert device.address_of('WDTCTL') == 0x0120
+    assert device.address_of('IE1') == 0x0000
+    assert device.address_of('P1') is None
+    assert device.address_of('ZZZ') is None
+    assert device.name_at(0x0022) == 'P1DIR'
+    assert device.bits('WDTCTL') == [(0x0080, 'WDTHOLD')]
+    assert device.value_name('WDTCTL', 0x5A00) == 'WDTPW'
+    assert device.bits('IE1') == [(0x01, 'WDTIE')]
+
+
+def test_sidecar_round_trip(tmp_path):
+    header = tmp_path / 'device.h'
+    header.write_text(HEADER)
+    parsed = peripherals.load(str(header))
+    assert (tmp_path / 'device.h.symcache').exists()
+    cached = peripherals.read_sidecar(str(header))
+    assert cached is not None
+    assert cached.sorted_names == parsed.sorted_names
+    assert list(cached.registers()) == list(parsed.registers())
+    assert cached.address_of('P1DIR') == 0x0022
+
+
+def test_assembler_resolves_register_names(tmp_path):
+    import assembler
+    header = tmp_path / 'device.h'
+    header.write_text(HEADER)
+    assembler.load_peripherals(str(header))
+    try:
+        assembler.reset()
+        assert assembler.symbol_value('P1OUT', 1) == 0x0021
+        assert not assembler.errors
+    finally:
+        assembler.PERIPHERALS = None
+
+
+def test_sidecar_is_tagged_with_the_stat_before_parsing(tmp_path, monkeypatch):
+    header = tmp_path / 'device.h'
+    header.write_text(HEADER)
+    parse = peripherals.parse
+
+    def parse_and_edit(filename, text):
+        header.write_text(HEADER + '#define P2OUT_ 0x0029\nSFR_8BIT(P2OUT);\n')    # changed meanwhile
+        return parse(filename, text)
+    monkeypatch.setattr(peripherals, 'parse', parse_and_edit)
+    assert peripherals.load(str(header)).address_of('P2OUT') is None
+    assert peripherals.read_sidecar(str(header)) is None
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['device.h', 'device.h.symcache']
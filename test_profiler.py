@@ -0,0 +1,137 @@
+import pytest
+
+import profiler
+import simulator
+
+# MAIN calls MUL and FACT 0x20 times, FACT calls DOWN, which recurses twice
+SOURCE = """\
+START F000
+MAIN:   MOV #0400, SP
+        EINT
+        MOV #0, R10
+AGAIN:  MOV #5, R12
+        MOV #7, R13
+        CALL #MUL
+        CALL #FACT
+        INC R10
+        CMP #20, R10
+        JNE AGAIN
+        DINT
+        BIS #10, SR
+MUL:    CLR R14
+        MOV #10, R15
+LOOP:   BIT #1, R12
+        JEQ SKIP
+        ADD R13, R14
+SKIP:   RLA R13
+        CLRC
+        RRC R12
+        DEC R15
+        JNE LOOP
+        RET
+FACT:   MOV #3, R12
+        CALL #DOWN
+        RET
+DOWN:   DEC R12
+        JEQ DONE
+        CALL #DOWN
+DONE:   RET
+TICK:   INC R11
+        PUSH R12
+        PUSH R13
+        PUSH R14
+        PUSH R15
+        CALL #MUL
+        POP R15
+        POP R14
+        POP R13
+        POP R12
+        RETI
+END
+"""
+
+
+def profiled(interval=None, timer=None):
+    sim = simulator.Simulator(simulator.assemble(SOURCE))
+    symbols = dict(simulator.assembler.SYMTAB)
+    if timer:
+        sim.write_word(0xfff2, symbols['TICK'])
+        simulator.Timer(sim, 0xfff2, timer)
+    profile = profiler.Profiler(sim, interval)
+    assert sim.run(100000) == simulator.HALT
+    return sim, profile, symbols
+
+
+def symbol_cycles(profile, symbols):
+    """cycles per label of the flat profile"""
+    rows = {}
+    for line in list(profile.flat_profile(symbols))[1:-1]:
+        fields = line.split()
+        rows[fields[-1]] = int(fields[2])
+    return rows
+
+
+def test_exact_counts():
+    sim, profile, symbols = profiled()
+    assert sum(profile.counts) == sim.steps
+    assert profile.active_cycles() == sim.cycles
+    assert profile.counts[symbols['MUL']] == 0x20
+    assert profile.counts[symbols['LOOP']] == 0x20 * 0x10
+    assert profile.counts[symbols['DONE']] == 0x20 * 3
+
+
+def test_call_graph():
+    sim, profile, symbols = profiled()
+    functions, arcs = profile.call_graph_totals()
+    main, mul, fact, down = (symbols[name] for name in ('MAIN', 'MUL', 'FACT', 'DOWN'))
+    assert {function: stats[0] for function, stats in functions.items()} == {main: 0, mul: 0x20, fact: 0x20, down: 0x60}
+    assert {arc: stats[0] for arc, stats in arcs.items()} == {
+        (main, mul): 0x20, (main, fact): 0x20, (fact, down): 0x20, (down, down): 0x40}
+    assert functions[main][1] == sim.cycles
+    assert sum(stats[2] for stats in functions.values()) == sim.cycles
+    # recursive calls are part of the outermost DOWN only
+    assert functions[down][1] == arcs[(fact, down)][1] == functions[down][2]
+    assert functions[fact][1] == functions[fact][2] + functions[down][1]
+    assert functions[mul][1] == functions[mul][2] == arcs[(main, mul)][1]
+
+
+def test_interrupt_handlers_are_not_part_of_the_code_they_interrupt():
+    sim, profile, symbols = profiled(timer=300)
+    functions, arcs = profile.call_graph_totals()
+    taken = sim.interrupt_stats()[0xfff2]['taken']
+    assert taken > 0
+    assert arcs[('<interrupt 0xfff2>', symbols['TICK'])][0] == taken
+    assert functions[symbols['MUL']][0] == 0x20 + taken
+    assert profile.active_cycles() + profile.sleep_cycles == sim.cycles
+    assert profile.entry_cycles == taken * simulator.INTERRUPT_CYCLES
+    # the handlers include their entry, MUL called from TICK while it ran is no recursion
+    assert functions[symbols['MAIN']][1] + functions[symbols['TICK']][1] == sim.cycles
+    assert functions[symbols['MUL']][1] == functions[symbols['MUL']][2] == sum(
+            stats[1] for (caller, callee), stats in arcs.items() if callee == symbols['MUL'])
+
+
+@pytest.mark.parametrize('interval', [1, 7])
+def test_sampling_estimates_the_exact_profile(interval):
+    sim, exact, symbols = profiled()
+    sim, sampled, symbols = profiled(interval)
+    assert abs(sampled.active_cycles() + sampled.sleep_cycles - sim.cycles) <= interval
+    exact_cycles = symbol_cycles(exact, symbols)
+    sampled_cycles = symbol_cycles(sampled, symbols)
+    assert max(sampled_cycles, key=sampled_cycles.get) == max(exact_cycles, key=exact_cycles.get) == 'SKIP'
+    for name in ('SKIP', 'LOOP'):
+        assert sampled_cycles[name] == pytest.approx(exact_cycles[name], rel=0.1)
+    assert list(sampled.call_graph(symbols)) == ['no call graph when sampling']
+
+
+def test_sampling_interval_must_be_positive():
+    with pytest.raises(ValueError):
+        profiler.Profiler(simulator.Simulator(), 0)
+
+
+def test_listing_marks_hot_lines():
+    sim, profile, symbols = profiled()
+    lines = list(profile.listing(symbols))
+    hot = set(int(line.split()[4], 16) for line in lines if line[30:32] == '>>')
+    assert hot == set(pc for pc in range(0x10000) if profile.cycles[pc] >= profiler.HOT * sim.cycles)
+    assert symbols['LOOP'] in hot and symbols['MUL'] not in hot
+    assert 'LOOP:' in lines and 'DOWN:' in lines
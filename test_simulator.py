@@ -0,0 +1,282 @@
+import pytest
+
+import simulator
+
+ARITHMETIC = """\
+START F000
+        MOV #0280, SP
+        MOV #0200, R4
+        MOV #10, R5
+        CLR R6
+FILL:   MOV R5, 0(R4)
+        INCD R4
+        DEC R5
+        JNE FILL
+        MOV #0200, R4
+        MOV #10, R5
+SUM:    ADD @R4+, R6
+        DEC R5
+        JNE SUM
+        CALL #HALF
+        MOV R6, &0300
+        PUSH R6
+        POP R7
+        MOV #7FFF, R8
+        ADD #1, R8
+        MOV #1234, R9
+        SWPB R9
+        MOV #0080, R10
+        SXT R10
+        MOV #9999, R11
+        SETC
+        DADD #1, R11
+        CMP #5, R12
+        JL LESS
+        MOV #1, R13
+LESS:   MOV #0, R14
+DONE:   JMP DONE
+HALF:   RRA R6
+        RET
+END
+"""
+
+
+INTERRUPTS = """\
+START F000
+MAIN:   MOV #0400, SP
+        EINT
+WAIT:   BIT #1, &0200
+        JEQ WAIT
+        BIC #1, &0200
+        INC R11
+        CMP #30, R11
+        JNE WAIT
+        CLR R11
+SPIN:   CMP R12, R13
+        NOP
+        JNE SPIN
+        JMP WAIT
+TICK:   BIS #1, &0200
+        INC R10
+        CMP #8, R10
+        JNE OUT
+        MOV R10, R13
+        CLR R10
+OUT:    RETI
+END
+"""
+
+
+def state(sim):
+    return list(sim.regs), sim.cycles, sim.steps, bytes(sim.memory), sim.interrupt_stats(), sim.power_stats()
+
+
+def start(source, translate=False):
+    sim = simulator.Simulator(simulator.assemble(source), translate)
+    if source is INTERRUPTS:
+        sim.write_word(0xfff2, simulator.assembler.SYMTAB['TICK'])
+        simulator.Timer(sim, 0xfff2, 97)
+    return sim
+
+
+def test_arithmetic_program():
+    sim = start(ARITHMETIC)
+    assert sim.run(1000) == simulator.IDLE
+    regs = sim.regs
+    assert regs[6] == 0x44 and regs[7] == 0x44 and sim.read_word(0x0300) == 0x44    # (0x10 + ... + 1) / 2
+    assert regs[8] == 0x8000 and regs[9] == 0x3412 and regs[10] == 0xff80
+    assert regs[11] == 0x0001 and regs[13] == 0 and regs[14] == 0
+    assert regs[simulator.SP] == 0x0280
+
+
+@pytest.mark.parametrize('source', [ARITHMETIC, INTERRUPTS], ids=['arithmetic', 'interrupts'])
+@pytest.mark.parametrize('max_steps', [1, 7, 100, 5000])
+def test_translated_matches_interpreted(source, max_steps):
+    interpreted, translated = start(source), start(source, True)
+    for _ in range(4):
+        assert translated.run(max_steps) == interpreted.run(max_steps)
+        assert state(translated) == state(interpreted)
+    assert translated.cache_stats()['translations'] > 0
+
+
+@pytest.mark.parametrize('source, label', [(ARITHMETIC, 'SUM'), (INTERRUPTS, 'OUT')], ids=['arithmetic', 'interrupts'])
+def test_translated_breakpoints(source, label):
+    interpreted, translated = start(source), start(source, True)
+    for sim in interpreted, translated:
+        sim.add_breakpoint(simulator.assembler.SYMTAB[label])
+    for _ in range(0x10):
+        assert translated.run(100000) == interpreted.run(100000) == simulator.BREAKPOINT
+        assert state(translated) == state(interpreted)
+
+
+def test_interrupts():
+    sim = start(INTERRUPTS)
+    assert sim.run(until=97 * 100) == simulator.LIMIT
+    stats = sim.interrupt_stats()[0xfff2]
+    assert stats['taken'] == 99 and stats['nested'] == 0 and stats['lost'] == 0
+    assert stats['latency_min'] >= simulator.INTERRUPT_CYCLES
+    assert sim.regs[10] == 99 % 8 and sim.regs[13] == 8
+
+
+def test_masked_interrupt_is_taken_after_eint_and_repeats_are_lost():
+    sim = simulator.Simulator(simulator.assemble(INTERRUPTS))
+    sim.write_word(0xfff2, simulator.assembler.SYMTAB['TICK'])
+    sim.request_interrupt(0xfff2)
+    sim.request_interrupt(0xfff2)
+    sim.step()                                      # MOV #0400, SP, GIE is still clear
+    assert sim.interrupt_stats()[0xfff2]['taken'] == 0
+    sim.step()                                      # EINT
+    sim.step()                                      # taken, then BIS #1, &0200 of the handler
+    assert sim.regs[simulator.PC] == simulator.assembler.SYMTAB['TICK'] + 4
+    assert sim.read_word(0x03fe) == simulator.assembler.SYMTAB['WAIT']     # return address
+    stats = sim.interrupt_stats()[0xfff2]
+    assert stats['taken'] == 1 and stats['lost'] == 1
+
+
+def test_run_stops_at_breakpoints_halt_and_limit():
+    sim = start(ARITHMETIC)
+    half = simulator.assembler.SYMTAB['HALF']
+    sim.add_breakpoint(half)
+    assert sim.run(1000) == simulator.BREAKPOINT and sim.regs[simulator.PC] == half
+    assert sim.run(1) == simulator.LIMIT                # continues from the breakpoint
+    sim = start('START F000\nMOV #0010, SR\nNOP\nEND\n')   # CPUOFF
+    assert sim.run(10) == simulator.HALT and sim.regs[simulator.PC] == 0xf004
+
+
+@pytest.mark.parametrize('translate', [False, True])
+def test_self_modifying_code(translate):
+    sim = simulator.Simulator(simulator.assemble("""\
+START F000
+MAIN:   MOV #3, R5
+LOOP:   ADD #10, R4
+        ADD #5, &F006
+        DEC R5
+        JNE LOOP
+DONE:   JMP DONE
+END
+"""), translate)
+    assert sim.run(100) == simulator.IDLE
+    assert sim.regs[4] == 0x10 + 0x15 + 0x1a      # the immediate of ADD #10, R4 grows by 5 each pass
+    assert sim.cache_stats()['invalidations'] == 3
+
+
+def test_decode_cache_hits_in_loops():
+    sim = start(ARITHMETIC)
+    sim.run(1000)
+    stats = sim.cache_stats()
+    assert stats['lookups'] == sim.steps
+    assert stats['misses'] == sum(insn is not None for insn in sim.decoded)     # each instruction decoded once
+    assert stats['hit_rate'] > 0.5 and stats['invalidations'] == 0
+
+
+SLEEP = """\
+START F000
+MAIN:   MOV #0400, SP
+SLEEP:  BIS #00D8, SR       ; LPM3 with GIE
+        INC R5              ; not reached, the handler returns to LPM3
+        JMP SLEEP
+TICK:   INC R6
+        RETI
+END
+"""
+
+
+def never_skip(sim):
+    """make sim step through polling loops, as without fast-forwarding"""
+    sim.poll = lambda pc, now, steps_left=None: (0, 0) if sim.events else None
+
+
+@pytest.mark.parametrize('translate', [False, True])
+@pytest.mark.parametrize('until', [1000, 20011, 50000])
+def test_polling_loops_fast_forward_like_stepping(translate, until):
+    fast, stepped = start(INTERRUPTS, translate), start(INTERRUPTS, translate)
+    never_skip(stepped)
+    skipped = []
+    poll = fast.poll
+
+    def counting_poll(pc, now, steps_left=None):
+        result = poll(pc, now, steps_left)
+        if result:
+            skipped.append(result[0])
+        return result
+    fast.poll = counting_poll
+    for end in (until, 2 * until + 13):
+        assert fast.run(until=end) == stepped.run(until=end) == simulator.LIMIT
+        assert state(fast) == state(stepped)
+    assert sum(skipped) > 0
+
+
+def test_polling_loop_without_events_is_idle():
+    sim = simulator.Simulator(simulator.assemble(INTERRUPTS))  # no timer
+    assert sim.run(1000) == simulator.IDLE
+    assert sim.regs[simulator.PC] == simulator.assembler.SYMTAB['WAIT'] and sim.steps == 6   # after one whole pass
+
+
+def test_low_power_mode_skips_to_the_next_event():
+    sim = simulator.Simulator(simulator.assemble(SLEEP))
+    sim.write_word(0xfff2, simulator.assembler.SYMTAB['TICK'])
+    simulator.Timer(sim, 0xfff2, 1000)
+    assert sim.run(until=100000) == simulator.LIMIT
+    assert sim.cycles == 100000
+    assert sim.regs[6] == 99 and sim.regs[5] == 0
+    power = sim.power_stats(frequency=1000000)
+    assert power[simulator.LPM3]['cycles'] + power[simulator.ACTIVE]['cycles'] == 100000
+    assert power[simulator.ACTIVE]['cycles'] < 2000
+    assert power[simulator.LPM3]['seconds'] == power[simulator.LPM3]['cycles'] / 1e6
+    sim.regs[simulator.SR] &= ~simulator.GIE
+    assert sim.run(10) == simulator.HALT                # nothing can wake the CPU
+
+
+@pytest.mark.parametrize('translate', [False, True])
+def test_snapshot_round_trip(tmp_path, translate):
+    sim = start(ARITHMETIC, translate)
+    sim.run(20)
+    snapshot = sim.snapshot()
+    sim.run(1000)
+    want = state(sim)
+
+    sim.restore(snapshot)
+    assert sim.run(1000) == simulator.IDLE
+    assert state(sim) == want
+
+    snapshot.save(str(tmp_path / 'state.snap'))
+    loaded = simulator.Snapshot.load(str(tmp_path / 'state.snap'))
+    assert loaded.regs == snapshot.regs and loaded.cycles == snapshot.cycles
+    assert loaded.memory() == snapshot.memory()
+    other = simulator.Simulator(None, translate)
+    other.restore(loaded)
+    assert other.run(1000) == simulator.IDLE
+    assert state(other) == want
+
+
+def test_snapshot_keeps_pending_interrupts():
+    sim = simulator.Simulator(simulator.assemble(INTERRUPTS))    # no timer, restore() drops scheduled events
+    sim.write_word(0xfff2, simulator.assembler.SYMTAB['TICK'])
+    sim.run(until=500)
+    sim.request_interrupt(0xfff2)
+    snapshot = simulator.Snapshot.from_bytes(sim.snapshot().to_bytes())
+    assert [vector for vector, time, maskable in snapshot.pending] == [0xfff2]
+    sim.run(50)
+    want = state(sim)
+    other = simulator.Simulator()
+    other.restore(snapshot)
+    other.run(50)
+    assert state(other) == want
+
+
+def test_restore_keeps_unchanged_code():
+    sim = start(ARITHMETIC)
+    snapshot = sim.snapshot()
+    sim.run(1000)
+    misses = sim.cache_stats()['misses']
+    sim.restore(snapshot)
+    sim.run(1000)
+    assert sim.cache_stats()['misses'] == misses
+
+
+def test_corrupt_snapshot():
+    data = start(ARITHMETIC).snapshot().to_bytes()
+    with pytest.raises(ValueError):
+        simulator.Snapshot.from_bytes(b'not a snapshot')
+    with pytest.raises(ValueError):
+        simulator.Snapshot.from_bytes(data[:-4])
@@ -0,0 +1,100 @@
+import pytest
+
+import memory
+import simulator
+import tracing
+
+SOURCE = """\
+START F000
+MAIN:   MOV #0280, SP
+        MOV #5, R5
+        CLR R6
+LOOP:   ADD R5, R6
+        CALL #TWICE
+        DEC R5
+        JNE LOOP
+DONE:   JMP DONE
+TWICE:  RLA R6
+        RET
+END
+"""
+
+
+def traced(capacity, max_steps=1000):
+    """(simulator, trace, PCs of the instructions executed) of SOURCE"""
+    object_code = simulator.assemble(SOURCE)
+    reference = simulator.Simulator(object_code)
+    pcs = []
+    for _ in range(max_steps):
+        if reference.regs[simulator.PC] == simulator.assembler.SYMTAB['DONE']:
+            break
+        pcs.append(reference.regs[simulator.PC])
+        reference.step()
+    sim = simulator.Simulator(object_code)
+    sim.trace = trace = tracing.Trace(capacity)
+    sim.run(max_steps)
+    return sim, trace, pcs
+
+
+def test_records_every_instruction():
+    sim, trace, pcs = traced(1000)
+    records = list(trace.records())
+    assert trace.count == len(trace) == len(records) == sim.steps
+    assert [record[1] for record in records][:len(pcs)] == pcs
+    assert all(record[0] == tracing.INSTRUCTION for record in records)
+    cycles = [record[4] for record in records]
+    assert cycles == sorted(cycles) and cycles[0] == 0
+
+
+@pytest.mark.parametrize('capacity', [1, 7, 8, 9])
+def test_ring_buffer_keeps_the_last_records(capacity):
+    sim, full, pcs = traced(1000)
+    sim, trace, pcs = traced(capacity)
+    assert trace.count == full.count
+    assert len(trace) == capacity
+    assert list(trace.records()) == list(full.records())[-capacity:]
+
+
+def test_save_and_load(tmp_path):
+    sim, trace, pcs = traced(9)
+    trace.save(str(tmp_path / 'run.trace'))
+    loaded = tracing.Trace.load(str(tmp_path / 'run.trace'))
+    assert loaded.count == trace.count and loaded.capacity == 9
+    assert list(loaded.records()) == list(trace.records())
+    (tmp_path / 'short.trace').write_bytes((tmp_path / 'run.trace').read_bytes()[:-1])
+    with pytest.raises(ValueError):
+        tracing.Trace.load(str(tmp_path / 'short.trace'))
+
+
+def test_decode():
+    sim, trace, pcs = traced(1000)
+    symbols = dict(simulator.assembler.SYMTAB)
+    decoder = tracing.TraceDecoder(memory.from_object_code(simulator.assemble(SOURCE)), symbols)
+    lines = [line.split() for line in decoder.lines(trace.records())]
+    assert lines[0] == ['0', 'f000', 'MAIN', 'mov', '#0x0280,', 'SP', 'SP=0280']
+    assert lines[3][2:] == ['LOOP', 'add', 'R5,', 'R6', 'SR=0000', 'R6=0005']
+    assert lines[4][2:5] == ['LOOP+0x2', 'call', '#TWICE']
+    assert lines[5][2:] == ['TWICE', 'rla', 'R6', 'R6=000a']
+    assert lines[-1][2:5] == ['DONE', 'jmp', 'DONE']
+
+
+def test_interrupt_and_sleep_records():
+    sim = simulator.Simulator(simulator.assemble("""\
+START F000
+MAIN:   MOV #0400, SP
+        EINT
+        BIS #10, SR
+        JMP MAIN
+TICK:   BIC #10, 0(SP)
+        RETI
+END
+"""))
+    sim.write_word(0xfff2, simulator.assembler.SYMTAB['TICK'])
+    sim.trace = trace = tracing.Trace(100)
+    sim.schedule(50, lambda time: sim.request_interrupt(0xfff2, time))
+    sim.run(6)
+    kinds = [record[0] for record in trace.records()]
+    assert kinds == [tracing.INSTRUCTION] * 3 + [tracing.SLEEP, tracing.INTERRUPT] + [tracing.INSTRUCTION] * 3
+    sleep, interrupt = list(trace.records())[3:5]
+    assert sleep[1] == 0xf00a and (sleep[5] << 32 | sleep[6] << 16 | sleep[7]) > 0
+    assert interrupt[1:3] == (0xfff2, simulator.assembler.SYMTAB['TICK'])
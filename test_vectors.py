@@ -0,0 +1,97 @@
+from multiprocessing import shared_memory
+
+import pytest
+
+import simulator
+
+numpy = pytest.importorskip('numpy')
+vectors = pytest.importorskip('vectors')
+
+ADD = """\
+START F000
+ADD2:   ADD R13, R12
+        CMP #0FFFF, R13
+        JEQ HANG
+        RET
+HANG:   JMP HANG
+END
+"""
+
+VECTORS = """\
+# R12 R13 -> R12
+1 2 -> 3
+5 6 -> 0xb
+1 2 -> 4        # wrong expected value
+0x10 -1 -> 0xf  # R13 = -1 never returns
+"""
+
+
+def test_parse_vectors():
+    rows, width = vectors.parse_vectors(VECTORS.splitlines(), 4, 1)
+    assert width == 2
+    assert rows.dtype == numpy.uint16
+    assert rows.tolist() == [[1, 2, 3], [5, 6, 0xb], [1, 2, 4], [0x10, 0xffff, 0xf]]
+    rows, width = vectors.parse_vectors(['', '# nothing'], 4, 1)
+    assert width == 0 and rows.shape == (0, 1)
+
+
+@pytest.mark.parametrize('lines, message', [
+    (['1 2 -> 3', '1 -> 3'], 'line 2: expected 2 inputs and 1 outputs'),
+    (['1 2 -> 3', '1 2 3 -> 3'], 'line 2: expected 2 inputs'),
+    (['1 2 3 4 5 -> 3'], 'line 1: expected 4 inputs'),
+    (['1 2 -> 3 4'], 'line 1: expected 2 inputs and 1 outputs'),
+    (['1 2 3'], 'line 1'),
+])
+def test_parse_vectors_errors(lines, message):
+    with pytest.raises(ValueError, match=message):
+        vectors.parse_vectors(lines, 4, 1)
+
+
+@pytest.fixture
+def shared_blocks(monkeypatch):
+    """names of the shared memory blocks run_vectors() creates"""
+    names = []
+    share = vectors.share
+
+    def recording_share(array):
+        block, spec = share(array)
+        names.append(block.name)
+        return block, spec
+    monkeypatch.setattr(vectors, 'share', recording_share)
+    return names
+
+
+def assert_unlinked(names):
+    assert names
+    for name in names:
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=name)
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_run_vectors(jobs, shared_blocks):
+    object_code = simulator.assemble(ADD)
+    rows, width = vectors.parse_vectors(VECTORS.splitlines(), 2, 1)
+    status, cycles, got = vectors.run_vectors(object_code, vectors.entry_address('add2'), rows,
+                                              [12, 13], [12], jobs=jobs, chunk=2, max_steps=200)
+    assert status.tolist() == [vectors.PASS, vectors.PASS, vectors.FAIL, vectors.NO_RETURN]
+    assert got[:, 0].tolist()[:3] == [3, 0xb, 3]
+    assert cycles[0] == cycles[1] == cycles[2] > 0
+    assert vectors._worker == {}
+    assert_unlinked(shared_blocks)
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_run_vectors_releases_shared_memory_on_errors(jobs, shared_blocks):
+    object_code = simulator.assemble("""\
+START F000
+MAIN:   MOV #432C, &PATCH
+PATCH:  MOV #1, R12
+        RET
+END
+""")
+    rows, width = vectors.parse_vectors(['1 -> 1'], 1, 1)
+    with pytest.raises(simulator.SimulatorError, match='store to code'):
+        vectors.run_vectors(object_code, 0xf000, rows, [12], [12], jobs=jobs)
+    assert vectors._worker == {}
+    assert_unlinked(shared_blocks)
@@ -0,0 +1,277 @@
+"""\
+Execution trace of the simulator: a ring buffer of fixed size binary
+records, written while the simulator runs and decoded into a symbolized
+disassembly afterwards.
+
+Attach a Trace to Simulator.trace; run() then records every instruction
+(executed one at a time, translated blocks are not used while tracing),
+interrupt, sleep and skipped polling loop into a preallocated bytearray.
+Only the last capacity records are kept.
+
+    python tracing.py [-n COUNT] TRACE FILE
+
+decodes a trace written with simulate.py --trace; FILE is the program it
+ran (assembler source or image), for the disassembly and the labels.
+"""
+
+import argparse
+import bisect
+import struct
+import sys
+
+import assembler
+import disassembler
+import memory
+import simulator
+from simulator import PC, SP, SR, CG, REG, AUTOINC, exec_format1, exec_format2, op_mov, op_bic, op_bis, op_cmp, op_bit
+
+# record kinds
+INSTRUCTION, INTERRUPT, SLEEP, SKIP = range(4)
+
+# kind, pc, opcode word, mask of the written registers, cycles at the start,
+# values of the (up to three) written registers in register order. For
+# INTERRUPT pc is the vector and word the handler; for SLEEP word is the SR;
+# SLEEP and SKIP keep the cycles slept or the instructions skipped in the
+# three values, as one 48 bit number.
+RECORD = struct.Struct('<BxHHHQ3H2x')
+FILE_HEADER = struct.Struct('<8sIQ')
+MAGIC = b'MSP430T1'
+
+
+def written_registers(insn):
+    """(mask, r, r, r) of the registers other than the PC insn writes, padded with the constant generator"""
+    written = set()
+    if insn.execute is exec_format1:
+        if insn.op not in (op_mov, op_bic, op_bis):
+            written.add(SR)
+        if insn.op not in (op_cmp, op_bit) and insn.dst[0] == REG:
+            written.add(insn.dst[1])
+        if insn.src[0] == AUTOINC:
+            written.add(insn.src[1])
+    elif insn.execute is exec_format2:
+        if insn.dst == 'RETI':
+            written.update((SP, SR))
+        elif insn.dst in ('PUSH', 'CALL'):
+            written.add(SP)
+        else:
+            if insn.dst != 'SWPB':
+                written.add(SR)
+            if insn.src[0] == REG:
+                written.add(insn.src[1])
+        if insn.src is not None and insn.src[0] == AUTOINC:
+            written.add(insn.src[1])
+    registers = sorted(written - {PC, CG})
+    mask = 0
+    for reg in registers:
+        mask |= 1 << reg
+    return (mask,) + tuple(registers + [CG] * (3 - len(registers)))
+
+
+def split48(value):
+    return (value >> 32) & 0xffff, (value >> 16) & 0xffff, value & 0xffff
+
+
+class Trace(object):
+    """\
+    a ring buffer of the last capacity records. count is the number of
+    records written in total, the oldest count - capacity are overwritten.
+    """
+    def __init__(self, capacity=1 << 20):
+        if capacity <= 0:
+            raise ValueError('trace capacity must be positive: %d' % (capacity,))
+        self.capacity = capacity
+        self.buffer = bytearray(capacity * RECORD.size)
+        self.offset = 0                 # where the next record goes
+        self.count = 0
+        self.written = [None] * 0x10000     # pc --> (Decoded, word, mask, r, r, r)
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def clear(self):
+        self.offset = 0
+        self.count = 0
+
+    def _advance(self):
+        self.count += 1
+        self.offset += RECORD.size
+        if self.offset == len(self.buffer):
+            self.offset = 0
+
+    def instruction(self, sim, pc, insn, cycles):
+        """record insn, executed at pc from cycles on, with the registers it wrote"""
+        written = self.written[pc]
+        if written is None or written[0] is not insn:
+            written = self.written[pc] = (insn, sim.read_word(pc)) + written_registers(insn)
+        regs = sim.regs
+        RECORD.pack_into(self.buffer, self.offset, INSTRUCTION, pc, written[1], written[2], cycles,
+                         regs[written[3]], regs[written[4]], regs[written[5]])
+        self.count += 1                 # _advance(), inline on this path
+        self.offset += RECORD.size
+        if self.offset == len(self.buffer):
+            self.offset = 0
+
+    def interrupt(self, sim, vector, handler, cycles):
+        """record the entry into the handler of vector, SP and SR as they are in the handler"""
+        RECORD.pack_into(self.buffer, self.offset, INTERRUPT, vector, handler, (1 << SP) | (1 << SR), cycles,
+                         sim.regs[SP], sim.regs[SR], 0)
+        self._advance()
+
+    def sleep(self, pc, sr, cycles, slept):
+        RECORD.pack_into(self.buffer, self.offset, SLEEP, pc, sr, 0, cycles, *split48(slept))
+        self._advance()
+
+    def skip(self, pc, cycles, steps):
+        """record polling loop passes up to the jump at pc skipped from cycles on"""
+        RECORD.pack_into(self.buffer, self.offset, SKIP, pc, 0, 0, cycles, *split48(steps))
+        self._advance()
+
+    def data(self):
+        """the records in order, oldest first, as bytes"""
+        if self.count < self.capacity:
+            return bytes(self.buffer[:self.offset])
+        return bytes(self.buffer[self.offset:] + self.buffer[:self.offset])
+
+    def records(self):
+        """generate the records as (kind, pc, word, mask, cycles, value, value, value) tuples, oldest first"""
+        return RECORD.iter_unpack(self.data())
+
+    def save(self, filename):
+        with open(filename, 'wb') as f:
+            f.write(FILE_HEADER.pack(MAGIC, self.capacity, self.count))
+            f.write(self.data())
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, 'rb') as f:
+            data = f.read()
+        if len(data) < FILE_HEADER.size or data[:8] != MAGIC:
+            raise ValueError('%s: not a simulator trace' % (filename,))
+        magic, capacity, count = FILE_HEADER.unpack_from(data)
+        records = data[FILE_HEADER.size:]
+        if len(records) % RECORD.size or len(records) // RECORD.size != min(count, capacity):
+            raise ValueError('%s: truncated trace' % (filename,))
+        trace = cls(capacity)
+        trace.buffer[:len(records)] = records
+        trace.count = count
+        trace.offset = len(records) % len(trace.buffer)
+        return trace
+
+
+class TraceDecoder(object):
+    """\
+    formats trace records as text: cycles, address, label+offset,
+    disassembly of the code in image (a memory.Memory) and the registers
+    that changed. symbols maps labels to addresses, e.g. assembler.SYMTAB.
+    """
+    def __init__(self, image, symbols=None):
+        self.image = image
+        self.disassembler = disassembler.MSP430Disassembler(image)
+        by_address = sorted((address, name) for name, address in (symbols or {}).items())
+        self.addresses = [address for address, name in by_address]
+        self.names = [name for address, name in by_address]
+        self.labels = dict(by_address)
+        self.text = {}                  # (pc, word) --> disassembly
+        self.known = [None] * 16        # register values seen so far
+
+    def label(self, address):
+        """(address, name) of the label at or before address, None before the first"""
+        i = bisect.bisect_right(self.addresses, address) - 1
+        if i < 0:
+            return None
+        return self.addresses[i], self.names[i]
+
+    def symbol(self, address):
+        """LABEL, LABEL+0x4 or the address in hex"""
+        label = self.label(address)
+        if label is None:
+            return '0x%04x' % (address,)
+        if label[0] == address:
+            return label[1]
+        return '%s+0x%x' % (label[1], address - label[0])
+
+    def disassemble(self, pc, word):
+        key = (pc, word)
+        text = self.text.get(key)
+        if text is None:
+            try:
+                insn = self.disassembler.decode_at(pc)
+            except (IndexError, KeyError):
+                insn = None
+            if insn is None or insn.used_words[0] != word:
+                text = '.word   0x%04x' % (word,)      # the code changed since
+            elif insn.jumps() and isinstance(insn, disassembler.JumpInstruction):
+                text = insn.str_width_label(self.symbol(insn.targetAddress(pc + 2)))
+            elif insn.jumps() and insn.dst[0:1] == '#' and int(insn.dst[1:], 0) in self.labels:
+                text = insn.str_width_label(self.labels[int(insn.dst[1:], 0)])
+            else:
+                text = str(insn)
+            self.text[key] = text
+        return text
+
+    def changes(self, mask, values):
+        """'R5=0012 SR=0003' for the written registers whose value changed"""
+        changed = []
+        known = self.known
+        i = 0
+        for reg in range(16):
+            if mask & (1 << reg):
+                value = values[i]
+                i += 1
+                if known[reg] != value:
+                    known[reg] = value
+                    changed.append('%s=%04x' % (disassembler.regnames[reg], value))
+        return ' '.join(changed)
+
+    def format(self, record):
+        kind, pc, word, mask, cycles, a, b, c = record
+        if kind == INSTRUCTION:
+            return '%12d  %04x  %-20s %-32s %s' % (
+                    cycles, pc, self.symbol(pc), self.disassemble(pc, word), self.changes(mask, (a, b, c)))
+        if kind == INTERRUPT:
+            return '%12d  %04x  %-20s interrupt 0x%04x %s' % (
+                    cycles, word, self.symbol(word), pc, self.changes(mask, (a, b, c)))
+        count = (a << 32) | (b << 16) | c
+        if kind == SLEEP:
+            return '%12d  %04x  %-20s %s for %d cycles' % (
+                    cycles, pc, self.symbol(pc), simulator.power_mode(word), count)
+        return '%12d  %04x  %-20s polling loop, %d instructions skipped' % (cycles, pc, self.symbol(pc), count)
+
+    def lines(self, records):
+        for record in records:
+            yield self.format(record)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('trace', metavar='TRACE', help='trace file from simulate.py --trace')
+    parser.add_argument('filename', metavar='FILE', help='the program: assembler source (.asm) or memory image')
+    parser.add_argument('-i', '--input-format', choices=memory.load_formats, help='image format, guessed if not given')
+    parser.add_argument('-n', '--count', type=int, help='decode only the last COUNT records')
+    args = parser.parse_args()
+    try:
+        trace = Trace.load(args.trace)
+        symbols = {}
+        if args.filename.lower().endswith('.asm'):
+            with open(args.filename) as f:
+                image = memory.from_object_code(simulator.assemble(f.read()))
+            symbols = dict(assembler.SYMTAB)
+        else:
+            image = memory.load(args.filename, format=args.input_format)
+    except (OSError, ValueError, simulator.SimulatorError) as e:
+        sys.stderr.write('tracing: %s\n' % (e,))
+        sys.exit(1)
+    records = list(trace.records())
+    if args.count is not None:
+        records = records[-args.count:] if args.count else []
+    print('%d records, %d written' % (len(records), trace.count))
+    decoder = TraceDecoder(image, symbols)
+    try:
+        for line in decoder.lines(records):
+            sys.stdout.write(line.rstrip() + '\n')
+    except BrokenPipeError:
+        pass
+
+
+if __name__ == '__main__':
+    main()
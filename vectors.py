@@ -0,0 +1,231 @@
+"""\
+Test vector runner: calls one routine of an assembled program with every
+input vector of a file and checks the registers it returns against the
+expected outputs, spread over a pool of processes.
+
+The image, the vectors and the results are kept in shared memory
+(multiprocessing.shared_memory) that the workers attach to once; tasks only
+pass the range of vectors to run. Each worker runs its ranges in lockstep
+with batch.BatchSimulator.
+
+    python vectors.py [--jobs N] [--chunk N] [--inputs REGS] [--outputs REGS] SOURCE ENTRY VECTORS
+
+ENTRY is a label of SOURCE. VECTORS has one vector per line: the values of
+the --inputs registers, '->' and the expected values of the --outputs
+registers. Numbers are written as in Python, '#' starts a comment:
+
+    3 5 -> 15
+    0x10 -1 -> 0xfff0
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from multiprocessing import shared_memory
+
+import assembler
+import batch
+import memory
+import simulator
+
+numpy = batch.numpy
+
+# vector status
+PASS, FAIL, NO_RETURN = range(3)     # NO_RETURN: halted, idle, illegal instruction or out of steps
+RETURN_ADDRESS = 0
+
+
+def parse_registers(text):
+    """'R12,R13' --> [12, 13]; only R4..R15 carry vectors"""
+    registers = []
+    for name in text.split(','):
+        name = name.strip().upper()
+        if name not in assembler.REGISTERS or not 4 <= assembler.REGISTERS[name] <= 15:
+            raise ValueError('not a general purpose register: %r' % (name,))
+        registers.append(assembler.REGISTERS[name])
+    return registers
+
+
+def parse_vectors(lines, inputs, outputs):
+    """\
+    (array, input count) of the vectors of a file, a row of inputs then
+    expected outputs per vector. The first vector sets the number of
+    inputs, at most inputs.
+    """
+    rows = []
+    width = None
+    for line_no, line in enumerate(lines, 1):
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        try:
+            left, right = line.split('->')
+            values = [int(value, 0) & 0xffff for value in left.split()]
+            expected = [int(value, 0) & 0xffff for value in right.split()]
+            if width is None and len(values) <= inputs:
+                width = len(values)
+            if len(values) != width or len(expected) != outputs:
+                raise ValueError('expected %d inputs and %d outputs' % (width if width is not None else inputs, outputs))
+        except ValueError as e:
+            raise ValueError('line %d: %s: %r' % (line_no, e, line))
+        rows.append(values + expected)
+    width = width or 0
+    return numpy.array(rows, dtype=numpy.uint16).reshape(-1, width + outputs), width
+
+
+def entry_address(name):
+    """address of a label of the last assembled program"""
+    for key in (name, name.upper()):
+        if key in assembler.SYMTAB:
+            return assembler.SYMTAB[key]
+    raise ValueError('unknown entry symbol %r' % (name,))
+
+
+def share(array):
+    """a shared memory block holding a copy of array, and its spec for attach()"""
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    numpy.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+    return block, (block.name, array.shape, array.dtype.str)
+
+
+def attach(spec, block=None):
+    """(shared memory block, array view) of a spec from share(); the view must go before the block is closed"""
+    name, shape, dtype = spec
+    if block is None:
+        block = shared_memory.SharedMemory(name=name)
+    return block, numpy.ndarray(shape, dtype, buffer=block.buf)
+
+
+# state of a worker process, set up once by init_worker()
+_worker = {}
+
+
+def init_worker(specs, entry, inputs, outputs, stack, max_steps):
+    blocks = {}
+    arrays = {}
+    for key, spec in specs.items():
+        blocks[key], arrays[key] = attach(spec)
+    _worker.clear()
+    _worker.update(arrays)
+    _worker.update(
+        blocks=blocks, entry=entry, inputs=inputs, outputs=outputs, stack=stack, max_steps=max_steps,
+        image=memory.Memory([memory.Segment(0, arrays['image'].tobytes())]),
+        simulators={},                  # by instance count, the decoded code is kept between ranges
+    )
+
+
+def run_range(bounds):
+    """run the vectors start:stop, store their results; returns (vectors, passed)"""
+    start, stop = bounds
+    count = stop - start
+    vectors = _worker['vectors'][start:stop]
+    inputs, outputs = _worker['inputs'], _worker['outputs']
+    sim = _worker['simulators'].get(count)
+    if sim is None:
+        sim = _worker['simulators'][count] = batch.BatchSimulator(_worker['image'], count)
+    else:
+        sim.reset()
+    for column, reg in enumerate(inputs):
+        sim.regs[reg] = vectors[:, column]
+    sim.call(_worker['entry'], stack=_worker['stack'], max_steps=_worker['max_steps'], return_address=RETURN_ADDRESS)
+    got = sim.regs[outputs].T
+    returned = sim.reasons == batch.STOP_BREAKPOINT
+    passed = returned & (got == vectors[:, len(inputs):]).all(axis=1)
+    _worker['status'][start:stop] = numpy.where(passed, PASS, numpy.where(returned, FAIL, NO_RETURN))
+    _worker['cycles'][start:stop] = sim.cycles
+    _worker['got'][start:stop] = got
+    return count, int(passed.sum())
+
+
+def run_vectors(object_code, entry, vectors, inputs, outputs, jobs=None, chunk=4096, stack=0x0400, max_steps=100000):
+    """\
+    run the routine at entry for every row of vectors (inputs then expected
+    outputs) on jobs processes. returns the status, cycles and output
+    register arrays, one row per vector.
+    """
+    if numpy is None:
+        raise RuntimeError('the vector runner needs numpy')
+    count = len(vectors)
+    arrays = {
+        'image': numpy.frombuffer(simulator.Simulator(object_code).memory, dtype=numpy.uint8),
+        'vectors': vectors,
+        'status': numpy.zeros(count, dtype=numpy.int8),
+        'cycles': numpy.zeros(count, dtype=numpy.int64),
+        'got': numpy.zeros((count, len(outputs)), dtype=numpy.uint16),
+    }
+    blocks, specs = {}, {}
+    try:
+        for key, array in arrays.items():
+            blocks[key], specs[key] = share(array)
+        settings = (specs, entry, inputs, outputs, stack, max_steps)
+        ranges = [(start, min(start + chunk, count)) for start in range(0, count, chunk)]
+        if jobs == 1:
+            init_worker(*settings)
+            try:
+                for bounds in ranges:
+                    run_range(bounds)
+            finally:
+                worker_blocks = _worker['blocks']
+                _worker.clear()
+                for block in worker_blocks.values():
+                    block.close()
+        else:
+            with multiprocessing.Pool(jobs, init_worker, settings) as pool:
+                for _ in pool.imap_unordered(run_range, ranges):
+                    pass
+        return tuple(attach(specs[key], blocks[key])[1].copy() for key in ('status', 'cycles', 'got'))
+    finally:
+        for block in blocks.values():
+            block.close()
+            block.unlink()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('source', metavar='SOURCE', help='assembler source')
+    parser.add_argument('entry', metavar='ENTRY', help='label of the routine to call')
+    parser.add_argument('vectors', metavar='VECTORS', help='vector file')
+    parser.add_argument('--inputs', default='R12,R13,R14,R15', help='registers of the input values (default R12,R13,R14,R15)')
+    parser.add_argument('--outputs', default='R12', help='registers of the expected values (default R12)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='worker processes (default: one per CPU)')
+    parser.add_argument('--chunk', type=int, default=4096, help='vectors per task (default 4096)')
+    parser.add_argument('--stack', type=lambda text: int(text, 0), default=0x0400, help='initial stack pointer (default 0x0400)')
+    parser.add_argument('--max-steps', type=int, default=100000, help='instruction limit per vector (default 100000)')
+    parser.add_argument('--show', type=int, default=10, help='failing vectors to list (default 10)')
+    args = parser.parse_args()
+    try:
+        if numpy is None:
+            raise RuntimeError('the vector runner needs numpy')
+        inputs, outputs = parse_registers(args.inputs), parse_registers(args.outputs)
+        with open(args.source) as f:
+            object_code = simulator.assemble(f.read())
+        entry = entry_address(args.entry)
+        with open(args.vectors) as f:
+            vectors, width = parse_vectors(f, len(inputs), len(outputs))
+        inputs = inputs[:width]                 # the first registers of --inputs
+        start = time.perf_counter()
+        status, cycles, got = run_vectors(object_code, entry, vectors, inputs, outputs, args.jobs, args.chunk,
+                                          args.stack, args.max_steps)
+        elapsed = time.perf_counter() - start
+    except (OSError, ValueError, RuntimeError, simulator.SimulatorError) as e:
+        sys.stderr.write('vectors: %s\n' % (e,))
+        sys.exit(2)
+    counts = numpy.bincount(status, minlength=3)
+    print('%d vectors: %d passed, %d failed, %d did not return  (%.2f s, %.0f vectors/s)' % (
+            len(status), counts[PASS], counts[FAIL], counts[NO_RETURN], elapsed, len(status) / elapsed if elapsed else 0))
+    if len(status):
+        print('cycles: min %d, mean %.1f, max %d' % (cycles.min(), cycles.mean(), cycles.max()))
+    for index in numpy.flatnonzero(status != PASS)[:args.show]:
+        vector = vectors[index]
+        print('vector %d: %s -> %s, got %s%s' % (
+                index, ' '.join('0x%04x' % v for v in vector[:len(inputs)]),
+                ' '.join('0x%04x' % v for v in vector[len(inputs):]),
+                ' '.join('0x%04x' % v for v in got[index]),
+                '' if status[index] == FAIL else ' (did not return)'))
+    sys.exit(1 if counts[FAIL] or counts[NO_RETURN] else 0)
+
+
+if __name__ == '__main__':
+    main()